@@ -6,7 +6,8 @@ from .models import Usuario, Libro, Prestamo, Multa
 
 @admin.register(Usuario)
 class UsuarioAdmin(admin.ModelAdmin):
-    list_display = ['rut', 'nombre', 'tipo_usuario', 'bloqueado']
+    list_display = ['rut', 'nombre', 'tipo_usuario', 'bloqueado', 'prestamos_activos', 'multas_pendientes']
+    readonly_fields = ['prestamos_activos', 'multas_pendientes', 'monto_pendiente']
     list_filter = ['tipo_usuario', 'bloqueado']
     search_fields = ['rut', 'nombre']
 
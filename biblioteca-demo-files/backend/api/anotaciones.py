@@ -0,0 +1,75 @@
+"""
+Propiedades calculadas de los modelos como expresiones SQL
+Prestamo.dias_retraso y Usuario.dias_prestamo se calculan en Python fila a
+fila; estas anotaciones dan el mismo valor en la base de datos, así se
+puede filtrar y ordenar por ellos (GET /api/prestamos/?ordering=-dias_retraso).
+benchmark_anotaciones verifica que coincidan con las propiedades.
+"""
+from django.db.models import Case, DateField, F, Func, IntegerField, Q, Value, When
+from django.utils import timezone
+
+# Nombres de las anotaciones: no pueden ser los de las propiedades (el ORM
+# asigna cada anotación como atributo de la instancia)
+RETRASO = 'retraso'
+PLAZO = 'plazo'
+
+
+class DiasEntre(Func):
+    """Días enteros de `inicio` a `fin` (dos fechas), según el motor"""
+    arity = 2
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Las fechas se guardan como texto AAAA-MM-DD
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ', **extra_context
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL y Oracle: date - date ya es un número de días
+        extra_context.setdefault('template', '(%(expressions)s)')
+        extra_context.setdefault('arg_joiner', ' - ')
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def hoy():
+    """El mismo "hoy" que usan la propiedad y api.serializacion"""
+    return timezone.now().date()
+
+
+def dias_retraso(fecha=None):
+    """Prestamo.calcular_dias_retraso como CASE"""
+    fecha = Value(fecha or hoy(), output_field=DateField())
+    return Case(
+        When(
+            Q(estado='DEVUELTO', fecha_devolucion_real__gt=F('fecha_devolucion_esperada')),
+            then=DiasEntre(F('fecha_devolucion_real'), F('fecha_devolucion_esperada')),
+        ),
+        When(
+            Q(estado__in=('ACTIVO', 'VENCIDO'), fecha_devolucion_esperada__lt=fecha),
+            then=DiasEntre(fecha, F('fecha_devolucion_esperada')),
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def dias_prestamo():
+    """Usuario.dias_prestamo_de como CASE"""
+    return Case(
+        When(tipo_usuario='DOCENTE', then=Value(14)),
+        default=Value(7),
+        output_field=IntegerField(),
+    )
+
+
+def vencidos(fecha=None):
+    """Préstamos sin devolver cuya fecha esperada ya pasó (dias_retraso > 0)"""
+    return Q(estado__in=('ACTIVO', 'VENCIDO'), fecha_devolucion_esperada__lt=fecha or hoy())
@@ -0,0 +1,113 @@
+"""
+Archivo de préstamos devueltos y multas pagadas
+archivar_historial mueve a PrestamoArchivado / MultaArchivada los préstamos
+DEVUELTO antes del corte, con su multa si ya está pagada, en lotes por id:
+Prestamo y Multa quedan con la circulación vigente y la historia reciente.
+historial() lee las dos tablas para GET /api/usuarios/{id}/historial/.
+"""
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Prestamo, Multa, PrestamoArchivado, MultaArchivada
+from .serializacion import obtener_serializador_rapido
+from .serializers import PrestamoSerializer, PrestamoArchivadoSerializer
+from .signals import notificar_cambios
+
+# Columnas copiadas tal cual (mismos nombres en la tabla vigente y en la de archivo)
+CAMPOS_PRESTAMO = [f.attname for f in PrestamoArchivado._meta.concrete_fields if f.name != 'fecha_archivado']
+CAMPOS_MULTA = [f.attname for f in MultaArchivada._meta.concrete_fields]
+
+
+def configuracion():
+    return getattr(settings, 'API_ARCHIVO', {}).get('DIAS', 365)
+
+
+def fecha_corte(dias):
+    """Se archiva lo devuelto (y pagado) antes de esta fecha"""
+    return timezone.localdate() - timedelta(days=dias)
+
+
+def archivables(corte):
+    """Préstamos devueltos antes del corte sin multa, o con la multa pagada antes del corte"""
+    return Prestamo.objects.filter(estado='DEVUELTO', fecha_devolucion_real__lt=corte).filter(
+        Q(multa__isnull=True)
+        | Q(multa__pagada=True) & (Q(multa__fecha_pago__isnull=True) | Q(multa__fecha_pago__date__lt=corte))
+    )
+
+
+def archivar(ids, corte):
+    """
+    Mueve los préstamos archivables de `ids` y sus multas a las tablas de
+    archivo (dos INSERT y dos DELETE). Se llama dentro de una transacción;
+    retorna (préstamos, multas) movidos.
+    """
+    # Primera sentencia de la transacción, una escritura (SQLite); además
+    # cambia el ETag de los listados de préstamos y multas
+    notificar_cambios(Prestamo, Multa)
+    prestamos = list(archivables(corte).filter(pk__in=ids).values(*CAMPOS_PRESTAMO))
+    if not prestamos:
+        return 0, 0
+    pks = [prestamo['id'] for prestamo in prestamos]
+    multas = list(Multa.objects.filter(prestamo_id__in=pks).values(*CAMPOS_MULTA))
+
+    ahora = timezone.now()
+    PrestamoArchivado.objects.bulk_create(
+        [PrestamoArchivado(fecha_archivado=ahora, **prestamo) for prestamo in prestamos]
+    )
+    MultaArchivada.objects.bulk_create([MultaArchivada(**multa) for multa in multas])
+    # DELETE directo: .delete() del ORM emite señales fila por fila
+    Multa.objects.filter(pk__in=[multa['id'] for multa in multas])._raw_delete(Multa.objects.db)
+    Prestamo.objects.filter(pk__in=pks)._raw_delete(Prestamo.objects.db)
+    return len(prestamos), len(multas)
+
+
+def codificar_cursor(posicion):
+    fecha, pk = posicion
+    return base64.urlsafe_b64encode(f'{fecha.isoformat()}|{pk}'.encode()).decode()
+
+
+def leer_cursor(texto):
+    """(fecha_prestamo, id) o None si el cursor no es válido"""
+    try:
+        fecha, pk = base64.urlsafe_b64decode(texto.encode()).decode().split('|')
+        fecha, pk = parse_datetime(fecha), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    return (fecha, pk) if fecha is not None else None
+
+
+def historial(usuario_id, posicion=None, limite=50):
+    """
+    (filas, siguiente): préstamos del usuario, vigentes y archivados, del más
+    reciente al más antiguo, con el JSON de PrestamoSerializer más "archivado".
+    `posicion` es la (fecha_prestamo, id) de la última fila de la página
+    anterior; `siguiente` es None en la última página.
+
+    Se lee primero la tabla vigente: un préstamo que se archiva entre las dos
+    lecturas aparece dos veces (queda una) en vez de ninguna.
+    """
+    fuentes = (
+        (Prestamo, PrestamoSerializer, False),
+        (PrestamoArchivado, PrestamoArchivadoSerializer, True),
+    )
+    candidatos = {}
+    for modelo, serializer_class, archivado in fuentes:
+        rapido = obtener_serializador_rapido(serializer_class)
+        queryset = modelo.objects.filter(usuario_id=usuario_id)
+        if posicion is not None:
+            fecha, pk = posicion
+            queryset = queryset.filter(fecha_prestamo__lte=fecha).exclude(fecha_prestamo=fecha, id__gte=pk)
+        valores = list(queryset.order_by('-fecha_prestamo', '-id').values(*rapido.columnas)[:limite + 1])
+        for fila, datos in zip(valores, rapido.serializar(valores)):
+            datos['archivado'] = archivado
+            candidatos[fila['id']] = ((fila['fecha_prestamo'], fila['id']), datos)
+
+    ordenados = sorted(candidatos.values(), key=lambda candidato: candidato[0], reverse=True)
+    pagina = ordenados[:limite]
+    siguiente = pagina[-1][0] if len(ordenados) > limite else None
+    return [datos for _, datos in pagina], siguiente
@@ -0,0 +1,106 @@
+"""
+Vistas async de solo lectura - Listado y detalle de libros y préstamos
+Con ASGI (biblioteca_api/asgi.py) la espera a la base de datos no ocupa un
+worker: un solo proceso atiende muchas consultas del catálogo a la vez.
+Devuelven el mismo JSON, paginación por cursor y ETag que /api/libros/ y /api/prestamos/.
+"""
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+
+from . import anotaciones
+from .conditional import agregar_headers_condicionales, firma_versiones, tablas_expandidas
+from .models import VersionTabla
+from .pagination import CursorPaginacion
+from .proyeccion import leer_proyeccion
+from .renderers import JSONRapidoRenderer
+from .serializacion import obtener_serializador_rapido
+from .serializers import LibroSerializer, PrestamoSerializer
+from .views import LibroViewSet, PrestamoViewSet
+
+
+class LecturaAsyncView(View):
+    """
+    GET {prefijo}/ - Listar (paginado por cursor)
+    GET {prefijo}/{pk}/ - Obtener uno
+    """
+    queryset = None
+    serializer_class = None
+    cursor_ordering = None
+    tablas_version = ()
+    depende_de_hoy = False
+    renderer = JSONRapidoRenderer()
+
+    async def get(self, request, pk=None):
+        try:
+            proyeccion = leer_proyeccion(request.GET, self.serializer_class)
+        except ValidationError as e:
+            return self.responder(e.detail, status=400)
+        tablas = tablas_expandidas(self.tablas_version, self.serializer_class, proyeccion[1])
+        versiones = [
+            fila async for fila in VersionTabla.objects.filter(tabla__in=tablas)
+            .order_by('tabla').values_list('tabla', 'version', 'modificado')
+        ]
+        etag, timestamp = firma_versiones(
+            versiones, request.get_full_path(), self.renderer.media_type,
+            anotaciones.hoy() if self.depende_de_hoy else None
+        )
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            if pk is None:
+                response = await self.listar(request, proyeccion)
+            else:
+                response = await self.obtener(request, pk, proyeccion)
+        return agregar_headers_condicionales(response, etag, timestamp)
+
+    async def listar(self, request, proyeccion):
+        # Request de DRF solo por query_params (cursor y page_size)
+        paginador = CursorPaginacion()
+        drf_request = Request(request)
+        # Filas de .values() serializadas como en ListaRapidaMixin
+        rapido = obtener_serializador_rapido(self.serializer_class, *proyeccion)
+        extra = [campo.lstrip('-') for campo in self.cursor_ordering if campo.lstrip('-') not in rapido.columnas]
+        filas = self.queryset.values(*rapido.columnas, *extra)
+        try:
+            pagina = await paginador.apaginate_queryset(filas, drf_request, self)
+        except NotFound as e:
+            return self.responder({'detail': e.detail}, status=404)
+        datos = rapido.serializar(pagina)
+        return self.responder(paginador.respuesta_paginada(datos))
+
+    async def obtener(self, request, pk, proyeccion):
+        # Como el listado: solo las columnas de los campos proyectados
+        rapido = obtener_serializador_rapido(self.serializer_class, *proyeccion)
+        filas = [fila async for fila in self.queryset.filter(pk=pk).values(*rapido.columnas)[:1]]
+        if not filas:
+            return self.responder({'detail': NotFound.default_detail}, status=404)
+        return self.responder(rapido.serializar(filas)[0])
+
+    def responder(self, datos, status=200):
+        return HttpResponse(self.renderer.render(datos), status=status, content_type=self.renderer.media_type)
+
+
+class LibroLecturaAsyncView(LecturaAsyncView):
+    queryset = LibroViewSet.queryset
+    serializer_class = LibroSerializer
+    cursor_ordering = LibroViewSet.cursor_ordering
+    tablas_version = LibroViewSet.tablas_version
+
+
+class PrestamoLecturaAsyncView(LecturaAsyncView):
+    queryset = PrestamoViewSet.queryset
+    serializer_class = PrestamoSerializer
+    cursor_ordering = PrestamoViewSet.cursor_ordering
+    tablas_version = PrestamoViewSet.tablas_version
+    depende_de_hoy = PrestamoViewSet.depende_de_hoy
+
+
+def stream_cambios(request):
+    """
+    /api/async/stream/ lo atiende api.difusion.StreamASGI antes de llegar a
+    Django (ver biblioteca_api/asgi.py); esta vista solo responde con WSGI.
+    """
+    datos = {'error': 'El stream requiere el servidor ASGI (biblioteca_api.asgi)'}
+    return HttpResponse(JSONRapidoRenderer().render(datos), status=501, content_type='application/json')
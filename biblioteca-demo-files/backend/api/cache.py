@@ -0,0 +1,190 @@
+"""
+Caché de lectura para la API - Catálogo y usuarios
+Por defecto un LRU en memoria con TTL; configurable para usar cualquier
+backend de django.core.cache (por ejemplo Redis) vía API_CACHE.
+
+El LRU es por proceso: con varios workers cada uno guarda su copia y
+invalidar() solo llega al proceso que escribió, así que los demás pueden
+servir datos viejos hasta el TTL. Con BACKEND 'django' las entradas y las
+generaciones viven en el backend compartido y la invalidación llega a todos
+(siempre que CACHES[ALIAS] no sea LocMemCache, que también es por proceso).
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+CONFIGURACION_POR_DEFECTO = {
+    'BACKEND': 'lru',       # 'lru' (memoria del proceso) o 'django' (CACHES[ALIAS], compartido)
+    'ALIAS': 'default',
+    'TTL': 60,              # segundos
+    'MAX_ENTRADAS': 2048,   # solo LRU
+}
+
+
+class CacheLRU:
+    """LRU con expiración por entrada, seguro entre hilos"""
+
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.datos = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, clave):
+        with self.lock:
+            entrada = self.datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self.datos[clave]
+                return None
+            self.datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, timeout=None):
+        with self.lock:
+            self.datos[clave] = (valor, time.monotonic() + (timeout or self.ttl))
+            self.datos.move_to_end(clave)
+            while len(self.datos) > self.max_entradas:
+                self.datos.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.datos.clear()
+
+
+class CacheAPI:
+    """
+    Entradas agrupadas por espacio ('libros', 'usuarios'). Invalidar un espacio
+    cambia su generación, que forma parte de la clave: las entradas anteriores
+    quedan inalcanzables y expiran solas, sin recorrer el caché.
+    """
+
+    def __init__(self, backend, ttl, generaciones):
+        self.backend = backend
+        self.ttl = ttl
+        # Las generaciones no pueden perderse por desalojo del LRU
+        self.generaciones = generaciones
+        self.aciertos = Counter()
+        self.fallos = Counter()
+
+    def generacion(self, espacio):
+        clave = f'api:gen:{espacio}'
+        valor = self.generaciones.get(clave)
+        if valor is None:
+            # Marca de tiempo: si se pierde, nunca se reutiliza una generación anterior
+            valor = time.time_ns()
+            self.generaciones.set(clave, valor, None)
+        return valor
+
+    def clave(self, espacio, partes):
+        resumen = hashlib.md5(repr(partes).encode()).hexdigest()
+        return f'api:{espacio}:{self.generacion(espacio)}:{resumen}'
+
+    def obtener(self, clave, espacio):
+        valor = self.backend.get(clave)
+        if valor is None:
+            self.fallos[espacio] += 1
+        else:
+            self.aciertos[espacio] += 1
+        return valor
+
+    def guardar(self, clave, valor):
+        self.backend.set(clave, valor, self.ttl)
+
+    def invalidar(self, *espacios):
+        for espacio in espacios:
+            self.generaciones.set(f'api:gen:{espacio}', time.time_ns(), None)
+
+    def estadisticas(self):
+        return {
+            espacio: {'aciertos': self.aciertos[espacio], 'fallos': self.fallos[espacio]}
+            for espacio in sorted(set(self.aciertos) | set(self.fallos))
+        }
+
+
+class CacheDjango:
+    """Adaptador a django.core.cache (Redis, Memcached, etc.)"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def get(self, clave):
+        return caches[self.alias].get(clave)
+
+    def set(self, clave, valor, timeout=None):
+        caches[self.alias].set(clave, valor, timeout)
+
+
+class _Generaciones:
+    """Diccionario simple para las generaciones del backend LRU"""
+
+    def __init__(self):
+        self.datos = {}
+
+    def get(self, clave):
+        return self.datos.get(clave)
+
+    def set(self, clave, valor, timeout=None):
+        self.datos[clave] = valor
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                config = {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'API_CACHE', {})}
+                if config['BACKEND'] == 'django':
+                    backend = CacheDjango(config['ALIAS'])
+                    _cache = CacheAPI(backend, config['TTL'], generaciones=backend)
+                else:
+                    backend = CacheLRU(config['MAX_ENTRADAS'], config['TTL'])
+                    _cache = CacheAPI(backend, config['TTL'], generaciones=_Generaciones())
+    return _cache
+
+
+class CacheLecturaMixin:
+    """
+    Cachea la respuesta de list/retrieve de un ViewSet según la ruta y
+    los parámetros. Agrega el header X-Cache: HIT / MISS.
+    """
+    cache_espacio = None
+    cache_acciones = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(super().retrieve, request, *args, **kwargs)
+
+    def respuesta_cacheada(self, vista, request, *args, **kwargs):
+        if self.action not in self.cache_acciones or 'stream' in request.query_params:
+            return vista(request, *args, **kwargs)
+
+        cache = get_cache()
+        parametros = sorted(request.query_params.lists())
+        clave = cache.clave(self.cache_espacio, (request.get_host(), request.path, parametros))
+        datos = cache.obtener(clave, self.cache_espacio)
+        if datos is not None:
+            response = Response(datos)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = vista(request, *args, **kwargs)
+        if response.status_code == 200:
+            # Copia sin la referencia al serializador (ReturnDict/ReturnList)
+            datos = list(response.data) if isinstance(response.data, list) else dict(response.data)
+            cache.guardar(clave, datos)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,266 @@
+"""
+Importación y exportación masiva del catálogo (libros y usuarios)
+Los archivos CSV o NDJSON se leen fila a fila y se procesan por lotes:
+cada lote se valida en memoria y se escribe con un solo upsert
+(bulk_create con update_conflicts) por isbn o rut. La memoria usada no
+depende del tamaño del archivo sino del tamaño del lote.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import transaction
+from django.db.models import F
+
+from . import estadisticas, services, eventos as registro_eventos
+from .models import Usuario, Libro
+from .signals import CATALOGO, notificar_cambios
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Filas por lote al importar y exportar
+LOTE = 2000
+
+# Máximo de errores detallados en el resultado (el conteo es siempre exacto)
+MAX_ERRORES_DETALLE = 1000
+
+
+@dataclass(frozen=True)
+class Especificacion:
+    modelo: type
+    clave: str
+    # Columnas del archivo; las demás se ignoran
+    campos: tuple
+    # Columnas que se pueden omitir (toman el default del modelo)
+    opcionales: tuple = ()
+    # Validadores adicionales por columna
+    validadores: dict = field(default_factory=dict)
+
+
+ESPECIFICACIONES = {
+    'libros': Especificacion(
+        modelo=Libro, clave='isbn',
+        campos=('isbn', 'titulo', 'autor', 'editorial', 'anio_publicacion', 'categoria', 'stock_total'),
+        opcionales=('categoria', 'stock_total'),
+        validadores={'stock_total': (MinValueValidator(1),), 'anio_publicacion': (MinValueValidator(0),)},
+    ),
+    # bloqueado y los contadores los mantiene api.services
+    'usuarios': Especificacion(
+        modelo=Usuario, clave='rut',
+        campos=('rut', 'nombre', 'email', 'telefono', 'tipo_usuario'),
+        opcionales=('telefono', 'tipo_usuario'),
+    ),
+}
+
+
+@dataclass
+class ResultadoImportacion:
+    procesadas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    errores: int = 0
+    detalle_errores: list = field(default_factory=list)
+    max_detalle: int = MAX_ERRORES_DETALLE
+    # Opcional: recibe cada error (por ejemplo, para escribirlo a un archivo)
+    al_error: object = None
+
+    def error(self, linea, mensajes):
+        self.errores += 1
+        error = {'linea': linea, 'errores': mensajes}
+        if len(self.detalle_errores) < self.max_detalle:
+            self.detalle_errores.append(error)
+        if self.al_error is not None:
+            self.al_error(error)
+
+    def como_dict(self):
+        return {
+            'procesadas': self.procesadas,
+            'creadas': self.creadas,
+            'actualizadas': self.actualizadas,
+            'errores': self.errores,
+            'detalle_errores': self.detalle_errores,
+        }
+
+
+def detectar_formato(nombre):
+    """Formato según la extensión del archivo (None si no se reconoce)"""
+    extension = nombre.rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'json'):
+        return 'ndjson'
+    return extension if extension in FORMATOS else None
+
+
+def leer_filas(archivo, formato):
+    """
+    Genera (número de línea, dict) desde un archivo de texto abierto.
+    Las líneas NDJSON que no son un objeto JSON se generan con dict None.
+    """
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for linea, texto in enumerate(archivo, start=1):
+        if not texto.strip():
+            continue
+        try:
+            fila = json.loads(texto)
+        except ValueError:
+            fila = None
+        yield linea, fila if isinstance(fila, dict) else None
+
+
+def validar_fila(spec, fila):
+    """Dict con los valores limpios (field.clean) o ValidationError por columna"""
+    datos = {}
+    errores = {}
+    for nombre in spec.campos:
+        campo = spec.modelo._meta.get_field(nombre)
+        valor = fila.get(nombre)
+        if isinstance(valor, str):
+            valor = valor.strip()
+        if valor in (None, ''):
+            if nombre in spec.opcionales:
+                continue
+            if not campo.blank:
+                errores[nombre] = ['Este campo es requerido.']
+                continue
+            valor = ''
+        try:
+            datos[nombre] = campo.clean(valor, None)
+            for validador in spec.validadores.get(nombre, ()):
+                validador(datos[nombre])
+        except ValidationError as e:
+            errores[nombre] = e.messages
+    if errores:
+        raise ValidationError(errores)
+    return datos
+
+
+def importar(archivo, formato, entidad, lote=LOTE, resultado=None):
+    """
+    Importa un archivo de texto abierto. Cada lote corre en su propia
+    transacción: un error de una fila no revierte los lotes anteriores.
+    """
+    spec = ESPECIFICACIONES[entidad]
+    resultado = resultado or ResultadoImportacion()
+    filas = leer_filas(archivo, formato)
+    while True:
+        bloque = list(islice(filas, lote))
+        if not bloque:
+            break
+        validas = {}
+        for linea, fila in bloque:
+            resultado.procesadas += 1
+            if fila is None:
+                resultado.error(linea, {'fila': ['JSON inválido: se esperaba un objeto']})
+                continue
+            try:
+                datos = validar_fila(spec, fila)
+            except ValidationError as e:
+                resultado.error(linea, e.message_dict)
+                continue
+            # Una clave repetida en el lote: gana la última fila
+            validas[datos[spec.clave]] = (linea, datos)
+        if validas:
+            escribir_lote(spec, validas, resultado)
+    return resultado
+
+
+def escribir_lote(spec, validas, resultado):
+    modelo = spec.modelo
+    with transaction.atomic():
+        existentes = modelo.objects.in_bulk(list(validas), field_name=spec.clave)
+        objetos = []
+        ajustes_stock = []
+        for clave, (linea, datos) in validas.items():
+            actual = existentes.get(clave)
+            if actual is not None:
+                # Las columnas opcionales omitidas conservan su valor
+                for nombre in spec.opcionales:
+                    datos.setdefault(nombre, getattr(actual, nombre))
+            if modelo is Libro:
+                stock_total = datos.pop('stock_total', None)
+                if actual is None:
+                    datos['stock_total'] = datos['stock_disponible'] = 1 if stock_total is None else stock_total
+                elif stock_total is not None and stock_total != actual.stock_total:
+                    ajustes_stock.append((linea, actual, stock_total))
+            objetos.append(modelo(**datos))
+
+        # stock_total y stock_disponible no se pisan en el upsert
+        actualizar = [
+            nombre for nombre in spec.campos
+            if nombre != spec.clave and nombre not in ('stock_total', 'stock_disponible')
+        ]
+        modelo.objects.bulk_create(
+            objetos, update_conflicts=True, unique_fields=[spec.clave], update_fields=actualizar,
+        )
+        cambian_stock = [clave for clave in validas if clave not in existentes] if modelo is Libro else []
+        agregados = {}
+        for linea, libro, stock_total in ajustes_stock:
+            if ajustar_stock(libro, stock_total):
+                cambian_stock.append(libro.pk)
+                if stock_total > libro.stock_total:
+                    agregados[libro.pk] = stock_total - libro.stock_total
+            else:
+                resultado.error(linea, {'stock_total': [
+                    'Menor que los ejemplares prestados o apartados; el resto de la fila se importó.'
+                ]})
+        if agregados:
+            # Ejemplares nuevos, igual que los devueltos: primero la cola de reservas
+            services.devolver_ejemplares(agregados)
+        # Libros nuevos y stock_total cambiado: los suscriptores de ?libros= reciben el stock
+        registro_eventos.registrar(registro_eventos.stock_actualizado(cambian_stock))
+
+        creadas = len(validas) - len(existentes)
+        resultado.creadas += creadas
+        resultado.actualizadas += len(existentes)
+        estadisticas.registrar({('catalogo', CATALOGO[modelo]): creadas})
+        notificar_cambios(modelo)
+
+
+def ajustar_stock(libro, stock_total):
+    """
+    Cambia stock_total conservando los ejemplares prestados. Al bajar:
+    UPDATE api_libro SET stock_total = %s, stock_disponible = stock_disponible + delta
+    WHERE isbn = %s AND stock_total = <leído> AND stock_disponible + delta >= 0
+    Al subir solo cambia stock_total: el llamador reparte los ejemplares nuevos
+    con services.devolver_ejemplares (cola de reservas y luego stock).
+    """
+    delta = stock_total - libro.stock_total
+    cambios = {'stock_total': stock_total}
+    if delta < 0:
+        cambios['stock_disponible'] = F('stock_disponible') + delta
+    return Libro.objects.filter(
+        pk=libro.pk, stock_total=libro.stock_total, stock_disponible__gte=max(-delta, 0),
+    ).update(**cambios)
+
+
+def exportar(entidad, formato, lote=LOTE):
+    """Genera el archivo por trozos de texto, recorriendo la tabla con un cursor"""
+    spec = ESPECIFICACIONES[entidad]
+    columnas = spec.campos + (('stock_disponible',) if spec.modelo is Libro else ())
+    filas = spec.modelo.objects.order_by(spec.clave).values_list(*columnas).iterator(chunk_size=lote)
+
+    if formato == 'ndjson':
+        for valores in filas:
+            yield json.dumps(dict(zip(columnas, valores)), ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for n, valores in enumerate(filas, start=1):
+        escritor.writerow(valores)
+        if n % lote == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,105 @@
+"""
+Requests condicionales (ETag / Last-Modified) para la API
+El ETag se calcula con los contadores de VersionTabla de las tablas que
+usa cada endpoint: un 304 se responde con una sola consulta, sin
+ejecutar el listado ni el serializador.
+
+La versión se incrementa dentro de la transacción de la escritura, para
+que el ETag nunca quede atrás de los datos confirmados. El costo: todas las
+escrituras de una tabla actualizan la misma fila y, en una base con locks
+por fila (PostgreSQL), esperan unas a otras hasta el commit aunque toquen
+filas distintas. En SQLite las escrituras ya son de a una y no cambia nada.
+"""
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import anotaciones
+from .models import VersionTabla
+
+
+def firma_versiones(versiones, ruta, media_type, fecha=None):
+    """
+    ETag y timestamp de Last-Modified a partir de las filas (tabla, version, modificado).
+    `fecha`: día del que dependen los datos (dias_retraso, ?vencidos=); al
+    cambiar de día cambia el ETag y Last-Modified no es anterior a ese día.
+    """
+    firma = repr(([(tabla, version) for tabla, version, _ in versiones], ruta, media_type, fecha))
+    etag = '"%s"' % hashlib.md5(firma.encode()).hexdigest()
+    modificaciones = [modificado for _, _, modificado in versiones]
+    if fecha is not None:
+        modificaciones.append(datetime.combine(fecha, time.min, tzinfo=dt_timezone.utc))
+    ultima_modificacion = max(modificaciones, default=None)
+    timestamp = int(ultima_modificacion.timestamp()) if ultima_modificacion else None
+    return etag, timestamp
+
+
+def tablas_expandidas(tablas, serializer_class, expandir):
+    """
+    `tablas` más las de las relaciones pedidas con ?expand=: el objeto
+    anidado cambia con su propia tabla (la fila de VersionTabla es el model_name)
+    """
+    expandibles = getattr(serializer_class.Meta, 'expandibles', {})
+    extra = [expandibles[nombre].Meta.model._meta.model_name for nombre in expandir]
+    return tuple(dict.fromkeys([*tablas, *extra]))
+
+
+def agregar_headers_condicionales(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # El navegador guarda la respuesta pero la revalida en cada request
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def incrementar_version(tabla):
+    VersionTabla.objects.filter(tabla=tabla).update(
+        version=F('version') + 1, modificado=timezone.now()
+    )
+
+
+class ConditionalGetMixin:
+    """
+    GET con If-None-Match / If-Modified-Since para list y retrieve.
+    Cada ViewSet declara en `tablas_version` las tablas de las que depende
+    su respuesta (por ejemplo, un préstamo muestra datos de usuario y libro);
+    con ?expand= se suman las de las relaciones expandidas.
+    """
+    tablas_version = ()
+    # True si la respuesta depende de la fecha de hoy (anotaciones de api.anotaciones)
+    depende_de_hoy = False
+
+    def get_tablas_version(self):
+        if not hasattr(self, 'proyeccion'):
+            return self.tablas_version
+        return tablas_expandidas(self.tablas_version, self.get_serializer_class(), self.proyeccion()[1])
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_condicional(super().retrieve, request, *args, **kwargs)
+
+    def respuesta_condicional(self, vista, request, *args, **kwargs):
+        if 'stream' in request.query_params:
+            return vista(request, *args, **kwargs)
+
+        versiones = list(
+            VersionTabla.objects.filter(tabla__in=self.get_tablas_version())
+            .order_by('tabla').values_list('tabla', 'version', 'modificado')
+        )
+        etag, timestamp = firma_versiones(
+            versiones, request.get_full_path(), request.accepted_media_type,
+            anotaciones.hoy() if self.depende_de_hoy else None
+        )
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = vista(request, *args, **kwargs)
+        return agregar_headers_condicionales(response, etag, timestamp)
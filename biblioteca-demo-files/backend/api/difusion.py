@@ -0,0 +1,382 @@
+"""
+Difusión de cambios a clientes Server-Sent Events (GET /api/async/stream/)
+Un lector por proceso sigue el registro de eventos (api.eventos) y reparte
+cada cambio a las colas asyncio de los clientes suscritos: una conexión en
+espera es una cola en memoria, no un hilo. Como lee el registro y no una
+señal en memoria, también reparte los cambios hechos por otros procesos
+(workers WSGI, comandos) y un cliente que se reconecta con Last-Event-ID
+recibe lo que se perdió.
+
+El endpoint es una aplicación ASGI (StreamASGI) montada delante de Django en
+biblioteca_api/asgi.py: el handler de Django asigna un hilo a cada request
+mientras dure, y además no avisa cuando el cliente se desconecta.
+
+Mensajes (campo event de SSE):
+    libro     {"isbn", "stock_disponible", "disponible"} tras un préstamo, una
+              devolución, una reserva liberada o una importación del catálogo
+    prestamo  evento PRESTAMO_* del usuario, con el estado resultante del préstamo
+    multa     evento MULTA_* del usuario
+    usuario   USUARIO_BLOQUEADO / USUARIO_DESBLOQUEADO
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import eventos
+from .models import Libro
+
+logger = logging.getLogger('api.difusion')
+
+CONFIGURACION_POR_DEFECTO = {
+    'MAX_CONEXIONES': 10000,    # por proceso; más allá se responde 503
+    'COLA': 100,                # mensajes pendientes por cliente; si se llena, se cierra y reconecta
+    'LATIDO': 15,               # segundos entre comentarios keep-alive
+    'DURACION_MAXIMA': 300,     # segundos; luego el cliente se reconecta con Last-Event-ID
+    'MAX_LIBROS': 100,          # isbn por suscripción
+}
+
+# Canal de todos los libros (?libros=*)
+TODOS_LOS_LIBROS = 'libros'
+
+# Evento del registro -> estado del préstamo después del cambio
+ESTADO_PRESTAMO = {
+    'PRESTAMO_CREADO': 'ACTIVO',
+    'PRESTAMO_RENOVADO': 'ACTIVO',
+    'PRESTAMO_VENCIDO': 'VENCIDO',
+    'PRESTAMO_DEVUELTO': 'DEVUELTO',
+}
+
+# Eventos que cambian stock_disponible
+CAMBIAN_STOCK = ('PRESTAMO_CREADO', 'PRESTAMO_DEVUELTO', 'STOCK_ACTUALIZADO')
+
+
+def configuracion():
+    return {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'API_DIFUSION', {})}
+
+
+def canal_libro(isbn):
+    return f'libro:{isbn}'
+
+
+def canal_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+@dataclass(frozen=True)
+class Mensaje:
+    id: int
+    evento: str
+    canales: tuple
+    datos: dict
+
+    def sse(self):
+        datos = json.dumps(self.datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+        return f'id: {self.id}\nevent: {self.evento}\ndata: {datos}\n\n'
+
+
+def armar_mensajes(filas):
+    """
+    Mensajes de una tanda de eventos (filas de eventos.leer), en orden de id.
+    Cada libro con cambios genera un solo mensaje con su stock actual
+    (una consulta para toda la tanda).
+    """
+    mensajes = []
+    ultimo_por_libro = {}
+    for fila in filas:
+        tipo = fila['tipo']
+        if fila['usuario'] is not None:
+            datos = {
+                'tipo': tipo, 'fecha': timezone.localtime(fila['fecha']), 'usuario': fila['usuario'],
+                'libro': fila['libro'],
+                'prestamo': fila['prestamo'], 'multa': fila['multa'], **fila['datos'],
+            }
+            if tipo in ESTADO_PRESTAMO:
+                datos['estado'] = ESTADO_PRESTAMO[tipo]
+            evento = tipo.split('_', 1)[0].lower()
+            mensajes.append(Mensaje(fila['id'], evento, (canal_usuario(fila['usuario']),), datos))
+        if tipo in CAMBIAN_STOCK and fila['libro']:
+            ultimo_por_libro[fila['libro']] = fila['id']
+
+    if ultimo_por_libro:
+        stock = Libro.objects.filter(pk__in=list(ultimo_por_libro)).values_list('isbn', 'stock_disponible')
+        for isbn, disponible in stock:
+            mensajes.append(Mensaje(
+                ultimo_por_libro[isbn], 'libro', (TODOS_LOS_LIBROS, canal_libro(isbn)),
+                {'isbn': isbn, 'stock_disponible': disponible, 'disponible': disponible > 0},
+            ))
+    mensajes.sort(key=lambda mensaje: mensaje.id)
+    return mensajes
+
+
+def leer_mensajes(desde, limite=eventos.LIMITE_MAXIMO):
+    """(hasta, mensajes, completo): completo es False si quedaron eventos sin leer"""
+    # Fuera de un request nadie cierra la conexión: se renueva si expiró o falló
+    close_old_connections()
+    hasta, filas = eventos.leer(desde, limite)
+    return hasta, armar_mensajes(filas), len(filas) < limite
+
+
+def ultimo_id():
+    close_old_connections()
+    return eventos.ultimo_id()
+
+
+class Suscripcion:
+    def __init__(self, canales, tamano_cola):
+        self.canales = frozenset(canales)
+        self.cola = asyncio.Queue(tamano_cola)
+        self.desbordada = False
+
+    def entregar(self, mensaje):
+        try:
+            self.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            # Cliente lento: se cierra el stream y se pone al día al reconectarse
+            self.desbordada = True
+
+
+class Difusor:
+    """
+    Suscripciones de un event loop y su lector del registro de eventos.
+    El lector corre mientras haya suscripciones; una consulta por sondeo
+    (MAX(id) si no hay eventos) sin importar cuántos clientes estén conectados.
+    """
+
+    def __init__(self):
+        self.por_canal = {}
+        self.conexiones = 0
+        self.ultimo = 0
+        self.lector = None
+        self.iniciado = None
+
+    async def suscribir(self, canales):
+        """Suscripción nueva; `self.ultimo` queda fijado antes de retornar"""
+        configuracion_actual = configuracion()
+        if self.conexiones >= configuracion_actual['MAX_CONEXIONES']:
+            return None
+        suscripcion = Suscripcion(canales, configuracion_actual['COLA'])
+        self.conexiones += 1
+        for canal in suscripcion.canales:
+            self.por_canal.setdefault(canal, set()).add(suscripcion)
+        if self.lector is None:
+            self.iniciado = asyncio.Event()
+            self.lector = asyncio.create_task(self.leer())
+        try:
+            await self.iniciado.wait()
+        except BaseException:
+            self.cancelar(suscripcion)
+            raise
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        self.conexiones -= 1
+        for canal in suscripcion.canales:
+            suscritas = self.por_canal.get(canal)
+            if suscritas is not None:
+                suscritas.discard(suscripcion)
+                if not suscritas:
+                    del self.por_canal[canal]
+
+    def repartir(self, mensajes):
+        for mensaje in mensajes:
+            destinatarios = set()
+            for canal in mensaje.canales:
+                destinatarios.update(self.por_canal.get(canal, ()))
+            for suscripcion in destinatarios:
+                suscripcion.entregar(mensaje)
+
+    async def leer(self):
+        _, intervalo = eventos.configuracion()
+        try:
+            while self.conexiones:
+                try:
+                    if not self.iniciado.is_set():
+                        # Se reparte desde el último evento al iniciar el lector
+                        self.ultimo = await sync_to_async(ultimo_id)()
+                        self.iniciado.set()
+                        mensajes = []
+                    else:
+                        self.ultimo, mensajes, _ = await sync_to_async(leer_mensajes)(self.ultimo)
+                except Exception:
+                    # La base de datos no respondió: se reintenta en el siguiente sondeo
+                    logger.exception('Error al leer el registro de eventos')
+                else:
+                    self.repartir(mensajes)
+                await asyncio.sleep(intervalo)
+        finally:
+            self.lector = None
+
+
+# Un Difusor por event loop (con ASGI, uno por proceso)
+_difusores = weakref.WeakKeyDictionary()
+
+
+def obtener_difusor():
+    loop = asyncio.get_running_loop()
+    difusor = _difusores.get(loop)
+    if difusor is None:
+        difusor = _difusores[loop] = Difusor()
+    return difusor
+
+
+class StreamASGI:
+    """
+    GET {ruta}?libros=978...,978...&usuario=1  (text/event-stream)
+    ?libros=* recibe los cambios de stock de todo el catálogo. Al conectarse
+    llega un evento "conectado" con el id actual; al reconectarse, el
+    navegador envía Last-Event-ID y se reenvían los cambios perdidos (si son
+    demasiados llega "reinicio": el cliente debe volver a leer los listados).
+    Los demás requests pasan a `aplicacion` (el handler ASGI de Django).
+    """
+
+    def __init__(self, aplicacion, ruta='/api/async/stream/'):
+        self.aplicacion = aplicacion
+        self.ruta = ruta
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.ruta:
+            return await self.aplicacion(scope, receive, send)
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.responder(send, scope, 405, {'detail': f'Método "{scope["method"]}" no permitido.'})
+
+        configuracion_actual = configuracion()
+        parametros = {k: v[-1] for k, v in parse_qs(scope['query_string'].decode()).items()}
+        headers = {nombre.decode().lower(): valor.decode() for nombre, valor in scope['headers']}
+        canales, error = self.canales(parametros, configuracion_actual)
+        if error is not None:
+            return await self.responder(send, scope, 400, error)
+        desde = headers.get('last-event-id') or parametros.get('since')
+        if desde is not None and not desde.isdigit():
+            return await self.responder(send, scope, 400, {'since': 'Debe ser un id de evento'})
+
+        difusor = obtener_difusor()
+        suscripcion = await difusor.suscribir(canales)
+        if suscripcion is None:
+            return await self.responder(
+                send, scope, 503, {'error': 'Demasiadas conexiones, reintente más tarde'}, [(b'retry-after', b'5')]
+            )
+        try:
+            recuperados, hasta, completo = [], difusor.ultimo, True
+            if desde is not None:
+                hasta, recuperados, completo = await sync_to_async(leer_mensajes)(int(desde))
+                if not completo:
+                    # Demasiados cambios perdidos: el cliente recarga y sigue desde el lector
+                    recuperados, hasta = [], difusor.ultimo
+        except BaseException:
+            difusor.cancelar(suscripcion)
+            raise
+
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': self.headers_cors(scope) + [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                # Sin buffer en un proxy nginx delante
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        mensajes = self.flujo(difusor, suscripcion, recuperados, hasta, completo, configuracion_actual)
+        tarea = asyncio.current_task()
+        desconectado = False
+
+        async def vigilar():
+            nonlocal desconectado
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            desconectado = True
+            tarea.cancel()
+
+        vigilante = asyncio.create_task(vigilar())
+        try:
+            async for parte in mensajes:
+                await send({'type': 'http.response.body', 'body': parte.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except asyncio.CancelledError:
+            if not desconectado:
+                raise
+        finally:
+            vigilante.cancel()
+            await mensajes.aclose()
+
+    @staticmethod
+    def canales(parametros, configuracion_actual):
+        """(canales, None) o (None, error)"""
+        canales = []
+        libros = [isbn for isbn in parametros.get('libros', '').split(',') if isbn]
+        if libros == ['*']:
+            canales.append(TODOS_LOS_LIBROS)
+        elif len(libros) > configuracion_actual['MAX_LIBROS']:
+            return None, {'libros': f'Máximo {configuracion_actual["MAX_LIBROS"]} libros por conexión'}
+        else:
+            canales += [canal_libro(isbn) for isbn in libros]
+        usuario = parametros.get('usuario')
+        if usuario:
+            if not usuario.isdigit():
+                return None, {'usuario': 'Debe ser un id numérico'}
+            canales.append(canal_usuario(int(usuario)))
+        if not canales:
+            return None, {'error': 'Indique ?libros= y/o ?usuario='}
+        return canales, None
+
+    @staticmethod
+    async def flujo(difusor, suscripcion, recuperados, hasta, completo, configuracion_actual):
+        """
+        Mensajes SSE de una suscripción. Los que el lector reparta con id
+        hasta `hasta` ya llegaron en `recuperados` y se descartan de la cola.
+        """
+        fin = time.monotonic() + configuracion_actual['DURACION_MAXIMA']
+        try:
+            yield 'retry: 2000\n\n'
+            if not completo:
+                yield 'event: reinicio\ndata: {}\n\n'
+            for mensaje in recuperados:
+                if suscripcion.canales.intersection(mensaje.canales):
+                    yield mensaje.sse()
+            # Punto de partida del Last-Event-ID aunque no llegue ningún cambio
+            yield f'id: {hasta}\nevent: conectado\ndata: {{"ultimo": {hasta}}}\n\n'
+            while not suscripcion.desbordada:
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    mensaje = await asyncio.wait_for(
+                        suscripcion.cola.get(), timeout=min(configuracion_actual['LATIDO'], restante)
+                    )
+                except asyncio.TimeoutError:
+                    # Comentario keep-alive: mantiene abiertos los proxies
+                    yield ': latido\n\n'
+                    continue
+                if mensaje.id > hasta:
+                    yield mensaje.sse()
+        finally:
+            difusor.cancelar(suscripcion)
+
+    @staticmethod
+    def headers_cors(scope):
+        """Lo que agregaría django-cors-headers, que aquí no interviene"""
+        origen = dict(scope['headers']).get(b'origin')
+        if origen is None:
+            return []
+        if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+            return [(b'access-control-allow-origin', b'*')]
+        if origen.decode() in getattr(settings, 'CORS_ALLOWED_ORIGINS', ()):
+            return [(b'access-control-allow-origin', origen), (b'vary', b'origin')]
+        return []
+
+    async def responder(self, send, scope, status, datos, headers=()):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode()
+        await send({
+            'type': 'http.response.start', 'status': status,
+            'headers': self.headers_cors(scope) + [(b'content-type', b'application/json')] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': cuerpo})
@@ -0,0 +1,172 @@
+"""
+Estadísticas de circulación pre-agregadas (rollups diarios)
+api.services suma los eventos en la misma transacción que cada operación;
+el dashboard lee la tabla Estadistica (pocas filas por día) en vez de
+agregar préstamos y multas completos. reconstruir_estadisticas la recalcula.
+
+Dimensiones y claves:
+    estado        ACTIVO / VENCIDO / DEVUELTO: variación del día del número de préstamos en cada estado
+    categoria     Libro.categoria: préstamos creados en el día
+    tipo_usuario  Usuario.tipo_usuario: préstamos creados en el día
+    multas        generadas / pagadas / eliminadas: cantidad del día
+    montos        generado / pagado / eliminado: suma de monto_total del día
+    catalogo      usuarios / libros: altas menos bajas del día
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Estadistica, Usuario, Libro, Prestamo, Multa, PrestamoArchivado, MultaArchivada
+
+ESTADOS = ('ACTIVO', 'VENCIDO', 'DEVUELTO')
+
+# Evento de una multa -> (clave en 'multas', clave en 'montos')
+EVENTOS_MULTA = {
+    'generada': ('generadas', 'generado'),
+    'pagada': ('pagadas', 'pagado'),
+    'eliminada': ('eliminadas', 'eliminado'),
+}
+
+
+def registrar(deltas, fecha=None):
+    """
+    Suma deltas = {(dimension, clave): n} a las filas del día con un upsert:
+    INSERT ... ON CONFLICT (fecha, dimension, clave) DO UPDATE SET valor = valor + n
+    (misma sintaxis en SQLite y PostgreSQL). Las operaciones que suman a la
+    misma fila del día se esperan hasta el commit (ver api.conditional).
+    """
+    filas = [(dimension, clave, n) for (dimension, clave), n in deltas.items() if n]
+    if not filas:
+        return
+    connection = connections[router.db_for_write(Estadistica)]
+    fecha = connection.ops.adapt_datefield_value(fecha or timezone.localdate())
+    tabla = Estadistica._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {tabla} (fecha, dimension, clave, valor) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (fecha, dimension, clave) DO UPDATE SET valor = {tabla}.valor + excluded.valor',
+            [(fecha, dimension, clave, n) for dimension, clave, n in filas]
+        )
+
+
+def deltas_prestamo(usuario, libro):
+    return Counter({
+        ('estado', 'ACTIVO'): 1,
+        ('categoria', libro.categoria): 1,
+        ('tipo_usuario', usuario.tipo_usuario): 1,
+    })
+
+
+def deltas_multa(evento, monto):
+    """evento: 'generada', 'pagada' o 'eliminada'"""
+    cantidad, suma = EVENTOS_MULTA[evento]
+    return Counter({('multas', cantidad): 1, ('montos', suma): monto})
+
+
+def totales(filas):
+    """{dimension: {clave: suma de valor}} sobre las filas dadas"""
+    resultado = {}
+    for fila in filas.values('dimension', 'clave').annotate(total=Sum('valor')).order_by():
+        resultado.setdefault(fila['dimension'], {})[fila['clave']] = fila['total']
+    return resultado
+
+
+def resumen(desde, hasta):
+    """Cuerpo de GET /api/estadisticas/ (tres consultas sobre la tabla de rollups)"""
+    # Los totales actuales son la suma de todas las fechas
+    actuales = totales(Estadistica.objects.all())
+    estados = actuales.get('estado', {})
+    multas = actuales.get('multas', {})
+    montos = actuales.get('montos', {})
+    catalogo = actuales.get('catalogo', {})
+
+    periodo = Estadistica.objects.filter(fecha__range=(desde, hasta))
+    del_periodo = totales(periodo)
+    por_dia = (
+        periodo.filter(dimension='categoria').values('fecha')
+        .annotate(total=Sum('valor')).order_by('fecha')
+    )
+
+    return {
+        'usuarios': catalogo.get('usuarios', 0),
+        'libros': catalogo.get('libros', 0),
+        'prestamos': {estado.lower() + 's': estados.get(estado, 0) for estado in ESTADOS},
+        'multas': {
+            'pendientes': multas.get('generadas', 0) - multas.get('pagadas', 0) - multas.get('eliminadas', 0),
+            'monto_pendiente': montos.get('generado', 0) - montos.get('pagado', 0) - montos.get('eliminado', 0),
+            'monto_pagado': montos.get('pagado', 0),
+        },
+        'periodo': {
+            'desde': desde,
+            'hasta': hasta,
+            'prestamos_por_categoria': dict(sorted(del_periodo.get('categoria', {}).items())),
+            'prestamos_por_tipo_usuario': dict(sorted(del_periodo.get('tipo_usuario', {}).items())),
+            'devoluciones': del_periodo.get('estado', {}).get('DEVUELTO', 0),
+            'multas_generadas': del_periodo.get('multas', {}).get('generadas', 0),
+            'monto_multas_generado': del_periodo.get('montos', {}).get('generado', 0),
+            'prestamos_por_dia': [{'fecha': fila['fecha'], 'prestamos': fila['total']} for fila in por_dia],
+        },
+    }
+
+
+def calcular_desde_tablas():
+    """
+    Rollups recalculados con agregados sobre las tablas base. El historial
+    de estados no se guarda: un préstamo VENCIDO se cuenta como vencido el
+    día siguiente a su fecha esperada, y las multas eliminadas no aparecen.
+    """
+    filas = Counter()
+    # Los préstamos y multas archivados siguen contando (archivar_historial)
+    for modelo in (Prestamo, PrestamoArchivado):
+        creados = modelo.objects.annotate(fecha=TruncDate('fecha_prestamo'))
+        for fila in creados.values('fecha', 'libro__categoria').annotate(n=Count('pk')).order_by():
+            filas[(fila['fecha'], 'categoria', fila['libro__categoria'])] += fila['n']
+            filas[(fila['fecha'], 'estado', 'ACTIVO')] += fila['n']
+        for fila in creados.values('fecha', 'usuario__tipo_usuario').annotate(n=Count('pk')).order_by():
+            filas[(fila['fecha'], 'tipo_usuario', fila['usuario__tipo_usuario'])] += fila['n']
+
+        devueltos = modelo.objects.filter(estado='DEVUELTO')
+        for fila in devueltos.values('fecha_devolucion_real').annotate(n=Count('pk')).order_by():
+            filas[(fila['fecha_devolucion_real'], 'estado', 'ACTIVO')] -= fila['n']
+            filas[(fila['fecha_devolucion_real'], 'estado', 'DEVUELTO')] += fila['n']
+        vencidos = modelo.objects.filter(estado='VENCIDO')
+        for fila in vencidos.values('fecha_devolucion_esperada').annotate(n=Count('pk')).order_by():
+            fecha = fila['fecha_devolucion_esperada'] + timedelta(days=1)
+            filas[(fecha, 'estado', 'ACTIVO')] -= fila['n']
+            filas[(fecha, 'estado', 'VENCIDO')] += fila['n']
+
+    for modelo in (Multa, MultaArchivada):
+        generadas = modelo.objects.annotate(fecha=TruncDate('fecha_generacion'))
+        for fila in generadas.values('fecha').annotate(n=Count('pk'), monto=Sum('monto_total')).order_by():
+            filas[(fila['fecha'], 'multas', 'generadas')] += fila['n']
+            filas[(fila['fecha'], 'montos', 'generado')] += fila['monto']
+        pagadas = modelo.objects.filter(pagada=True).annotate(
+            fecha=TruncDate(Coalesce('fecha_pago', 'fecha_generacion'))
+        )
+        for fila in pagadas.values('fecha').annotate(n=Count('pk'), monto=Sum('monto_total')).order_by():
+            filas[(fila['fecha'], 'multas', 'pagadas')] += fila['n']
+            filas[(fila['fecha'], 'montos', 'pagado')] += fila['monto']
+
+    hoy = timezone.localdate()
+    filas[(hoy, 'catalogo', 'usuarios')] = Usuario.objects.count()
+    filas[(hoy, 'catalogo', 'libros')] = Libro.objects.count()
+    return filas
+
+
+def reconstruir(lote=5000):
+    """Reemplaza todos los rollups por los calculados desde las tablas base"""
+    filas = calcular_desde_tablas()
+    with transaction.atomic():
+        Estadistica.objects.all().delete()
+        Estadistica.objects.bulk_create(
+            [
+                Estadistica(fecha=fecha, dimension=dimension, clave=clave, valor=valor)
+                for (fecha, dimension, clave), valor in filas.items() if valor
+            ],
+            batch_size=lote,
+        )
+    return len(filas)
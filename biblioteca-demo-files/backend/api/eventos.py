@@ -0,0 +1,124 @@
+"""
+Registro de eventos de circulación (outbox)
+api.services agrega los eventos en la misma transacción que cada
+operación: si la transacción se revierte, el evento tampoco existe.
+Los consumidores leen en orden de id con GET /api/eventos/?since=<id>.
+
+El id de los eventos debe confirmarse en orden: si la transacción con el
+id 11 confirmara antes que la del 10, un consumidor que ya leyó el 11 se
+saltaría el 10. Por eso registrar() primero actualiza la fila 'evento' de
+VersionTabla (queda bloqueada hasta el commit) y después inserta: las
+transacciones que registran eventos toman sus id de a una.
+"""
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Evento
+from .signals import notificar_cambios
+
+# Máximo de eventos por respuesta
+LIMITE_MAXIMO = 1000
+
+TIPOS = {tipo for tipo, _ in Evento.TIPO_CHOICES}
+
+
+def configuracion():
+    opciones = getattr(settings, 'API_EVENTOS', {})
+    return opciones.get('ESPERA_MAXIMA', 30), opciones.get('INTERVALO_SONDEO', 0.5)
+
+
+def turno():
+    """Toma el turno de la secuencia (UPDATE de VersionTabla) hasta el commit"""
+    notificar_cambios(Evento)
+
+
+def registrar(eventos):
+    """Inserta los eventos de la operación en curso (un INSERT)"""
+    if eventos:
+        turno()
+        Evento.objects.bulk_create(eventos)
+
+
+def prestamo_creado(prestamo):
+    return Evento(
+        tipo='PRESTAMO_CREADO', usuario=prestamo.usuario_id, libro=prestamo.libro_id, prestamo=prestamo.pk,
+        datos={'fecha_devolucion_esperada': prestamo.fecha_devolucion_esperada},
+    )
+
+
+def prestamo_renovado(prestamo):
+    return Evento(
+        tipo='PRESTAMO_RENOVADO', usuario=prestamo.usuario_id, libro=prestamo.libro_id, prestamo=prestamo.pk,
+        datos={'fecha_devolucion_esperada': prestamo.fecha_devolucion_esperada},
+    )
+
+
+def prestamo_vencido(prestamo_id, usuario_id, libro_id):
+    return Evento(tipo='PRESTAMO_VENCIDO', usuario=usuario_id, libro=libro_id, prestamo=prestamo_id)
+
+
+def prestamo_devuelto(prestamo):
+    return Evento(
+        tipo='PRESTAMO_DEVUELTO', usuario=prestamo.usuario_id, libro=prestamo.libro_id, prestamo=prestamo.pk,
+        datos={'fecha_devolucion_real': prestamo.fecha_devolucion_real},
+    )
+
+
+def multa(tipo, multa, usuario_id):
+    """tipo: MULTA_GENERADA, MULTA_PAGADA o MULTA_ELIMINADA"""
+    return Evento(
+        tipo=tipo, usuario=usuario_id, prestamo=multa.prestamo_id, multa=multa.pk,
+        datos={'dias_retraso': multa.dias_retraso, 'monto_total': multa.monto_total},
+    )
+
+
+def usuario(tipo, usuario_id):
+    """tipo: USUARIO_BLOQUEADO o USUARIO_DESBLOQUEADO"""
+    return Evento(tipo=tipo, usuario=usuario_id)
+
+
+def stock_actualizado(libro_ids):
+    """Cambios de stock sin préstamo ni devolución (reservas liberadas, catálogo)"""
+    return [Evento(tipo='STOCK_ACTUALIZADO', libro=libro_id) for libro_id in libro_ids]
+
+
+def ultimo_id():
+    return Evento.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+
+
+def leer(desde, limite, tipos=None, usuario=None):
+    """
+    (hasta, filas): eventos con id > desde, en orden. `hasta` es el id
+    desde el que debe seguir el consumidor; con filtros puede avanzar más
+    allá del último evento entregado (los eventos intermedios no aplican).
+    """
+    horizonte = ultimo_id()
+    if horizonte <= desde:
+        return desde, []
+    eventos = Evento.objects.filter(id__gt=desde, id__lte=horizonte)
+    if tipos:
+        eventos = eventos.filter(tipo__in=tipos)
+    if usuario is not None:
+        eventos = eventos.filter(usuario=usuario)
+    filas = list(eventos.order_by('id').values()[:limite])
+    if len(filas) == limite:
+        return filas[-1]['id'], filas
+    return horizonte, filas
+
+
+def esperar(desde, limite, espera, tipos=None, usuario=None):
+    """
+    leer() con long-poll: si no hay eventos, vuelve a consultar cada
+    INTERVALO_SONDEO segundos hasta que lleguen o pasen `espera` segundos.
+    Mientras no haya eventos nuevos, cada sondeo es un MAX(id).
+    """
+    _, intervalo = configuracion()
+    fin = time.monotonic() + espera
+    while True:
+        desde, filas = leer(desde, limite, tipos, usuario)
+        restante = fin - time.monotonic()
+        if filas or restante <= 0:
+            return desde, filas
+        time.sleep(min(intervalo, restante))
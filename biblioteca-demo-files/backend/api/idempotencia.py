@@ -0,0 +1,127 @@
+"""
+Idempotency-Key para las escrituras de circulación
+Un POST con el header Idempotency-Key se ejecuta una sola vez por clave y
+ruta; los reintentos (del frontend o del proxy) reciben la respuesta
+guardada, con el header Idempotent-Replayed: true, sin repetir la operación.
+
+La clave se toma con un INSERT ... ON CONFLICT en la misma transacción que
+la operación: un duplicado simultáneo espera el lock de escritura hasta el
+commit y reutiliza la respuesta. Si la operación falla (404, datos
+inválidos) la clave se revierte con ella y el reintento se ejecuta de nuevo. Las claves
+vencen a los TTL segundos y se conservan como máximo MAX_CLAVES (API_IDEMPOTENCIA).
+"""
+import functools
+import hashlib
+import itertools
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+HEADER = 'Idempotency-Key'
+LARGO_MAXIMO = ClaveIdempotencia._meta.get_field('clave').max_length
+TABLA = ClaveIdempotencia._meta.db_table
+
+CONFIGURACION_POR_DEFECTO = {
+    'TTL': 86400,           # segundos que se recuerda una clave
+    'MAX_CLAVES': 100000,   # sobre este total se borran las más antiguas
+    'PURGA_CADA': 500,      # claves nuevas (por proceso) entre purgas
+}
+
+# Claves guardadas por este proceso, para purgar cada PURGA_CADA
+_guardadas = itertools.count(1)
+
+
+def configuracion():
+    return {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'API_IDEMPOTENCIA', {})}
+
+
+def vencimiento(config, ahora=None):
+    return (ahora or timezone.now()) - timedelta(seconds=config['TTL'])
+
+
+def purgar(config=None, ahora=None):
+    """Borra las claves vencidas y las más antiguas sobre MAX_CLAVES; retorna cuántas"""
+    config = config or configuracion()
+    db = ClaveIdempotencia.objects.db
+    borradas = ClaveIdempotencia.objects.filter(creado__lt=vencimiento(config, ahora))._raw_delete(db)
+    maximo = config['MAX_CLAVES']
+    corte = list(ClaveIdempotencia.objects.order_by('-id').values_list('id', flat=True)[maximo:maximo + 1])
+    if corte:
+        borradas += ClaveIdempotencia.objects.filter(id__lte=corte[0])._raw_delete(db)
+    return borradas
+
+
+def reclamar(clave, ruta, firma, config):
+    """
+    Inserta la clave en un solo INSERT ... ON CONFLICT; una clave vencida se
+    sobrescribe. Retorna el id, o None si la clave sigue vigente.
+    """
+    ops = connection.ops
+    ahora = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TABLA} (clave, ruta, firma, creado, status, datos) '
+            'VALUES (%s, %s, %s, %s, NULL, NULL) '
+            'ON CONFLICT (clave, ruta) DO UPDATE SET firma = excluded.firma, creado = excluded.creado, '
+            f'status = NULL, datos = NULL WHERE {TABLA}.creado < %s '
+            'RETURNING id',
+            [clave, ruta, firma, ops.adapt_datetimefield_value(ahora),
+             ops.adapt_datetimefield_value(vencimiento(config, ahora))]
+        )
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def repetir(registro, firma):
+    """Respuesta de un duplicado: la guardada, o 422 si el cuerpo es otro"""
+    if registro.firma != firma:
+        return Response(
+            {'error': f'La {HEADER} ya se usó con otro contenido'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(registro.datos, status=registro.status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotente(accion):
+    """Decorador de acciones de ViewSet: respeta el header Idempotency-Key"""
+
+    @functools.wraps(accion)
+    def ejecutar(self, request, *args, **kwargs):
+        clave = request.headers.get(HEADER)
+        if clave is None:
+            return accion(self, request, *args, **kwargs)
+        if not clave or len(clave) > LARGO_MAXIMO:
+            return Response(
+                {'error': f'{HEADER} debe tener entre 1 y {LARGO_MAXIMO} caracteres'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        config = configuracion()
+        firma = hashlib.sha256(request.body).hexdigest()
+        with transaction.atomic():
+            # Primera sentencia una escritura (SQLite): toma la clave o, si ya venció, la reutiliza
+            registro_id = reclamar(clave, request.path, firma, config)
+            if registro_id is not None:
+                response = accion(self, request, *args, **kwargs)
+                # Los servicios no usan savepoint: si fallaron, la clave se revierte con la operación
+                if not transaction.get_rollback():
+                    ClaveIdempotencia.objects.filter(pk=registro_id).update(
+                        status=response.status_code, datos=response.data
+                    )
+        if registro_id is None:
+            # Otro request ya usó la clave (y confirmó): se reutiliza su respuesta
+            return repetir(ClaveIdempotencia.objects.get(clave=clave, ruta=request.path), firma)
+
+        if next(_guardadas) % config['PURGA_CADA'] == 0:
+            purgar(config)
+        return response
+
+    return ejecutar
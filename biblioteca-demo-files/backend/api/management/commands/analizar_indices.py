@@ -0,0 +1,108 @@
+"""
+Asesor de índices: ejecuta EXPLAIN sobre las consultas de la API
+Ejecutar: python manage.py analizar_indices
+
+Revisa el listado paginado de cada ViewSet del router y las consultas
+frecuentes de las acciones, e informa los recorridos completos de tabla.
+"""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.models import Usuario, Libro, Prestamo, Multa, PrestamoArchivado
+from api.urls import router
+
+
+def consultas_frecuentes():
+    """Consultas de las acciones y tareas que no pasan por el listado"""
+    hoy = timezone.now().date()
+    return {
+        'prestamos por estado': Prestamo.objects.filter(estado='ACTIVO').order_by('-fecha_prestamo')[:50],
+        'prestamos de un usuario': Prestamo.objects.filter(usuario_id=1, estado='ACTIVO'),
+        'barrido de vencidos': Prestamo.objects.filter(
+            estado='ACTIVO', fecha_devolucion_esperada__lt=hoy
+        ).order_by('pk').values('pk')[:5000],
+        'multas pendientes de un usuario': Multa.objects.filter(
+            prestamo__usuario_id=1, pagada=False
+        ).values('pk'),
+        'historial archivado de un usuario': PrestamoArchivado.objects.filter(
+            usuario_id=1, fecha_prestamo__lte=timezone.now()
+        ).order_by('-fecha_prestamo', '-id')[:51],
+        'libros por categoria': Libro.objects.filter(categoria='PROGRAMACION').order_by('titulo')[:50],
+        'usuario por rut': Usuario.objects.filter(rut='12345678-9'),
+    }
+
+
+def lineas_del_plan(plan):
+    # En SQLite cada línea empieza con "id padre 0"; se deja solo el detalle
+    return [re.sub(r'^[\d\s]+', '', linea).strip(' -|`') for linea in plan.splitlines()]
+
+
+def es_recorrido_completo(linea):
+    if connection.vendor == 'sqlite':
+        # "SCAN api_prestamo" sin índice; "SCAN ... USING INDEX" recorre un índice
+        return linea.startswith('SCAN') and 'USING' not in linea
+    return 'Seq Scan' in linea
+
+
+def es_ordenamiento_temporal(linea):
+    return 'USE TEMP B-TREE' in linea or linea.startswith('Sort')
+
+
+class Command(BaseCommand):
+    help = 'Informa las consultas de la API que recorren tablas completas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--estricto', action='store_true',
+            help='Terminar con error si alguna consulta recorre una tabla completa'
+        )
+
+    def consultas_de_listado(self):
+        factory = APIRequestFactory()
+        for prefijo, viewset, _ in router.registry:
+            view = viewset()
+            view.action = 'list'
+            view.format_kwarg = None
+            view.kwargs = {}
+            view.request = Request(factory.get(f'/api/{prefijo}/'))
+            queryset = view.filter_queryset(view.get_queryset())
+            paginador = view.paginator
+            if paginador is not None:
+                ordering = paginador.get_ordering(view.request, queryset, view)
+                queryset = queryset.order_by(*ordering)[:paginador.page_size]
+            yield f'GET /api/{prefijo}/', queryset
+
+    def handle(self, *args, **options):
+        consultas = list(self.consultas_de_listado()) + list(consultas_frecuentes().items())
+        problemas = 0
+
+        for nombre, queryset in consultas:
+            plan = queryset.explain()
+            lineas = lineas_del_plan(plan)
+            ordenamientos = [linea for linea in lineas if es_ordenamiento_temporal(linea)]
+            recorridos = [linea for linea in lineas if es_recorrido_completo(linea)]
+            if queryset.query.is_sliced and not ordenamientos:
+                # Recorrido en el orden de la clave con LIMIT: se detiene en la página
+                recorridos = []
+
+            if recorridos:
+                problemas += 1
+                self.stdout.write(self.style.WARNING(f'✗ {nombre}'))
+            else:
+                self.stdout.write(f'✓ {nombre}')
+            for linea in recorridos:
+                self.stdout.write(f'    recorrido completo: {linea}')
+            for linea in ordenamientos:
+                self.stdout.write(f'    ordenamiento sin índice: {linea}')
+            if options['verbosity'] > 1:
+                for linea in lineas:
+                    self.stdout.write(f'    | {linea}')
+
+        self.stdout.write('')
+        self.stdout.write(f'{problemas} de {len(consultas)} consultas recorren una tabla completa')
+        if problemas and options['estricto']:
+            raise CommandError('Hay consultas sin índice')
@@ -0,0 +1,76 @@
+"""
+Comando para archivar préstamos devueltos y multas pagadas antiguos
+Ejecutar: python manage.py archivar_historial --dias 365
+Programado: python manage.py archivar_historial --cada 86400
+
+Mueve a PrestamoArchivado / MultaArchivada los préstamos devueltos antes del
+corte con su multa pagada (los que tienen una multa pendiente se quedan).
+Recorre los préstamos en lotes por id y guarda el avance en ProgresoTarea,
+así una ejecución interrumpida continúa desde el último lote confirmado.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Prestamo, Multa, ProgresoTarea
+from api import archivo
+
+TAREA = 'archivar_historial'
+
+
+class Command(BaseCommand):
+    help = 'Mueve los préstamos devueltos y multas pagadas antiguos a las tablas de archivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Antigüedad mínima (por defecto API_ARCHIVO["DIAS"])')
+        parser.add_argument('--lote', type=int, default=2000, help='Préstamos por transacción')
+        parser.add_argument('--cada', type=int, help='Repetir cada N segundos (modo programador)')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignorar el checkpoint guardado')
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else archivo.configuracion()
+        while True:
+            self.archivar(dias, options['lote'], options['reiniciar'])
+            if not options['cada']:
+                break
+            options['reiniciar'] = False
+            time.sleep(options['cada'])
+
+    def archivar(self, dias, tamano_lote, reiniciar):
+        corte = archivo.fecha_corte(dias)
+        progreso, _ = ProgresoTarea.objects.get_or_create(nombre=TAREA)
+        if reiniciar or progreso.completada or progreso.fecha_referencia != corte:
+            # Nueva pasada; una pasada con el mismo corte sin terminar se retoma
+            progreso.ultimo_id = 0
+            progreso.procesados = 0
+            progreso.fecha_referencia = corte
+            progreso.completada = False
+            progreso.save()
+        elif progreso.ultimo_id:
+            self.stdout.write(f'Retomando desde el préstamo {progreso.ultimo_id}')
+
+        pendientes = archivo.archivables(corte).order_by('pk')
+
+        inicio = time.perf_counter()
+        total_multas = 0
+        while True:
+            ids = list(
+                pendientes.filter(pk__gt=progreso.ultimo_id).values_list('pk', flat=True)[:tamano_lote]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                prestamos, multas = archivo.archivar(ids, corte)
+                progreso.ultimo_id = ids[-1]
+                progreso.procesados += prestamos
+                progreso.save(update_fields=['ultimo_id', 'procesados', 'actualizado'])
+            total_multas += multas
+            self.stdout.write(f'  Lote hasta id {ids[-1]}: {prestamos} préstamos, {multas} multas')
+
+        progreso.completada = True
+        progreso.save(update_fields=['completada', 'actualizado'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {progreso.procesados} préstamos y {total_multas} multas anteriores al {corte} archivados '
+            f'({time.perf_counter() - inicio:.1f} s); quedan {Prestamo.objects.count()} préstamos '
+            f'y {Multa.objects.count()} multas'
+        ))
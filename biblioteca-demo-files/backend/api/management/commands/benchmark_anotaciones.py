@@ -0,0 +1,139 @@
+"""
+Benchmark de dias_retraso / dias_prestamo: propiedad en Python vs anotación SQL
+Ejecutar: python manage.py benchmark_anotaciones
+(con datos a escala: python manage.py generar_carga --prestamos 1000000)
+
+Primero verifica en todas las filas que las anotaciones de api.anotaciones
+den lo mismo que Prestamo.calcular_dias_retraso y Usuario.dias_prestamo_de.
+Luego mide consultas típicas resueltas leyendo las filas y calculando en
+Python (como antes) contra la misma consulta con filtro/orden en SQL.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count
+from django.test import Client
+
+from api import anotaciones
+from api.cache import get_cache
+from api.models import Usuario, Prestamo
+
+COLUMNAS = ('estado', 'fecha_devolucion_esperada', 'fecha_devolucion_real')
+
+
+def medir(funcion, repeticiones):
+    """(mediana en ms, último resultado)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), resultado
+
+
+class Command(BaseCommand):
+    help = 'Verifica las anotaciones de días de retraso/préstamo y las compara con el cálculo en Python'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--min-retraso', type=int, default=10)
+
+    def handle(self, *args, **options):
+        self.hoy = anotaciones.hoy()
+        self.verificar()
+
+        self.stdout.write(f"{'consulta':<34}{'python':>10}{'sql':>10}{'mejora':>9}")
+        for nombre, en_python, en_sql in self.consultas(options['min_retraso']):
+            t_python, esperado = medir(en_python, options['repeticiones'])
+            t_sql, obtenido = medir(en_sql, options['repeticiones'])
+            if obtenido != esperado:
+                raise CommandError(f'{nombre}: el resultado en SQL difiere ({obtenido} != {esperado})')
+            self.stdout.write(f'{nombre:<34}{t_python:>8.0f}ms{t_sql:>8.0f}ms{t_python / t_sql:>8.1f}x')
+        self.medir_endpoints(options['repeticiones'])
+
+    def verificar(self):
+        prestamos = Prestamo.objects.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso(self.hoy)})
+        filas = 0
+        for *valores, retraso in prestamos.values_list(*COLUMNAS, anotaciones.RETRASO).iterator(chunk_size=10000):
+            if retraso != Prestamo.calcular_dias_retraso(*valores, self.hoy):
+                raise CommandError(f'dias_retraso difiere en {valores}: {retraso}')
+            filas += 1
+        usuarios = Usuario.objects.annotate(**{anotaciones.PLAZO: anotaciones.dias_prestamo()})
+        for tipo, plazo in usuarios.values_list('tipo_usuario', anotaciones.PLAZO).iterator(chunk_size=10000):
+            if plazo != Usuario.dias_prestamo_de(tipo):
+                raise CommandError(f'dias_prestamo difiere para {tipo}: {plazo}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Anotaciones idénticas a las propiedades en {filas} préstamos y {usuarios.count()} usuarios'
+        ))
+
+    def retrasos(self, queryset):
+        """Cálculo en Python: (id, dias_retraso) de cada fila"""
+        return (
+            (pk, Prestamo.calcular_dias_retraso(*valores, self.hoy))
+            for pk, *valores in queryset.values_list('pk', *COLUMNAS).iterator(chunk_size=10000)
+        )
+
+    def consultas(self, minimo):
+        hoy = self.hoy
+        anotados = Prestamo.objects.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso(hoy)})
+        campo = anotaciones.RETRASO
+
+        def mas_atrasados_python():
+            filas = self.retrasos(Prestamo.objects.filter(anotaciones.vencidos(hoy)))
+            return sorted(filas, key=lambda fila: (-fila[1], -fila[0]))[:50]
+
+        def mas_atrasados_sql():
+            return list(
+                anotados.filter(anotaciones.vencidos(hoy)).order_by(f'-{campo}', '-id').values_list('pk', campo)[:50]
+            )
+
+        def con_retraso_python():
+            return sum(1 for _, retraso in self.retrasos(Prestamo.objects.all()) if retraso >= minimo)
+
+        def con_retraso_sql():
+            return anotados.filter(**{f'{campo}__gte': minimo}).count()
+
+        def promedio_python():
+            retrasos = [retraso for _, retraso in self.retrasos(Prestamo.objects.all()) if retraso > 0]
+            return round(sum(retrasos) / len(retrasos), 6) if retrasos else None
+
+        def promedio_sql():
+            promedio = anotados.filter(**{f'{campo}__gt': 0}).aggregate(promedio=Avg(campo))['promedio']
+            return round(promedio, 6) if promedio is not None else None
+
+        def por_retraso_python():
+            conteo = {}
+            for _, retraso in self.retrasos(Prestamo.objects.filter(anotaciones.vencidos(hoy))):
+                conteo[retraso] = conteo.get(retraso, 0) + 1
+            return sorted(conteo.items())
+
+        def por_retraso_sql():
+            filas = (
+                anotados.filter(anotaciones.vencidos(hoy)).values_list(campo)
+                .annotate(n=Count('pk')).order_by(campo)
+            )
+            return list(filas)
+
+        return [
+            ('50 vencidos más atrasados', mas_atrasados_python, mas_atrasados_sql),
+            (f'préstamos con retraso >= {minimo}', con_retraso_python, con_retraso_sql),
+            ('retraso promedio (atrasados)', promedio_python, promedio_sql),
+            ('vencidos por días de retraso', por_retraso_python, por_retraso_sql),
+        ]
+
+    def medir_endpoints(self, repeticiones):
+        cliente = Client()
+        for url in (
+            '/api/prestamos/?vencidos=true&ordering=-dias_retraso',
+            '/api/prestamos/?min_retraso=30',
+        ):
+            def pedir():
+                get_cache().invalidar('libros', 'usuarios')
+                response = cliente.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f'GET {url}: {response.status_code}')
+                return len(response.json()['results'])
+
+            tiempo, filas = medir(pedir, repeticiones)
+            self.stdout.write(f'GET {url}: {filas} filas en {tiempo:.0f} ms')
@@ -0,0 +1,257 @@
+"""
+Prueba de carga de la API por HTTP con clientes concurrentes
+Ejecutar (con el servidor corriendo): python manage.py benchmark_api --clientes 16 --duracion 30
+
+Cada cliente repite una mezcla de lecturas y escrituras (listar, buscar,
+prestar, renovar, devolver, pagar) contra --url. Informa p50/p95/p99 y
+throughput por operación y agrega el resultado a --salida (lista JSON),
+comparando el p95 con la corrida anterior contra la misma URL.
+
+WSGI vs ASGI: misma carga de lectura (--lectura) contra cada servidor;
+con --async las lecturas van a /api/async/:
+    gunicorn biblioteca_api.wsgi -w 1 --threads 8 -b :8000
+    python manage.py benchmark_api --lectura --clientes 64 --etiqueta wsgi
+    uvicorn biblioteca_api.asgi:application --port 8001
+    python manage.py benchmark_api --lectura --async --clientes 64 --url http://127.0.0.1:8001/api \
+        --etiqueta asgi --comparar-con wsgi
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from statistics import quantiles
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Operación -> peso en la mezcla
+MEZCLA = {
+    'listar_libros': 20,
+    'buscar_libros': 20,
+    'detalle_usuario': 10,
+    'listar_prestamos': 15,
+    'listar_multas': 5,
+    'prestar': 12,
+    'renovar': 6,
+    'devolver': 10,
+    'pagar': 2,
+}
+
+# Sondeo del catálogo y de los préstamos: solo endpoints con versión async
+MEZCLA_LECTURA = {
+    'listar_libros': 40,
+    'detalle_libro': 30,
+    'listar_prestamos': 30,
+}
+
+OPERACIONES_ASYNC = set(MEZCLA_LECTURA)
+
+
+class ClienteAPI:
+    def __init__(self, url, timeout):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def pedir(self, metodo, ruta, datos=None):
+        """Devuelve (status, cuerpo decodificado o None)"""
+        cuerpo = json.dumps(datos).encode() if datos is not None else None
+        request = urllib.request.Request(
+            f'{self.url}{ruta}', data=cuerpo, method=metodo,
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                contenido = response.read()
+                return response.status, json.loads(contenido) if contenido else None
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, None
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia (p50/p95/p99) y throughput de la API con clientes concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api')
+        parser.add_argument('--clientes', type=int, default=8)
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos de medición')
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--semilla', type=int, default=None)
+        parser.add_argument('--salida', default='benchmark_api.json')
+        parser.add_argument('--etiqueta', default='', help='Nombre de la corrida (ej. wsgi, asgi)')
+        parser.add_argument('--comparar-con', default=None, help='Etiqueta de la corrida con la cual comparar')
+        parser.add_argument('--lectura', action='store_true', help='Solo lecturas de libros y préstamos')
+        parser.add_argument('--async', action='store_true', dest='usar_async',
+                            help='Lecturas por /api/async/ (servidor ASGI)')
+
+    def handle(self, *args, **options):
+        self.cliente = ClienteAPI(options['url'], options['timeout'])
+        self.mezcla = MEZCLA_LECTURA if options['lectura'] else MEZCLA
+        self.prefijo_async = '/async' if options['usar_async'] else ''
+        self.preparar()
+
+        self.latencias = defaultdict(list)
+        self.rechazadas = defaultdict(int)
+        self.errores = defaultdict(int)
+        self.lock = threading.Lock()
+        fin = time.perf_counter() + options['duracion']
+        semilla = options['semilla']
+
+        self.stdout.write(f"{options['clientes']} clientes durante {options['duracion']:.0f} s contra {options['url']}")
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clientes']) as pool:
+            for n in range(options['clientes']):
+                rnd = random.Random(None if semilla is None else semilla + n)
+                pool.submit(self.trabajar, rnd, fin)
+        transcurrido = time.perf_counter() - inicio
+
+        resultado = self.resumen(options, transcurrido)
+        self.imprimir(resultado)
+        self.guardar(resultado, Path(options['salida']), options['comparar_con'])
+
+    def listar(self, ruta):
+        status, datos = self.cliente.pedir('GET', ruta)
+        if status != 200:
+            raise CommandError(f'GET {ruta} respondió {status}')
+        return datos['results'] if isinstance(datos, dict) else datos
+
+    def preparar(self):
+        """Usuarios, libros, términos de búsqueda y multas con los que trabajar"""
+        try:
+            usuarios = self.listar('/usuarios/?page_size=500')
+            libros = self.listar('/libros/?page_size=500')
+            multas = self.listar('/multas/?page_size=500')
+        except urllib.error.URLError as e:
+            raise CommandError(f'No se pudo conectar con la API: {e.reason}')
+
+        self.usuarios = [u['id'] for u in usuarios if not u['bloqueado']]
+        self.libros = [l['isbn'] for l in libros]
+        self.terminos = sorted({palabra for l in libros for palabra in l['titulo'].split() if len(palabra) > 3})
+        self.multas = [m['id'] for m in multas if not m['pagada']]
+        if not self.usuarios or not self.libros:
+            raise CommandError('Se necesitan usuarios habilitados y libros (ver crear_datos_demo / generar_carga)')
+
+    def trabajar(self, rnd, fin):
+        operaciones, pesos = zip(*self.mezcla.items())
+        propios = []  # préstamos creados por este cliente
+        while time.perf_counter() < fin:
+            operacion = rnd.choices(operaciones, pesos)[0]
+            if operacion in ('renovar', 'devolver') and not propios:
+                operacion = 'prestar'
+            if operacion == 'pagar' and not self.multas:
+                operacion = 'listar_multas'
+            metodo, ruta, datos = self.solicitud(operacion, rnd, propios)
+            if operacion in OPERACIONES_ASYNC:
+                ruta = self.prefijo_async + ruta
+
+            inicio = time.perf_counter()
+            try:
+                status, cuerpo = self.cliente.pedir(metodo, ruta, datos)
+            except (urllib.error.URLError, OSError):
+                status, cuerpo = None, None
+            duracion = (time.perf_counter() - inicio) * 1000
+
+            with self.lock:
+                if status is None or status >= 500:
+                    self.errores[operacion] += 1
+                    continue
+                self.latencias[operacion].append(duracion)
+                if status >= 400:
+                    # Reglas de negocio (sin stock, usuario bloqueado, límite de renovaciones)
+                    self.rechazadas[operacion] += 1
+            if operacion == 'prestar' and status == 201:
+                propios.append(cuerpo['id'])
+
+    def solicitud(self, operacion, rnd, propios):
+        if operacion == 'listar_libros':
+            return 'GET', '/libros/', None
+        if operacion == 'detalle_libro':
+            return 'GET', f'/libros/{urllib.parse.quote(rnd.choice(self.libros))}/', None
+        if operacion == 'buscar_libros':
+            return 'GET', f'/libros/?search={urllib.parse.quote(rnd.choice(self.terminos or ["a"]))}', None
+        if operacion == 'detalle_usuario':
+            return 'GET', f'/usuarios/{rnd.choice(self.usuarios)}/', None
+        if operacion == 'listar_prestamos':
+            return 'GET', '/prestamos/', None
+        if operacion == 'listar_multas':
+            return 'GET', '/multas/', None
+        if operacion == 'prestar':
+            datos = {'usuario': rnd.choice(self.usuarios), 'libro': rnd.choice(self.libros)}
+            return 'POST', '/prestamos/', datos
+        if operacion == 'renovar':
+            return 'POST', f'/prestamos/{rnd.choice(propios)}/renovar/', None
+        if operacion == 'devolver':
+            return 'POST', f'/prestamos/{propios.pop(rnd.randrange(len(propios)))}/devolver/', None
+        with self.lock:
+            multa = self.multas.pop() if self.multas else None
+        return 'POST', f'/multas/{multa}/pagar/', None
+
+    def resumen(self, options, transcurrido):
+        operaciones = {}
+        for operacion in self.mezcla:
+            muestras = self.latencias.get(operacion, [])
+            if not muestras and not self.errores[operacion]:
+                continue
+            datos = {
+                'solicitudes': len(muestras),
+                'rechazadas': self.rechazadas[operacion],
+                'errores': self.errores[operacion],
+                'rps': round(len(muestras) / transcurrido, 1),
+            }
+            if len(muestras) >= 2:
+                cortes = quantiles(muestras, n=100)
+                datos.update(p50=round(cortes[49], 2), p95=round(cortes[94], 2),
+                             p99=round(cortes[98], 2), max=round(max(muestras), 2))
+            operaciones[operacion] = datos
+
+        total = sum(len(m) for m in self.latencias.values())
+        return {
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'etiqueta': options['etiqueta'],
+            'url': options['url'],
+            'async': options['usar_async'],
+            'lectura': options['lectura'],
+            'clientes': options['clientes'],
+            'duracion_s': round(transcurrido, 1),
+            'solicitudes': total,
+            'errores': sum(self.errores.values()),
+            'rps': round(total / transcurrido, 1),
+            'operaciones': operaciones,
+        }
+
+    def imprimir(self, resultado):
+        self.stdout.write(f"{'operación':<18}{'n':>7}{'rech.':>7}{'err.':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>8}")
+        for operacion, datos in resultado['operaciones'].items():
+            self.stdout.write(
+                f"{operacion:<18}{datos['solicitudes']:>7}{datos['rechazadas']:>7}{datos['errores']:>6}"
+                f"{datos.get('p50', 0):>9.1f}{datos.get('p95', 0):>9.1f}{datos.get('p99', 0):>9.1f}{datos['rps']:>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {resultado['solicitudes']} solicitudes, {resultado['rps']} req/s, {resultado['errores']} errores"
+        ))
+
+    def guardar(self, resultado, salida, comparar_con=None):
+        corridas = json.loads(salida.read_text()) if salida.exists() else []
+        if comparar_con is not None:
+            anteriores = [c for c in corridas if c['etiqueta'] == comparar_con]
+        else:
+            anteriores = [c for c in corridas if c['url'] == resultado['url']]
+        if anteriores:
+            anterior = anteriores[-1]['operaciones']
+            self.stdout.write(
+                f"Throughput: {anteriores[-1]['rps']} -> {resultado['rps']} req/s. "
+                f"Cambio de p95 respecto de la corrida del {anteriores[-1]['fecha']}:"
+            )
+            for operacion, datos in resultado['operaciones'].items():
+                previo = anterior.get(operacion, {}).get('p95')
+                if previo and 'p95' in datos:
+                    self.stdout.write(f"  {operacion:<18}{previo:>9.1f} -> {datos['p95']:.1f} ms ({(datos['p95'] / previo - 1) * 100:+.0f}%)")
+
+        corridas.append(resultado)
+        salida.write_text(json.dumps(corridas, indent=2, ensure_ascii=False))
+        self.stdout.write(f'Resultados agregados a {salida}')
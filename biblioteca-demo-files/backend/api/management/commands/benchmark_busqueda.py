@@ -0,0 +1,128 @@
+"""
+Benchmark de búsqueda: LIKE '%x%' (búsqueda anterior) vs índice FTS5
+Ejecutar: python manage.py benchmark_busqueda --libros 1000000
+
+Usa una base SQLite temporal con el mismo esquema de índice que la API,
+así no toca los datos de la biblioteca.
+"""
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from api.search import BusquedaFTS5, PESOS_BM25, SQL_CREAR_INDICE, max_resultados
+
+PALABRAS = [
+    'programación', 'python', 'java', 'datos', 'redes', 'sistemas', 'operativos',
+    'algoritmos', 'estructuras', 'matemáticas', 'cálculo', 'álgebra', 'lineal',
+    'diseño', 'arquitectura', 'limpia', 'seguridad', 'computación', 'distribuida',
+    'inteligencia', 'artificial', 'aprendizaje', 'automático', 'bases', 'relacionales',
+    'introducción', 'avanzado', 'práctico', 'guía', 'manual', 'teoría', 'compiladores',
+    'concurrencia', 'paralelismo', 'web', 'móvil', 'nube', 'criptografía', 'grafos',
+]
+NOMBRES = ['José', 'María', 'Juan', 'Ana', 'Luis', 'Carmen', 'Pedro', 'Sofía', 'Andrés', 'Lucía']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Núñez']
+EDITORIALES = ["O'Reilly", 'Addison-Wesley', 'Prentice Hall', 'Alfaomega', 'Anaya', 'Marcombo']
+SILABAS = ['ra', 'to', 'mí', 'lo', 'ca', 'ne', 'sú', 'di', 've', 'tra', 'pen', 'gol', 'zá', 'ber', 'chi']
+
+
+def vocabulario(rnd, tamano):
+    """Palabras sintéticas para que los términos tengan frecuencias variadas"""
+    palabras = set()
+    while len(palabras) < tamano:
+        palabras.add(''.join(rnd.choice(SILABAS) for _ in range(rnd.randint(3, 5))))
+    return sorted(palabras)
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de búsqueda en el catálogo con N libros sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=1_000_000)
+        parser.add_argument('--consultas', type=int, default=200)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help='Archivo JSON con los resultados')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        ruta = os.path.join(tempfile.mkdtemp(), 'benchmark_busqueda.sqlite3')
+        db = sqlite3.connect(ruta)
+        db.execute(
+            'CREATE TABLE api_libro (isbn varchar(13) PRIMARY KEY, titulo varchar(200), '
+            'autor varchar(100), editorial varchar(100))'
+        )
+        for sql in SQL_CREAR_INDICE:
+            db.execute(sql)
+
+        raras = vocabulario(rnd, 20_000)
+        inicio = time.perf_counter()
+        lote = []
+        for i in range(options['libros']):
+            palabras = rnd.sample(PALABRAS, rnd.randint(1, 3)) + rnd.sample(raras, rnd.randint(1, 2))
+            titulo = ' '.join(palabras).capitalize()
+            autor = f'{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}'
+            lote.append((f'{9780000000000 + i}', titulo, autor, rnd.choice(EDITORIALES)))
+            if len(lote) == 50_000:
+                db.executemany('INSERT INTO api_libro VALUES (?, ?, ?, ?)', lote)
+                lote = []
+        if lote:
+            db.executemany('INSERT INTO api_libro VALUES (?, ?, ?, ?)', lote)
+        db.commit()
+        self.stdout.write(
+            f'✓ {options["libros"]} libros indexados en {time.perf_counter() - inicio:.1f} s'
+        )
+
+        # Términos como los escribe el buscador del frontend: prefijos y palabras completas,
+        # mezclando palabras frecuentes (muchos resultados) y poco frecuentes
+        terminos = []
+        for _ in range(options['consultas']):
+            palabra = rnd.choice(PALABRAS + APELLIDOS if rnd.random() < 0.3 else raras)
+            terminos.append(palabra[:rnd.randint(min(4, len(palabra)), len(palabra))])
+
+        backend = BusquedaFTS5()
+        pesos = ', '.join(str(p) for p in PESOS_BM25)
+        consultas = {
+            # La búsqueda anterior devolvía todas las coincidencias, sin límite
+            'like': lambda t: db.execute(
+                'SELECT isbn FROM api_libro WHERE titulo LIKE ? OR autor LIKE ?',
+                [f'%{t}%', f'%{t}%']
+            ).fetchall(),
+            'fts5': lambda t: db.execute(
+                'SELECT l.isbn FROM api_libro_fts '
+                'JOIN api_libro l ON l.rowid = api_libro_fts.rowid '
+                f'WHERE api_libro_fts MATCH ? ORDER BY bm25(api_libro_fts, {pesos}) LIMIT ?',
+                [backend.consulta_match(t), max_resultados() + 1]
+            ).fetchall(),
+        }
+
+        resultados = {'libros': options['libros'], 'consultas': len(terminos)}
+        for nombre, consulta in consultas.items():
+            tiempos = []
+            for termino in terminos:
+                t0 = time.perf_counter()
+                consulta(termino)
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            resultados[nombre] = {
+                'p50_ms': round(statistics.median(tiempos), 3),
+                'p95_ms': round(percentil(tiempos, 95), 3),
+                'p99_ms': round(percentil(tiempos, 99), 3),
+            }
+            self.stdout.write(
+                f'  {nombre}: p50 {resultados[nombre]["p50_ms"]} ms, '
+                f'p95 {resultados[nombre]["p95_ms"]} ms, p99 {resultados[nombre]["p99_ms"]} ms'
+            )
+
+        db.close()
+        os.remove(ruta)
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                json.dump(resultados, f, indent=2)
@@ -0,0 +1,111 @@
+"""
+Benchmark de formatos y compresión de respuestas
+Ejecutar: python manage.py benchmark_compresion --page-size 500
+
+Para la primera página de cada listado mide los bytes y el costo de CPU
+(mediana en ms) de cada formato (JSON compacto, JSON indentado como el de la
+API navegable, MessagePack) sin comprimir, con gzip y con brotli. Luego
+verifica por HTTP que cada combinación de Accept / Accept-Encoding se
+descomprima a la misma respuesta y que text/event-stream no se comprima.
+"""
+import gzip
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import Client, RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_cache
+from api.middleware import COMPRESION_POR_DEFECTO, CompresionMiddleware, brotli, compresores
+from api.renderers import JSONRapidoRenderer, MessagePackRenderer, msgpack
+
+URLS = ('/api/prestamos/', '/api/libros/')
+
+
+def medir(funcion, repeticiones):
+    """(mediana en ms, último resultado)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), resultado
+
+
+def descomprimir(contenido, codificacion):
+    if codificacion == 'gzip':
+        return gzip.decompress(contenido)
+    if codificacion == 'br':
+        return brotli.decompress(contenido)
+    return contenido
+
+
+class Command(BaseCommand):
+    help = 'Mide bytes y CPU de cada formato de respuesta con y sin compresión'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"msgpack: {'sí' if msgpack else 'no instalado'}, brotli: {'sí' if brotli else 'no instalado'}"
+        )
+        self.compresores = compresores(COMPRESION_POR_DEFECTO)
+        cliente = Client()
+        for url in URLS:
+            url = f'{url}?page_size={options["page_size"]}'
+            response = cliente.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url}: {response.status_code}')
+            self.medir_formatos(url, response.data, options['repeticiones'])
+            self.verificar_http(cliente, url)
+        self.verificar_event_stream()
+        self.stdout.write(self.style.SUCCESS('✓ Todas las respuestas comprimidas se descomprimen al mismo cuerpo'))
+
+    def formatos(self):
+        formatos = {
+            'json': lambda datos: JSONRapidoRenderer().render(datos),
+            'json indentado': lambda datos: JSONRenderer().render(datos, renderer_context={'indent': 4}),
+        }
+        if msgpack:
+            formatos['msgpack'] = lambda datos: MessagePackRenderer().render(datos)
+        return formatos
+
+    def medir_formatos(self, url, datos, repeticiones):
+        self.stdout.write(f'\nGET {url}')
+        self.stdout.write(f"{'formato':<16}{'codificación':<14}{'bytes':>10}{'render':>10}{'compresión':>12}{'total':>10}")
+        for formato, renderizar in self.formatos().items():
+            t_render, cuerpo = medir(lambda: renderizar(datos), repeticiones)
+            self.fila(formato, 'identity', len(cuerpo), t_render, 0.0)
+            for nombre, compresor in self.compresores.items():
+                t_compresion, comprimido = medir(lambda: compresor.comprimir(cuerpo), repeticiones)
+                self.fila(formato, nombre, len(comprimido), t_render, t_compresion)
+
+    def fila(self, formato, codificacion, tamano, t_render, t_compresion):
+        self.stdout.write(
+            f'{formato:<16}{codificacion:<14}{tamano:>10}{t_render:>8.1f}ms'
+            f'{t_compresion:>10.1f}ms{t_render + t_compresion:>8.1f}ms'
+        )
+
+    def verificar_http(self, cliente, url):
+        aceptados = ['application/json'] + (['application/msgpack'] if msgpack else [])
+        for accept in aceptados:
+            get_cache().invalidar('libros', 'usuarios')
+            esperado = cliente.get(url, HTTP_ACCEPT=accept).content
+            for nombre in self.compresores:
+                response = cliente.get(url, HTTP_ACCEPT=accept, HTTP_ACCEPT_ENCODING=nombre)
+                if response.get('Content-Encoding') != nombre:
+                    raise CommandError(f'GET {url} ({accept}): se esperaba Content-Encoding {nombre}')
+                if descomprimir(response.content, nombre) != esperado:
+                    raise CommandError(f'GET {url} ({accept}, {nombre}): el cuerpo descomprimido difiere')
+
+    def verificar_event_stream(self):
+        middleware = CompresionMiddleware(
+            lambda request: HttpResponse(b'data: {}\n\n' * 1000, content_type='text/event-stream')
+        )
+        response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br'))
+        if response.has_header('Content-Encoding'):
+            raise CommandError('text/event-stream no debe comprimirse')
@@ -0,0 +1,125 @@
+"""
+Prueba de Idempotency-Key: duplicados simultáneos de cada escritura
+Ejecutar: python manage.py benchmark_idempotencia --hilos 16
+
+Cada hilo envía el mismo POST con la misma clave al mismo tiempo (préstamo,
+renovación, devolución con multa y pago). Verifica que la operación se
+aplique una sola vez y que todos reciban la misma respuesta; luego mide
+cuánto tarda un reintento frente a la operación original. Los datos de
+prueba se eliminan al terminar.
+"""
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from api.models import Usuario, Libro, Prestamo, Multa, ClaveIdempotencia
+from api import estadisticas
+
+ISBN_PRUEBA = 'BENCH-IDEM'
+RUT_PRUEBA = 'BENCH-IDEM'
+PREFIJO_CLAVE = 'bench-'
+
+
+class Command(BaseCommand):
+    help = 'Verifica que los POST duplicados con Idempotency-Key se apliquen una sola vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=16)
+        parser.add_argument('--repeticiones', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.hilos = options['hilos']
+        self.limpiar()
+        libro = Libro.objects.create(
+            isbn=ISBN_PRUEBA, titulo='Libro de prueba de idempotencia', autor='Benchmark',
+            editorial='Benchmark', anio_publicacion=2024,
+            stock_total=options['repeticiones'] + 1, stock_disponible=options['repeticiones'] + 1
+        )
+        usuario = Usuario.objects.create(rut=RUT_PRUEBA, nombre='Usuario prueba', email='bench-idem@mail.com')
+        try:
+            self.probar(libro, usuario)
+            self.medir(libro, usuario, options['repeticiones'])
+        finally:
+            self.limpiar()
+            estadisticas.reconstruir()
+
+    def limpiar(self):
+        Libro.objects.filter(isbn=ISBN_PRUEBA).delete()
+        Usuario.objects.filter(rut=RUT_PRUEBA).delete()
+        ClaveIdempotencia.objects.filter(clave__startswith=PREFIJO_CLAVE).delete()
+
+    def post(self, url, datos=None, clave=None):
+        cliente = Client()
+        extra = {'HTTP_IDEMPOTENCY_KEY': clave} if clave else {}
+        try:
+            return cliente.post(url, json.dumps(datos or {}), content_type='application/json', **extra)
+        finally:
+            connection.close()
+
+    def duplicados(self, nombre, url, datos=None, esperado=200):
+        """Envía el mismo POST desde todos los hilos; retorna la respuesta común"""
+        clave = f'{PREFIJO_CLAVE}{uuid.uuid4()}'
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            respuestas = list(pool.map(lambda _: self.post(url, datos, clave), range(self.hilos)))
+
+        codigos = {r.status_code for r in respuestas}
+        cuerpos = {r.content for r in respuestas}
+        repetidas = sum(r.get('Idempotent-Replayed') == 'true' for r in respuestas)
+        if codigos != {esperado} or len(cuerpos) != 1 or repetidas != self.hilos - 1:
+            raise CommandError(
+                f'{nombre}: códigos {sorted(codigos)}, {len(cuerpos)} cuerpos distintos, {repetidas} repetidas'
+            )
+        self.stdout.write(f'  {nombre}: {self.hilos} envíos simultáneos, 1 ejecutado, {repetidas} repetidos')
+        return respuestas[0].json()
+
+    def probar(self, libro, usuario):
+        prestamo = self.duplicados(
+            'préstamo', '/api/prestamos/', {'usuario': usuario.pk, 'libro': libro.pk}, esperado=201
+        )
+        libro.refresh_from_db()
+        if Prestamo.objects.filter(libro=libro).count() != 1 or libro.stock_disponible != libro.stock_total - 1:
+            raise CommandError('préstamo: se creó más de un préstamo o se descontó stock de más')
+
+        self.duplicados('renovación', f'/api/prestamos/{prestamo["id"]}/renovar/')
+
+        # Vencido hace 5 días: la devolución genera una multa
+        Prestamo.objects.filter(pk=prestamo['id']).update(
+            fecha_devolucion_esperada=Prestamo.objects.get(pk=prestamo['id']).fecha_prestamo.date() - timedelta(days=5)
+        )
+        self.duplicados('devolución', f'/api/prestamos/{prestamo["id"]}/devolver/')
+        multas = list(Multa.objects.filter(prestamo_id=prestamo['id']))
+        libro.refresh_from_db()
+        if len(multas) != 1 or libro.stock_disponible != libro.stock_total:
+            raise CommandError('devolución: se generó más de una multa o se repuso stock de más')
+
+        self.duplicados('pago de multa', f'/api/multas/{multas[0].pk}/pagar/')
+        usuario.refresh_from_db()
+        if usuario.multas_pendientes or usuario.bloqueado:
+            raise CommandError('pago de multa: los contadores del usuario no cuadran')
+        Prestamo.objects.filter(pk=prestamo['id']).delete()
+        self.stdout.write(self.style.SUCCESS('✓ Cada operación se aplicó una sola vez'))
+
+    def medir(self, libro, usuario, repeticiones):
+        """Mediana de un préstamo con clave nueva frente a su reintento"""
+        originales, reintentos = [], []
+        for _ in range(repeticiones):
+            clave = f'{PREFIJO_CLAVE}{uuid.uuid4()}'
+            for tiempos in (originales, reintentos):
+                inicio = time.perf_counter()
+                response = self.post('/api/prestamos/', {'usuario': usuario.pk, 'libro': libro.pk}, clave)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                if response.status_code != 201:
+                    raise CommandError(f'préstamo: {response.status_code} {response.content!r}')
+            Prestamo.objects.filter(pk=response.json()['id']).update(estado='DEVUELTO')
+            Usuario.objects.filter(pk=usuario.pk).update(prestamos_activos=0)
+        original, reintento = statistics.median(originales), statistics.median(reintentos)
+        self.stdout.write(
+            f'Préstamo: {original:.1f} ms; reintento con la misma clave: {reintento:.1f} ms '
+            f'({original / reintento:.1f}x)'
+        )
@@ -0,0 +1,209 @@
+"""
+Prueba de concurrencia de préstamos: muchos hilos piden el mismo libro
+Ejecutar: python manage.py benchmark_reservas --hilos 16 --solicitudes 500 --stock 100
+Cola de reservas: python manage.py benchmark_reservas --cola 5000 --stock 50
+
+Verifica que nunca se presten más ejemplares que el stock y mide
+cuántos préstamos por segundo se procesan. Con --cola, miles de usuarios
+reservan un título sin stock y se verifica que cada ejemplar devuelto o
+expirado vaya a una sola reserva, en orden de llegada. Los datos de prueba
+se eliminan al terminar.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+from api.models import Usuario, Libro, Prestamo, Reserva
+from api import estadisticas, services
+
+ISBN_PRUEBA = 'BENCH-STOCK'
+ISBN_COLA = 'BENCH-COLA'
+
+
+class Command(BaseCommand):
+    help = 'Prueba de estrés de préstamos concurrentes sobre un mismo libro'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=16)
+        parser.add_argument('--solicitudes', type=int, default=500)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--cola', type=int, default=0, help='Probar la cola de reservas con N usuarios')
+
+    def handle(self, *args, **options):
+        if options['cola']:
+            try:
+                self.probar_cola(options['cola'], options['stock'], options['hilos'])
+            finally:
+                Libro.objects.filter(isbn=ISBN_COLA).delete()
+                Usuario.objects.filter(rut__startswith='BENCH-').delete()
+                estadisticas.reconstruir()
+            return
+
+        stock = options['stock']
+        Libro.objects.filter(isbn=ISBN_PRUEBA).delete()
+        libro = Libro.objects.create(
+            isbn=ISBN_PRUEBA, titulo='Libro de prueba de concurrencia', autor='Benchmark',
+            editorial='Benchmark', anio_publicacion=2024,
+            stock_total=stock, stock_disponible=stock
+        )
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(rut=f'BENCH-{i}', nombre=f'Usuario prueba {i}', email=f'bench{i}@mail.com')
+            for i in range(options['hilos'])
+        ])
+
+        def pedir(i):
+            try:
+                services.prestar_libro(usuarios[i % len(usuarios)], libro)
+                return 'ok'
+            except services.StockNoDisponible:
+                return 'sin_stock'
+            except OperationalError:
+                return 'bloqueo_bd'
+            finally:
+                connection.close()
+
+        try:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+                resultados = list(pool.map(pedir, range(options['solicitudes'])))
+            duracion = time.perf_counter() - inicio
+
+            libro.refresh_from_db()
+            prestados = Prestamo.objects.filter(libro=libro).count()
+            exitos = resultados.count('ok')
+
+            self.stdout.write(f'Solicitudes: {len(resultados)} en {duracion:.2f} s '
+                              f'({len(resultados) / duracion:.0f} solicitudes/s, '
+                              f'{exitos / duracion:.0f} préstamos/s)')
+            self.stdout.write(f'  Préstamos creados: {exitos}')
+            self.stdout.write(f'  Rechazados sin stock: {resultados.count("sin_stock")}')
+            self.stdout.write(f'  Errores por bloqueo de la BD: {resultados.count("bloqueo_bd")}')
+            self.stdout.write(f'  Stock final: {libro.stock_disponible} / {stock}')
+
+            if prestados != exitos or prestados + libro.stock_disponible != stock or libro.stock_disponible < 0:
+                raise CommandError('Inconsistencia de stock: se prestaron ejemplares de más')
+            self.stdout.write(self.style.SUCCESS('✓ Sin sobreventa de ejemplares'))
+        finally:
+            libro.delete()
+            Usuario.objects.filter(rut__startswith='BENCH-').delete()
+            estadisticas.reconstruir()
+
+    def en_paralelo(self, hilos, funcion, argumentos):
+        """Resultados de funcion(arg) en hilos; (resultados, segundos)"""
+        def ejecutar(argumento):
+            try:
+                return funcion(argumento)
+            except services.OperacionInvalida as e:
+                return str(e)
+            except OperationalError:
+                return 'bloqueo_bd'
+            finally:
+                connection.close()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            resultados = list(pool.map(ejecutar, argumentos))
+        return resultados, time.perf_counter() - inicio
+
+    def verificar(self, condicion, mensaje):
+        if not condicion:
+            raise CommandError(mensaje)
+        self.stdout.write(f'  ✓ {mensaje}')
+
+    def probar_cola(self, total, stock, hilos):
+        Libro.objects.filter(isbn=ISBN_COLA).delete()
+        libro = Libro.objects.create(
+            isbn=ISBN_COLA, titulo='Libro de prueba de reservas', autor='Benchmark',
+            editorial='Benchmark', anio_publicacion=2024, stock_total=stock, stock_disponible=stock
+        )
+        # Uno de cada 10 usuarios en espera está bloqueado: conserva su lugar pero no recibe ejemplares
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(rut=f'BENCH-C{i}', nombre=f'Usuario cola {i}', email=f'cola{i}@mail.com',
+                    bloqueado=i >= stock and i % 10 == 0)
+            for i in range(stock + total)
+        ])
+        lectores, en_espera = usuarios[:stock], usuarios[stock:]
+        prestamos = [services.prestar_libro(u, libro) for u in lectores]
+
+        # 1. Todos reservan a la vez (los bloqueados son rechazados), más un intento repetido por hilo
+        libro.refresh_from_db()
+        habilitados = [u for u in en_espera if not u.bloqueado]
+        intentos = habilitados + habilitados[:hilos]
+        resultados, duracion = self.en_paralelo(hilos, lambda u: services.reservar_libro(u, libro) and 'ok', intentos)
+        self.stdout.write(f'Reservas: {len(intentos)} solicitudes en {duracion:.2f} s ({len(intentos) / duracion:.0f}/s)')
+        self.verificar(resultados.count('bloqueo_bd') == 0, 'Sin errores por bloqueo de la BD')
+        self.verificar(resultados.count('ok') == len(habilitados), f'{len(habilitados)} reservas creadas, repetidas rechazadas')
+        cola = Reserva.objects.filter(libro=libro, estado='EN_ESPERA')
+        # Bloqueados con lugar en la cola: se les bloquea después de reservar
+        morosos = [r.usuario_id for r in cola.order_by('id')[:stock * 2:3]]
+        Usuario.objects.filter(pk__in=morosos).update(bloqueado=True)
+
+        # 2. Se devuelven todos los ejemplares a la vez mientras otros cancelan
+        canceladas = list(cola.order_by('-id')[:hilos])
+        trabajos = [('devolver', p) for p in prestamos] + [('cancelar', r) for r in canceladas]
+
+        def ejecutar(trabajo):
+            tipo, objeto = trabajo
+            if tipo == 'devolver':
+                services.registrar_devolucion(objeto)
+            else:
+                services.cancelar_reserva(objeto)
+            return 'ok'
+
+        inicio_asignacion = time.perf_counter()
+        resultados, duracion = self.en_paralelo(hilos, ejecutar, trabajos)
+        self.stdout.write(f'Devoluciones con asignación: {len(prestamos)} en {duracion:.2f} s '
+                          f'({len(prestamos) / duracion:.0f}/s con {cola.count()} reservas en espera)')
+        self.verificar(resultados.count('ok') == len(trabajos), 'Devoluciones y cancelaciones sin errores')
+        libro.refresh_from_db()
+        apartadas = Reserva.objects.filter(libro=libro, estado='DISPONIBLE')
+        self.verificar(libro.stock_disponible == 0 and apartadas.count() == stock,
+                       f'Los {stock} ejemplares devueltos quedaron apartados, ninguno volvió al stock')
+        self.verificar(not apartadas.filter(usuario__bloqueado=True).exists(), 'Ningún ejemplar para usuarios bloqueados')
+        ultimo_asignado = max(apartadas.values_list('pk', flat=True))
+        siguiente = cola.filter(usuario__bloqueado=False).order_by('id').values_list('pk', flat=True).first()
+        self.verificar(siguiente is None or siguiente > ultimo_asignado, 'Asignación en orden de llegada')
+
+        # 3. La mitad retira su ejemplar mientras vence el plazo de la otra mitad
+        retiran = list(apartadas.select_related('usuario')[:stock // 2])
+        Reserva.objects.filter(pk__in=apartadas.exclude(pk__in=[r.pk for r in retiran]).values('pk')).update(
+            fecha_limite_retiro=timezone.now() - timedelta(minutes=1)
+        )
+        trabajos = [('retirar', r) for r in retiran] + [('expirar', None)] * 4
+
+        def ejecutar(trabajo):
+            tipo, reserva = trabajo
+            if tipo == 'retirar':
+                services.prestar_libro(reserva.usuario, libro)
+            else:
+                services.expirar_reservas()
+            return 'ok'
+
+        resultados, duracion = self.en_paralelo(hilos, ejecutar, trabajos)
+        self.verificar(resultados.count('ok') == len(trabajos), 'Retiros y expiraciones sin errores')
+        libro.refresh_from_db()
+        activos = Prestamo.objects.filter(libro=libro, estado='ACTIVO').count()
+        apartadas = Reserva.objects.filter(libro=libro, estado='DISPONIBLE').count()
+        self.verificar(activos == len(retiran), f'{activos} préstamos desde reservas, sin descontar stock')
+        self.verificar(
+            activos + apartadas + libro.stock_disponible == stock,
+            f'Stock conservado: {activos} prestados + {apartadas} apartados + {libro.stock_disponible} disponibles = {stock}'
+        )
+        self.verificar(
+            Reserva.objects.filter(libro=libro, estado='EXPIRADA').count() == stock - len(retiran),
+            'Cada reserva vencida expiró una sola vez'
+        )
+
+        # Latencia de una asignación con la cola completa (recorrido del índice reserva_cola_idx)
+        inicio = time.perf_counter()
+        for _ in range(100):
+            Reserva.objects.filter(libro=libro, estado='EN_ESPERA', usuario__bloqueado=False).order_by('id').values_list(
+                'pk', flat=True
+            ).first()
+        self.stdout.write(f'Siguiente de la cola: {(time.perf_counter() - inicio) * 10:.2f} ms por consulta')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Cola de {total} reservas consistente ({time.perf_counter() - inicio_asignacion:.1f} s)'
+        ))
@@ -0,0 +1,123 @@
+"""
+Benchmark de serialización de listados: ModelSerializer + JSONRenderer
+vs SerializadorRapido (.values()) + JSONRapidoRenderer (orjson)
+Ejecutar: python manage.py benchmark_serializacion --filas 5000
+
+Para cada listado lee las mismas filas de las dos formas, verifica que el
+JSON generado sea idéntico byte a byte y mide la mediana de cada etapa.
+También compara las primeras páginas de cada endpoint con y sin el modo rápido,
+completas y con ?fields=, y el tamaño de cada respuesta.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_cache
+from api.renderers import JSONRapidoRenderer, orjson
+from api.serializacion import obtener_serializador_rapido
+from api.views import UsuarioViewSet, LibroViewSet, PrestamoViewSet, MultaViewSet
+
+VIEWSETS = {
+    'usuarios': UsuarioViewSet,
+    'libros': LibroViewSet,
+    'prestamos': PrestamoViewSet,
+    'multas': MultaViewSet,
+}
+
+# Proyecciones típicas del frontend (selectores y etiquetas de disponibilidad)
+PROYECCIONES = {
+    'usuarios': 'fields=id,nombre',
+    'libros': 'fields=isbn,titulo,disponible',
+    'prestamos': 'fields=id,libro_titulo,dias_retraso',
+    'multas': 'fields=id,monto_total,pagada',
+}
+
+
+def medir(funcion, repeticiones):
+    """(mediana en ms, último resultado)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), resultado
+
+
+class Command(BaseCommand):
+    help = 'Compara la serialización de listados de DRF con la serialización rápida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=5000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--paginas', type=int, default=3, help='Páginas por endpoint en la verificación HTTP')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"orjson: {'sí' if orjson else 'no instalado (se usa json)'}")
+        self.stdout.write(
+            f"{'listado':<11}{'filas':>7}{'drf db':>9}{'drf ser':>9}{'drf json':>9}"
+            f"{'ráp. db':>9}{'ráp. ser':>9}{'ráp. json':>10}{'total':>9}"
+        )
+        for nombre, viewset in VIEWSETS.items():
+            self.comparar(nombre, viewset, options['filas'], options['repeticiones'])
+        self.verificar_endpoints(options['paginas'])
+
+    def comparar(self, nombre, viewset, filas, repeticiones):
+        serializer_class = viewset(action='list').get_serializer_class()
+        rapido = obtener_serializador_rapido(serializer_class)
+        queryset = viewset.queryset.order_by('pk')[:filas]
+        filas_values = viewset.queryset.order_by('pk').values(*rapido.columnas)[:filas]
+
+        t_db, objetos = medir(lambda: list(queryset.all()), repeticiones)
+        t_ser, datos = medir(lambda: serializer_class(objetos, many=True).data, repeticiones)
+        t_json, esperado = medir(lambda: JSONRenderer().render(datos), repeticiones)
+
+        r_db, valores = medir(lambda: list(filas_values.all()), repeticiones)
+        r_ser, datos_rapidos = medir(lambda: rapido.serializar(valores), repeticiones)
+        r_json, obtenido = medir(lambda: JSONRapidoRenderer().render(datos_rapidos), repeticiones)
+
+        if obtenido != esperado:
+            raise CommandError(f'{nombre}: el JSON rápido difiere del de DRF')
+        antes, despues = t_db + t_ser + t_json, r_db + r_ser + r_json
+        self.stdout.write(
+            f'{nombre:<11}{len(objetos):>7}{t_db:>9.1f}{t_ser:>9.1f}{t_json:>9.1f}'
+            f'{r_db:>9.1f}{r_ser:>9.1f}{r_json:>10.1f}{antes / despues if despues else 0:>8.1f}x'
+        )
+
+    def verificar_endpoints(self, paginas):
+        """Mismo cuerpo HTTP (incluidos los cursores) con y sin ListaRapidaMixin"""
+        cliente = Client()
+        for nombre, viewset in VIEWSETS.items():
+            completo = self.verificar_paginas(cliente, viewset, f'/api/{nombre}/?page_size=100', paginas)
+            proyectado = self.verificar_paginas(
+                cliente, viewset, f'/api/{nombre}/?page_size=100&{PROYECCIONES[nombre]}', paginas
+            )
+            self.stdout.write(
+                f'  /api/{nombre}/?{PROYECCIONES[nombre]}: {proyectado / 1024:.1f} KB por página '
+                f'(completa {completo / 1024:.1f} KB)'
+            )
+        self.stdout.write(self.style.SUCCESS('✓ JSON idéntico en todos los listados y endpoints'))
+
+    def verificar_paginas(self, cliente, viewset, url, paginas):
+        """Compara las primeras `paginas` páginas; retorna el tamaño de la primera"""
+        tamano = None
+        for _ in range(paginas):
+            # Sin caché de lectura: cada modo arma su propia respuesta
+            get_cache().invalidar('libros', 'usuarios')
+            viewset.lista_rapida = False
+            try:
+                esperado = cliente.get(url).content
+            finally:
+                viewset.lista_rapida = True
+            get_cache().invalidar('libros', 'usuarios')
+            response = cliente.get(url)
+            if response.content != esperado:
+                raise CommandError(f'GET {url}: la respuesta rápida difiere')
+            if tamano is None:
+                tamano = len(response.content)
+            url = response.json()['next']
+            if not url:
+                break
+        return tamano
@@ -0,0 +1,140 @@
+"""
+Prueba del stream de cambios (Server-Sent Events) con muchos clientes
+Ejecutar (con el servidor ASGI corriendo sobre la misma base de datos):
+    uvicorn biblioteca_api.asgi:application --port 8001
+    python manage.py benchmark_stream --url http://127.0.0.1:8001/api --conexiones 5000
+
+Abre N conexiones a /api/async/stream/ (un libro y un usuario de prueba),
+presta y devuelve el libro --cambios veces desde este proceso y mide
+cuánto tarda cada cambio en llegar a todos los clientes. Verifica que
+cada cliente reciba cada cambio de stock y de préstamo en orden.
+"""
+import asyncio
+import json
+import time
+import urllib.parse
+from statistics import quantiles
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Usuario, Libro
+from api import estadisticas, services
+
+ISBN_PRUEBA = 'BENCH-SSE'
+RUT_PRUEBA = 'BENCH-SSE'
+
+
+class Cliente:
+    """Una conexión SSE: guarda (evento, datos, instante de llegada)"""
+
+    def __init__(self):
+        self.mensajes = []
+        self.conectado = asyncio.Event()
+
+    async def escuchar(self, host, puerto, ruta):
+        lector, escritor = await asyncio.open_connection(host, puerto)
+        escritor.write(f'GET {ruta} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        await escritor.drain()
+        estado = await lector.readline()
+        if b' 200 ' not in estado:
+            raise CommandError(f'El stream respondió {estado.decode().strip()}')
+        evento, datos = None, None
+        try:
+            async for linea in lector:
+                linea = linea.decode().rstrip('\r\n')
+                if linea.startswith('event: '):
+                    evento = linea[7:]
+                elif linea.startswith('data: '):
+                    datos = linea[6:]
+                elif not linea and evento:
+                    if evento == 'conectado':
+                        self.conectado.set()
+                    else:
+                        self.mensajes.append((evento, json.loads(datos), time.perf_counter()))
+                    evento, datos = None, None
+        finally:
+            escritor.close()
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de entrega del stream SSE con muchas conexiones abiertas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8001/api')
+        parser.add_argument('--conexiones', type=int, default=1000)
+        parser.add_argument('--cambios', type=int, default=10, help='Préstamos/devoluciones a difundir')
+        parser.add_argument('--pausa', type=float, default=1.0, help='Segundos entre cambios')
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        Libro.objects.filter(isbn=ISBN_PRUEBA).delete()
+        Usuario.objects.filter(rut=RUT_PRUEBA).delete()
+        libro = Libro.objects.create(
+            isbn=ISBN_PRUEBA, titulo='Libro de prueba del stream', autor='Benchmark',
+            editorial='Benchmark', anio_publicacion=2024, stock_total=1, stock_disponible=1
+        )
+        usuario = Usuario.objects.create(rut=RUT_PRUEBA, nombre='Usuario stream', email='sse@mail.com')
+        try:
+            asyncio.run(self.medir(options, libro, usuario))
+        finally:
+            libro.delete()
+            usuario.delete()
+            estadisticas.reconstruir()
+
+    async def medir(self, options, libro, usuario):
+        url = urllib.parse.urlsplit(options['url'])
+        ruta = f'{url.path.rstrip("/")}/async/stream/?libros={libro.isbn}&usuario={usuario.pk}'
+        clientes = [Cliente() for _ in range(options['conexiones'])]
+
+        inicio = time.perf_counter()
+        tareas = [asyncio.create_task(c.escuchar(url.hostname, url.port or 80, ruta)) for c in clientes]
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.conectado.wait() for c in clientes)), options['timeout'] * 3
+            )
+        except asyncio.TimeoutError:
+            fallidas = [t.exception() for t in tareas if t.done() and t.exception()]
+            raise CommandError(
+                f'{sum(c.conectado.is_set() for c in clientes)} de {len(clientes)} conexiones establecidas'
+                + (f' ({fallidas[0]})' if fallidas else '')
+            )
+        self.stdout.write(f'{len(clientes)} conexiones abiertas en {time.perf_counter() - inicio:.1f} s')
+
+        # Préstamo y devolución alternados: el stock pasa 1 -> 0 -> 1 ...
+        enviados = []
+        prestamo = None
+        for _ in range(options['cambios']):
+            await asyncio.sleep(options['pausa'])
+            enviados.append(time.perf_counter())
+            if prestamo is None:
+                prestamo = await sync_to_async(services.prestar_libro)(usuario, libro)
+            else:
+                await sync_to_async(services.registrar_devolucion)(prestamo)
+                prestamo = None
+        await asyncio.sleep(options['pausa'] + 1)
+        for tarea in tareas:
+            tarea.cancel()
+
+        self.verificar(clientes, enviados)
+
+    def verificar(self, clientes, enviados):
+        esperado_stock = [i % 2 == 1 for i in range(len(enviados))]
+        esperado_prestamos = ['ACTIVO' if i % 2 == 0 else 'DEVUELTO' for i in range(len(enviados))]
+        latencias = []
+        incompletos = 0
+        for cliente in clientes:
+            libros = [(datos, llegada) for evento, datos, llegada in cliente.mensajes if evento == 'libro']
+            prestamos = [datos['estado'] for evento, datos, _ in cliente.mensajes if evento == 'prestamo']
+            if [d['disponible'] for d, _ in libros] != esperado_stock or prestamos != esperado_prestamos:
+                incompletos += 1
+                continue
+            latencias += [(llegada - enviado) * 1000 for (_, llegada), enviado in zip(libros, enviados)]
+
+        if incompletos:
+            raise CommandError(f'{incompletos} de {len(clientes)} clientes no recibieron todos los cambios en orden')
+        p50, p95, p99 = (quantiles(latencias, n=100)[i] for i in (49, 94, 98))
+        self.stdout.write(
+            f'{len(latencias)} entregas de {len(enviados)} cambios: '
+            f'p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, máx. {max(latencias):.0f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS('✓ Todos los clientes recibieron cada cambio en orden'))
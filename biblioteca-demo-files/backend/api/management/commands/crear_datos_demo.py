@@ -2,6 +2,8 @@
 Comando para crear datos de demostración
 Ejecutar: python manage.py crear_datos_demo
 """
+from io import StringIO
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from api.models import Usuario, Libro, Prestamo
 from datetime import timedelta
@@ -117,6 +119,10 @@ class Command(BaseCommand):
         libros[1].stock_disponible -= 1
         libros[1].save()
         
+        # Los préstamos se crearon directamente: calcular contadores de usuarios y estadísticas
+        call_command('reconciliar_contadores', verbosity=0, stdout=StringIO())
+        call_command('reconstruir_estadisticas', verbosity=0, stdout=StringIO())
+        
         self.stdout.write(self.style.SUCCESS('✓ Datos de demostración creados exitosamente!'))
         self.stdout.write('')
         self.stdout.write('Resumen:')
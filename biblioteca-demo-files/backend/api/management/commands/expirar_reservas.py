@@ -0,0 +1,36 @@
+"""
+Comando para expirar las reservas no retiradas a tiempo
+Ejecutar: python manage.py expirar_reservas
+Programado: python manage.py expirar_reservas --cada 3600
+
+Cada ejemplar apartado cuyo plazo de retiro venció pasa a la siguiente
+reserva de la cola del libro, o vuelve al stock si no hay nadie esperando.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from api import services
+
+
+class Command(BaseCommand):
+    help = 'Expira las reservas apartadas no retiradas y reasigna sus ejemplares'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Reservas por consulta')
+        parser.add_argument('--cada', type=int, help='Repetir cada N segundos (modo programador)')
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.perf_counter()
+            total = 0
+            while True:
+                expiradas = services.expirar_reservas(limite=options['lote'])
+                total += expiradas
+                if expiradas < options['lote']:
+                    break
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {total} reservas expiradas ({time.perf_counter() - inicio:.1f} s)'
+            ))
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
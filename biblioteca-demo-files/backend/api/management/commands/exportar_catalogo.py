@@ -0,0 +1,37 @@
+"""
+Comando para exportar libros o usuarios a CSV o NDJSON
+Ejecutar: python manage.py exportar_catalogo libros catalogo.csv
+          python manage.py exportar_catalogo usuarios - --formato ndjson > usuarios.jsonl
+
+Recorre la tabla con un cursor del servidor y escribe por trozos; el
+archivo generado se puede volver a cargar con importar_catalogo.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from api import catalogo
+
+
+class Command(BaseCommand):
+    help = 'Exporta libros o usuarios a un archivo CSV o NDJSON sin cargarlos en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entidad', choices=sorted(catalogo.ESPECIFICACIONES))
+        parser.add_argument('archivo', help="Ruta del archivo, o '-' para la salida estándar")
+        parser.add_argument('--formato', choices=sorted(catalogo.FORMATOS), help='Por defecto, según la extensión')
+
+    def handle(self, *args, **options):
+        destino = options['archivo']
+        formato = options['formato'] or catalogo.detectar_formato(destino)
+        if formato is None:
+            raise CommandError('No se reconoce el formato; indíquelo con --formato')
+
+        trozos = catalogo.exportar(options['entidad'], formato)
+        if destino == '-':
+            for trozo in trozos:
+                sys.stdout.write(trozo)
+            return
+        with open(destino, 'w', encoding='utf-8', newline='') as salida:
+            for trozo in trozos:
+                salida.write(trozo)
+        self.stdout.write(self.style.SUCCESS(f'✓ {options["entidad"]} exportados a {destino}'))
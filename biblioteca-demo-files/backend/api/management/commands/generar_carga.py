@@ -0,0 +1,223 @@
+"""
+Comando para generar datos sintéticos a escala de producción
+Ejecutar: python manage.py generar_carga --usuarios 100000 --libros 1000000 --prestamos 10000000
+
+Inserta en lotes con bulk_create. Los datos generados usan RUT con prefijo
+'G' e ISBN con prefijo '000' (ningún ISBN-13 real lo usa), y se pueden borrar con --limpiar.
+Distribución de préstamos: 85% devueltos (10% de ellos con atraso y multa,
+97% de las multas pagadas), 10% activos y 5% vencidos.
+"""
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from io import StringIO
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from api.models import Usuario, Libro, Prestamo, Multa, PrestamoArchivado, MultaArchivada
+from api.signals import notificar_cambios
+from api.management.commands.benchmark_busqueda import APELLIDOS, EDITORIALES, NOMBRES, PALABRAS
+
+TIPOS_USUARIO = (['ESTUDIANTE'] * 16) + (['DOCENTE'] * 3) + ['BIBLIOTECARIO']
+CATEGORIAS = [codigo for codigo, _ in Libro.CATEGORIA_CHOICES]
+
+
+@contextmanager
+def fechas_manuales(modelo, campo):
+    """Desactiva auto_now_add para insertar fechas históricas"""
+    field = modelo._meta.get_field(campo)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Genera usuarios, libros, préstamos y multas sintéticos en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=100_000)
+        parser.add_argument('--libros', type=int, default=1_000_000)
+        parser.add_argument('--prestamos', type=int, default=10_000_000)
+        parser.add_argument('--lote', type=int, default=10_000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--limpiar', action='store_true', help='Solo borrar los datos generados')
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            self.limpiar()
+            return
+
+        if Usuario.objects.filter(rut__startswith='G').exists():
+            raise CommandError('Ya hay datos generados; bórrelos antes con --limpiar')
+
+        self.rnd = random.Random(options['semilla'])
+        self.lote = options['lote']
+        self.hoy = timezone.now().date()
+        inicio = perf_counter()
+
+        usuario_ids = self.generar_usuarios(options['usuarios'])
+        # Los préstamos sin devolver se reparten antes de insertar los libros,
+        # así el stock disponible queda consistente desde la inserción.
+        total_libros = options['libros']
+        stock_total = array('B', (self.rnd.randint(1, 5) for _ in range(total_libros)))
+        prestados = array('B', bytes(total_libros))
+        plan = self.planificar_prestamos(options['prestamos'], stock_total, prestados)
+        self.generar_libros(stock_total, prestados)
+        self.generar_prestamos(plan, usuario_ids, total_libros)
+
+        self.stdout.write('Calculando contadores de usuarios...')
+        call_command('reconciliar_contadores', stdout=StringIO())
+        Usuario.objects.filter(rut__startswith='G', multas_pendientes__gt=0).update(bloqueado=True)
+        self.stdout.write('Reconstruyendo estadísticas...')
+        call_command('reconstruir_estadisticas', stdout=StringIO())
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Carga generada en {perf_counter() - inicio:.0f} s'
+        ))
+
+    def limpiar(self):
+        # DELETE directo: .delete() del ORM emite señales fila por fila
+        generados = {
+            MultaArchivada: Q(prestamo__usuario__rut__startswith='G') | Q(prestamo__libro__isbn__startswith='000'),
+            PrestamoArchivado: Q(usuario__rut__startswith='G') | Q(libro__isbn__startswith='000'),
+            Multa: Q(prestamo__usuario__rut__startswith='G') | Q(prestamo__libro__isbn__startswith='000'),
+            Prestamo: Q(usuario__rut__startswith='G') | Q(libro__isbn__startswith='000'),
+            Usuario: Q(rut__startswith='G'),
+            Libro: Q(isbn__startswith='000'),
+        }
+        with transaction.atomic():
+            for modelo, filtro in generados.items():
+                modelo.objects.filter(pk__in=modelo.objects.filter(filtro).values('pk'))._raw_delete(modelo.objects.db)
+            notificar_cambios(*generados)
+        call_command('reconstruir_estadisticas', stdout=StringIO())
+        self.stdout.write(self.style.SUCCESS('✓ Datos generados eliminados'))
+
+    def isbn(self, indice):
+        return f'000{indice:010d}'
+
+    def en_lotes(self, total, crear):
+        """Llama a crear(desde, hasta) por cada lote, con avance en pantalla"""
+        for desde in range(0, total, self.lote):
+            hasta = min(desde + self.lote, total)
+            with transaction.atomic():
+                crear(desde, hasta)
+            if hasta % (self.lote * 10) == 0 or hasta == total:
+                self.stdout.write(f'    {hasta}/{total}')
+
+    def generar_usuarios(self, total):
+        self.stdout.write(f'Usuarios: {total}')
+        ids = array('q')
+
+        def crear(desde, hasta):
+            usuarios = Usuario.objects.bulk_create([
+                Usuario(
+                    rut=f'G{i:09d}-{i % 10}',
+                    nombre=f'{self.rnd.choice(NOMBRES)} {self.rnd.choice(APELLIDOS)}',
+                    email=f'usuario{i}@carga.cl',
+                    tipo_usuario=self.rnd.choice(TIPOS_USUARIO),
+                )
+                for i in range(desde, hasta)
+            ])
+            ids.extend(u.pk for u in usuarios)
+
+        self.en_lotes(total, crear)
+        return ids
+
+    def planificar_prestamos(self, total, stock_total, prestados):
+        """
+        Estado de cada préstamo (0 devuelto, 1 activo, 2 vencido) y, en orden,
+        el libro de cada préstamo sin devolver, sin superar el stock del libro.
+        """
+        estados = bytearray(total)
+        libros = array('I')
+        for i in range(total):
+            azar = self.rnd.random()
+            if azar < 0.85:
+                continue
+            indice = self.rnd.randrange(len(stock_total))
+            if prestados[indice] < stock_total[indice]:
+                prestados[indice] += 1
+                estados[i] = 1 if azar < 0.95 else 2
+                libros.append(indice)
+        return estados, libros
+
+    def generar_libros(self, stock_total, prestados):
+        total = len(stock_total)
+        self.stdout.write(f'Libros: {total}')
+
+        def crear(desde, hasta):
+            Libro.objects.bulk_create([
+                Libro(
+                    isbn=self.isbn(i),
+                    titulo=' '.join(self.rnd.sample(PALABRAS, self.rnd.randint(2, 4))).capitalize(),
+                    autor=f'{self.rnd.choice(NOMBRES)} {self.rnd.choice(APELLIDOS)}',
+                    editorial=self.rnd.choice(EDITORIALES),
+                    anio_publicacion=self.rnd.randint(1970, 2025),
+                    categoria=self.rnd.choice(CATEGORIAS),
+                    stock_total=stock_total[i],
+                    stock_disponible=stock_total[i] - prestados[i],
+                )
+                for i in range(desde, hasta)
+            ])
+
+        self.en_lotes(total, crear)
+
+    def generar_prestamos(self, plan, usuario_ids, total_libros):
+        estados, libros = plan
+        self.stdout.write(f'Préstamos: {len(estados)}')
+        libros_pendientes = iter(libros)
+
+        def crear(desde, hasta):
+            prestamos = []
+            multas = []
+            for i in range(desde, hasta):
+                if estados[i]:
+                    libro = next(libros_pendientes)
+                else:
+                    libro = self.rnd.randrange(total_libros)
+                prestamo = self.prestamo(estados[i], usuario_ids, libro)
+                if prestamo.estado == 'DEVUELTO':
+                    atraso = (prestamo.fecha_devolucion_real - prestamo.fecha_devolucion_esperada).days
+                    if atraso > 0:
+                        multas.append(Multa(
+                            prestamo=prestamo, dias_retraso=atraso, monto_total=atraso * 1000,
+                            pagada=self.rnd.random() < 0.97,
+                        ))
+                prestamos.append(prestamo)
+            Prestamo.objects.bulk_create(prestamos)
+            # bulk_create ya asignó el pk de cada préstamo a sus multas
+            Multa.objects.bulk_create(multas)
+
+        with fechas_manuales(Prestamo, 'fecha_prestamo'):
+            self.en_lotes(len(estados), crear)
+
+    def prestamo(self, estado, usuario_ids, libro):
+        rnd = self.rnd
+        plazo = rnd.choice((7, 14))
+        if estado == 0:
+            dias = rnd.randint(plazo + 1, 1500)
+        elif estado == 1:
+            dias = rnd.randint(0, plazo)
+        else:
+            dias = rnd.randint(plazo + 1, plazo + 60)
+        inicio = self.hoy - timedelta(days=dias)
+        esperada = inicio + timedelta(days=plazo)
+
+        prestamo = Prestamo(
+            usuario_id=usuario_ids[rnd.randrange(len(usuario_ids))],
+            libro_id=self.isbn(libro),
+            fecha_prestamo=timezone.make_aware(datetime.combine(inicio, time(rnd.randint(9, 19)))),
+            fecha_devolucion_esperada=esperada,
+            estado=('DEVUELTO', 'ACTIVO', 'VENCIDO')[estado],
+        )
+        if estado == 0:
+            atraso = rnd.randint(1, 30) if rnd.random() < 0.10 else 0
+            prestamo.fecha_devolucion_real = min(esperada + timedelta(days=atraso), self.hoy)
+        return prestamo
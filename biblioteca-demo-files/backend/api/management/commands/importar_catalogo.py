@@ -0,0 +1,54 @@
+"""
+Comando para importar libros o usuarios desde CSV o NDJSON
+Ejecutar: python manage.py importar_catalogo libros catalogo.csv
+          python manage.py importar_catalogo usuarios usuarios.jsonl --errores errores.jsonl
+
+Upsert por isbn (libros) o rut (usuarios) en lotes de --lote filas; el
+archivo se lee por líneas, así que su tamaño no limita la memoria.
+Columnas de libros: isbn, titulo, autor, editorial, anio_publicacion, [categoria], [stock_total]
+Columnas de usuarios: rut, nombre, email, [telefono], [tipo_usuario]
+"""
+import json
+import sys
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from api import catalogo
+
+
+class Command(BaseCommand):
+    help = 'Importa (upsert) libros o usuarios desde un archivo CSV o NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entidad', choices=sorted(catalogo.ESPECIFICACIONES))
+        parser.add_argument('archivo', help="Ruta del archivo, o '-' para la entrada estándar")
+        parser.add_argument('--formato', choices=sorted(catalogo.FORMATOS), help='Por defecto, según la extensión')
+        parser.add_argument('--lote', type=int, default=catalogo.LOTE)
+        parser.add_argument('--errores', help='Escribir todos los errores (una fila JSON por línea) en este archivo')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or catalogo.detectar_formato(options['archivo'])
+        if formato is None:
+            raise CommandError('No se reconoce el formato; indíquelo con --formato')
+
+        with ExitStack() as pila:
+            resultado = catalogo.ResultadoImportacion(max_detalle=20)
+            if options['errores']:
+                errores = pila.enter_context(open(options['errores'], 'w', encoding='utf-8'))
+                resultado.al_error = lambda error: errores.write(json.dumps(error, ensure_ascii=False) + '\n')
+            try:
+                archivo = sys.stdin if options['archivo'] == '-' else pila.enter_context(
+                    open(options['archivo'], encoding='utf-8-sig', newline='')
+                )
+            except OSError as e:
+                raise CommandError(f'No se pudo leer el archivo: {e}')
+            inicio = perf_counter()
+            catalogo.importar(archivo, formato, options['entidad'], options['lote'], resultado)
+
+        for error in resultado.detalle_errores:
+            self.stdout.write(f"  línea {error['linea']}: {json.dumps(error['errores'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {resultado.procesadas} filas en {perf_counter() - inicio:.1f} s: '
+            f'{resultado.creadas} creadas, {resultado.actualizadas} actualizadas, {resultado.errores} con errores'
+        ))
@@ -0,0 +1,74 @@
+"""
+Comando para marcar préstamos vencidos y bloquear a sus usuarios
+Ejecutar: python manage.py marcar_vencidos
+Programado: python manage.py marcar_vencidos --cada 86400
+
+Recorre los préstamos en lotes por id y guarda el avance en ProgresoTarea,
+así una ejecución interrumpida continúa desde el último lote confirmado.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from api.models import Prestamo, ProgresoTarea
+from api import services
+
+TAREA = 'marcar_vencidos'
+
+
+class Command(BaseCommand):
+    help = 'Marca como VENCIDO los préstamos activos atrasados y bloquea a sus usuarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Préstamos por transacción')
+        parser.add_argument('--cada', type=int, help='Repetir cada N segundos (modo programador)')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignorar el checkpoint guardado')
+
+    def handle(self, *args, **options):
+        while True:
+            self.barrer(options['lote'], options['reiniciar'])
+            if not options['cada']:
+                break
+            options['reiniciar'] = False
+            time.sleep(options['cada'])
+
+    def barrer(self, tamano_lote, reiniciar):
+        hoy = timezone.now().date()
+        progreso, _ = ProgresoTarea.objects.get_or_create(nombre=TAREA)
+        if reiniciar or progreso.completada or progreso.fecha_referencia != hoy:
+            # Nueva pasada; una pasada del mismo día sin terminar se retoma
+            progreso.ultimo_id = 0
+            progreso.procesados = 0
+            progreso.fecha_referencia = hoy
+            progreso.completada = False
+            progreso.save()
+        elif progreso.ultimo_id:
+            self.stdout.write(f'Retomando desde el préstamo {progreso.ultimo_id}')
+
+        pendientes = Prestamo.objects.filter(
+            estado='ACTIVO', fecha_devolucion_esperada__lt=hoy
+        ).order_by('pk')
+
+        inicio = time.perf_counter()
+        total_bloqueados = 0
+        while True:
+            ids = list(
+                pendientes.filter(pk__gt=progreso.ultimo_id).values_list('pk', flat=True)[:tamano_lote]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                vencidos, bloqueados = services.marcar_vencidos(ids, hoy)
+                progreso.ultimo_id = ids[-1]
+                progreso.procesados += vencidos
+                progreso.save(update_fields=['ultimo_id', 'procesados', 'actualizado'])
+            total_bloqueados += bloqueados
+            self.stdout.write(f'  Lote hasta id {ids[-1]}: {vencidos} vencidos')
+
+        progreso.completada = True
+        progreso.save(update_fields=['completada', 'actualizado'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {progreso.procesados} préstamos marcados como VENCIDO, '
+            f'{total_bloqueados} usuarios bloqueados ({time.perf_counter() - inicio:.1f} s)'
+        ))
@@ -0,0 +1,62 @@
+"""
+Comando para recalcular los contadores de multas y préstamos de cada usuario
+Ejecutar: python manage.py reconciliar_contadores [--solo-reportar]
+
+Compara los contadores guardados en Usuario con los calculados desde
+Prestamo y Multa, en lotes, y corrige las diferencias sumándolas con F()
+(services.ajustar_contadores): guardado y calculado salen de la misma
+consulta, así que un préstamo o pago concurrente no se pisa.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Usuario
+from api.services import CONTADORES, ajustar_contadores, contadores_calculados
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores desnormalizados de Usuario e informa las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+        parser.add_argument('--solo-reportar', action='store_true', help='No corregir, solo informar')
+
+    def handle(self, *args, **options):
+        ultimo_id = 0
+        revisados = 0
+        con_diferencias = 0
+        diferencia_total = dict.fromkeys(CONTADORES, 0)
+
+        while True:
+            usuarios = list(
+                contadores_calculados(Usuario.objects.filter(pk__gt=ultimo_id).order_by('pk'))
+                .only('pk', 'rut', *CONTADORES)[:options['lote']]
+            )
+            if not usuarios:
+                break
+            ultimo_id = usuarios[-1].pk
+            revisados += len(usuarios)
+
+            corregidos = {}
+            for usuario in usuarios:
+                diferencias = {
+                    campo: getattr(usuario, f'calculado_{campo}') - getattr(usuario, campo)
+                    for campo in CONTADORES
+                }
+                if not any(diferencias.values()):
+                    continue
+                con_diferencias += 1
+                for campo, diferencia in diferencias.items():
+                    diferencia_total[campo] += diferencia
+                corregidos[usuario.pk] = diferencias
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {usuario.rut}: {diferencias}')
+
+            if corregidos and not options['solo_reportar']:
+                with transaction.atomic():
+                    ajustar_contadores(corregidos)
+
+        self.stdout.write(f'Usuarios revisados: {revisados}, con diferencias: {con_diferencias}')
+        for campo, diferencia in diferencia_total.items():
+            self.stdout.write(f'  {campo}: {diferencia:+d}')
+        if con_diferencias and not options['solo_reportar']:
+            self.stdout.write(self.style.SUCCESS('✓ Contadores corregidos'))
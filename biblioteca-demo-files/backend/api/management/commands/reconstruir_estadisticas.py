@@ -0,0 +1,42 @@
+"""
+Comando para recalcular los rollups de estadísticas desde las tablas base
+Ejecutar: python manage.py reconstruir_estadisticas
+
+Necesario después de migrar (backfill), de cargas masivas o de cambios
+hechos fuera de api.services (admin, SQL directo).
+"""
+from django.core.management.base import BaseCommand
+from api import estadisticas
+from api.models import Estadistica
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla Estadistica a partir de préstamos, multas, usuarios y libros'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--solo-reportar', action='store_true', help='No reemplazar, solo informar diferencias')
+
+    def handle(self, *args, **options):
+        if options['solo_reportar']:
+            self.reportar()
+            return
+        filas = estadisticas.reconstruir(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'✓ {filas} filas de estadísticas reconstruidas'))
+
+    def reportar(self):
+        """Compara los totales actuales (suma de todas las fechas) con los recalculados"""
+        calculados = {}
+        for (_, dimension, clave), valor in estadisticas.calcular_desde_tablas().items():
+            calculados[(dimension, clave)] = calculados.get((dimension, clave), 0) + valor
+        guardados = {}
+        for fila in Estadistica.objects.values('dimension', 'clave', 'valor'):
+            clave = (fila['dimension'], fila['clave'])
+            guardados[clave] = guardados.get(clave, 0) + fila['valor']
+
+        diferencias = 0
+        for clave in sorted(set(calculados) | set(guardados)):
+            if calculados.get(clave, 0) != guardados.get(clave, 0):
+                diferencias += 1
+                self.stdout.write(f'  {clave[0]}/{clave[1]}: {guardados.get(clave, 0)} -> {calculados.get(clave, 0)}')
+        self.stdout.write(f'{diferencias} totales con diferencias')
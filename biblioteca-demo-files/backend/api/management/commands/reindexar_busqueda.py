@@ -0,0 +1,23 @@
+"""
+Comando para reconstruir el índice de búsqueda de libros
+Ejecutar: python manage.py reindexar_busqueda
+"""
+from django.core.management.base import BaseCommand
+from api.models import Libro
+from api.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda del catálogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        backend.reconstruir(using=using)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Índice {type(backend).__name__} reconstruido '
+            f'({Libro.objects.using(using).count()} libros)'
+        ))
@@ -0,0 +1,99 @@
+"""
+Métricas de la API en memoria del proceso
+Histogramas de tiempos por vista, exportados en formato de texto de Prometheus
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from .cache import get_cache
+
+# Límites superiores de los buckets, en segundos
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Componente -> (nombre de la métrica, descripción)
+HISTOGRAMAS = {
+    'total': ('api_request_seconds', 'Tiempo total del request'),
+    'db': ('api_db_seconds', 'Tiempo en la base de datos'),
+    'serializacion': ('api_serializacion_seconds', 'Tiempo de la vista fuera de la base de datos'),
+    'render': ('api_render_seconds', 'Tiempo de render de la respuesta'),
+}
+
+
+class Histograma:
+    def __init__(self):
+        self.conteos = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.cantidad = 0
+
+    def observar(self, valor):
+        self.conteos[bisect_left(BUCKETS, valor)] += 1
+        self.suma += valor
+        self.cantidad += 1
+
+    def acumulados(self):
+        total = 0
+        for limite, conteo in zip(BUCKETS + ('+Inf',), self.conteos):
+            total += conteo
+            yield limite, total
+
+
+class RegistroMetricas:
+    """Histogramas y contadores por (vista, método), seguros entre hilos"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histogramas = defaultdict(Histograma)
+        self.consultas = defaultdict(int)
+        self.respuestas = defaultdict(int)
+
+    def registrar(self, vista, metodo, status, consultas, tiempos):
+        with self.lock:
+            for componente, segundos in tiempos.items():
+                self.histogramas[(componente, vista, metodo)].observar(segundos)
+            self.consultas[(vista, metodo)] += consultas
+            self.respuestas[(vista, metodo, status)] += 1
+
+    def reiniciar(self):
+        with self.lock:
+            self.histogramas.clear()
+            self.consultas.clear()
+            self.respuestas.clear()
+
+    def prometheus(self):
+        """Texto en el formato de exposición de Prometheus (version 0.0.4)"""
+        with self.lock:
+            histogramas = sorted(self.histogramas.items())
+            consultas = sorted(self.consultas.items())
+            respuestas = sorted(self.respuestas.items())
+
+        lineas = []
+        for componente, (nombre, descripcion) in HISTOGRAMAS.items():
+            lineas += [f'# HELP {nombre} {descripcion}', f'# TYPE {nombre} histogram']
+            for (comp, vista, metodo), histograma in histogramas:
+                if comp != componente:
+                    continue
+                etiquetas = f'vista="{vista}",metodo="{metodo}"'
+                for limite, acumulado in histograma.acumulados():
+                    lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                lineas.append(f'{nombre}_sum{{{etiquetas}}} {histograma.suma:.6f}')
+                lineas.append(f'{nombre}_count{{{etiquetas}}} {histograma.cantidad}')
+
+        lineas += ['# HELP api_db_queries_total Consultas SQL ejecutadas', '# TYPE api_db_queries_total counter']
+        for (vista, metodo), cantidad in consultas:
+            lineas.append(f'api_db_queries_total{{vista="{vista}",metodo="{metodo}"}} {cantidad}')
+
+        lineas += ['# HELP api_responses_total Respuestas por código de estado', '# TYPE api_responses_total counter']
+        for (vista, metodo, status), cantidad in respuestas:
+            lineas.append(f'api_responses_total{{vista="{vista}",metodo="{metodo}",status="{status}"}} {cantidad}')
+
+        estadisticas = get_cache().estadisticas()
+        for clave, nombre in (('aciertos', 'api_cache_hits_total'), ('fallos', 'api_cache_misses_total')):
+            lineas += [f'# HELP {nombre} Lecturas del caché de la API ({clave})', f'# TYPE {nombre} counter']
+            for espacio, valores in estadisticas.items():
+                lineas.append(f'{nombre}{{espacio="{espacio}"}} {valores[clave]}')
+
+        return '\n'.join(lineas) + '\n'
+
+
+metricas = RegistroMetricas()
@@ -0,0 +1,472 @@
+"""
+Middleware de la API - Instrumentación de consultas SQL, perfilamiento por
+request y compresión de respuestas
+"""
+import cProfile
+import gzip
+import logging
+import random
+import threading
+import time
+import zlib
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from .metricas import metricas
+from .routers import lecturas_en_replica
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se ofrece gzip
+    brotli = None
+
+logger = logging.getLogger('api.consultas')
+
+PERFILAMIENTO_POR_DEFECTO = {
+    'ACTIVO': False,
+    'UMBRAL_LENTO_MS': 500,     # requests más lentos se guardan con cProfile
+    'MUESTREO': 0.05,           # fracción de requests que se perfilan
+    'DIRECTORIO': None,         # dónde guardar los .prof (por defecto BASE_DIR/perfiles)
+}
+
+COMPRESION_POR_DEFECTO = {
+    'ACTIVO': True,
+    'MIN_BYTES': 1024,          # respuestas más chicas se envían tal cual
+    'NIVEL_GZIP': 6,
+    'NIVEL_BROTLI': 4,          # 0-11; sobre 5 el costo de CPU sube mucho
+    'TIPOS': (
+        'application/json', 'application/x-ndjson', 'application/msgpack',
+        'text/csv', 'text/html', 'text/plain',
+    ),
+}
+
+
+class RegistroConsultas:
+    """Cuenta las consultas ejecutadas y el tiempo acumulado en la base de datos"""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.tiempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Los PRAGMA de una conexión nueva (api.signals) no son costo del request
+        if sql.startswith('PRAGMA'):
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.cantidad += 1
+
+    def activar(self):
+        """Registra el contador en todas las conexiones configuradas"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    async def aactivar(self):
+        """
+        Igual que activar() para código async: las conexiones son por hilo y
+        el ORM async ejecuta las consultas en el hilo de sync_to_async del request.
+        """
+        stack = await sync_to_async(self.activar)()
+        return sync_to_async(stack.close)
+
+
+class MiddlewareHibrido:
+    """
+    Base de los middleware de la API: funcionan con WSGI y con ASGI. Bajo
+    ASGI un middleware solo sync obligaría a ejecutar las vistas async en un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.procesar(request)
+
+    async def __acall__(self, request):
+        return await self.aprocesar(request)
+
+
+class ContadorConsultasMiddleware(MiddlewareHibrido):
+    """
+    Agrega X-Query-Count y X-DB-Time (ms) a cada respuesta y registra una
+    advertencia cuando un request excede su presupuesto de consultas: el de
+    la acción en `presupuesto_consultas` de la vista DRF que respondió
+    ({'create': 16, ...}) o, si no lo declara, API_PRESUPUESTO_CONSULTAS.
+    Una respuesta con sin_presupuesto = True (long-poll) no se revisa.
+    Los conteos exactos por endpoint los fija api.tests.PresupuestoConsultasTests.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.activo = getattr(settings, 'API_INSTRUMENTACION_CONSULTAS', settings.DEBUG)
+        self.presupuesto = getattr(settings, 'API_PRESUPUESTO_CONSULTAS', None)
+
+    def procesar(self, request):
+        if not self.activo:
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        with registro.activar():
+            response = self.get_response(request)
+        return self.agregar_headers(request, response, registro)
+
+    async def aprocesar(self, request):
+        if not self.activo:
+            return await self.get_response(request)
+
+        registro = RegistroConsultas()
+        desactivar = await registro.aactivar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await desactivar()
+        return self.agregar_headers(request, response, registro)
+
+    def agregar_headers(self, request, response, registro):
+        response['X-Query-Count'] = str(registro.cantidad)
+        response['X-DB-Time'] = f'{registro.tiempo * 1000:.2f}'
+
+        logger.debug(
+            '%s %s: %d consultas en %.2f ms',
+            request.method, request.path, registro.cantidad, registro.tiempo * 1000
+        )
+        presupuesto = self.presupuesto_de(response)
+        if presupuesto is not None and registro.cantidad > presupuesto:
+            logger.warning(
+                '%s %s excedió el presupuesto de consultas (%d > %d)',
+                request.method, request.path, registro.cantidad, presupuesto
+            )
+        return response
+
+    def presupuesto_de(self, response):
+        if getattr(response, 'sin_presupuesto', False):
+            return None
+        # Response de DRF: renderer_context trae la vista (y su acción)
+        contexto = getattr(response, 'renderer_context', None) or {}
+        vista = contexto.get('view')
+        presupuestos = getattr(vista, 'presupuesto_consultas', None) or {}
+        return presupuestos.get(getattr(vista, 'action', None), self.presupuesto)
+
+
+def _partes_en_replica(partes):
+    # Cada parte se genera dentro del contexto, sin dejarlo activo entre partes
+    partes = iter(partes)
+    while True:
+        with lecturas_en_replica():
+            try:
+                parte = next(partes)
+            except StopIteration:
+                return
+        yield parte
+
+
+async def _apartes_en_replica(partes):
+    partes = aiter(partes)
+    while True:
+        with lecturas_en_replica():
+            try:
+                parte = await anext(partes)
+            except StopAsyncIteration:
+                return
+        yield parte
+
+
+class ReplicaMiddleware(MiddlewareHibrido):
+    """
+    Los GET/HEAD de la API leen de la réplica (ver api.routers). El cuerpo de
+    una StreamingHttpResponse (?stream=ndjson, exportaciones) se genera
+    después de que el middleware retorna: se envuelve para que también lea
+    de la réplica.
+    """
+    metodos_lectura = ('GET', 'HEAD')
+
+    def usa_replica(self, request):
+        return request.method in self.metodos_lectura and request.path.startswith('/api/')
+
+    def procesar(self, request):
+        if not self.usa_replica(request):
+            return self.get_response(request)
+        with lecturas_en_replica():
+            return self.en_replica(self.get_response(request))
+
+    async def aprocesar(self, request):
+        if not self.usa_replica(request):
+            return await self.get_response(request)
+        with lecturas_en_replica():
+            return self.en_replica(await self.get_response(request))
+
+    def en_replica(self, response):
+        if response.streaming:
+            envolver = _apartes_en_replica if response.is_async else _partes_en_replica
+            response.streaming_content = envolver(response.streaming_content)
+        return response
+
+
+class Medicion:
+    """Marcas de tiempo de un request, en segundos de perf_counter"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.inicio_vista = None
+        self.fin_vista = None
+        self.fin_render = None
+
+
+class PerfilamientoMiddleware(MiddlewareHibrido):
+    """
+    Separa el tiempo de cada request en base de datos, serialización (resto
+    del tiempo de la vista) y render, y lo expone en el header Server-Timing.
+    Los tiempos se acumulan en histogramas por vista (ver /api/_metrics).
+
+    Una fracción de los requests (MUESTREO) se ejecuta con cProfile; si
+    superan UMBRAL_LENTO_MS el perfil queda en DIRECTORIO para analizarlo con
+    pstats o snakeviz (solo bajo WSGI: cProfile no sigue a las corrutinas).
+    Se configura con API_PERFILAMIENTO.
+    """
+
+    # cProfile no admite dos perfiles activos a la vez
+    lock_perfil = threading.Lock()
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = {**PERFILAMIENTO_POR_DEFECTO, **getattr(settings, 'API_PERFILAMIENTO', {})}
+        self.activo = config['ACTIVO']
+        self.umbral = config['UMBRAL_LENTO_MS'] / 1000
+        self.muestreo = config['MUESTREO']
+        self.directorio = Path(config['DIRECTORIO'] or settings.BASE_DIR / 'perfiles')
+
+    def procesar(self, request):
+        if not self.activo or request.path.endswith('/_metrics'):
+            return self.get_response(request)
+
+        request.medicion = medicion = Medicion()
+        registro = RegistroConsultas()
+        perfil = None
+        if random.random() < self.muestreo and self.lock_perfil.acquire(blocking=False):
+            perfil = cProfile.Profile()
+
+        try:
+            with registro.activar():
+                if perfil is None:
+                    response = self.get_response(request)
+                else:
+                    response = perfil.runcall(self.get_response, request)
+        finally:
+            if perfil is not None:
+                self.lock_perfil.release()
+
+        total = self.registrar(request, response, registro)
+        if perfil is not None and total >= self.umbral:
+            self.guardar_perfil(perfil, request.resolver_match, total)
+        return response
+
+    async def aprocesar(self, request):
+        if not self.activo or request.path.endswith('/_metrics'):
+            return await self.get_response(request)
+
+        request.medicion = Medicion()
+        registro = RegistroConsultas()
+        desactivar = await registro.aactivar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await desactivar()
+        self.registrar(request, response, registro)
+        return response
+
+    def registrar(self, request, response, registro):
+        """Server-Timing e histogramas; devuelve el tiempo total"""
+        medicion = request.medicion
+        total = time.perf_counter() - medicion.inicio
+        tiempos = self.tiempos(medicion, registro, total)
+        response['Server-Timing'] = ', '.join(
+            f'{componente};dur={segundos * 1000:.2f}' for componente, segundos in tiempos.items()
+        ) + f', consultas;desc="{registro.cantidad}"'
+
+        match = request.resolver_match
+        vista = match.view_name if match else 'sin_ruta'
+        metricas.registrar(vista, request.method, response.status_code, registro.cantidad, tiempos)
+        return total
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'medicion'):
+            request.medicion.inicio_vista = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Se llama justo antes de response.render() (Response de DRF)
+        medicion = getattr(request, 'medicion', None)
+        if medicion is not None:
+            medicion.fin_vista = time.perf_counter()
+            response.add_post_render_callback(
+                lambda _: setattr(medicion, 'fin_render', time.perf_counter())
+            )
+        return response
+
+    def tiempos(self, medicion, registro, total):
+        tiempos = {'total': total, 'db': registro.tiempo}
+        if medicion.inicio_vista is not None and medicion.fin_vista is not None:
+            vista = medicion.fin_vista - medicion.inicio_vista
+            tiempos['serializacion'] = max(vista - registro.tiempo, 0.0)
+        if medicion.fin_vista is not None and medicion.fin_render is not None:
+            tiempos['render'] = medicion.fin_render - medicion.fin_vista
+        return tiempos
+
+    def guardar_perfil(self, perfil, match, total):
+        vista = match.view_name if match else 'sin_ruta'
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        archivo = self.directorio / f'{time.strftime("%Y%m%d-%H%M%S")}_{vista}_{total * 1000:.0f}ms.prof'
+        perfil.dump_stats(archivo)
+        logger.warning('Request lento en %s (%.0f ms), perfil guardado en %s', vista, total * 1000, archivo)
+
+
+class Gzip:
+    nombre = 'gzip'
+
+    def __init__(self, nivel):
+        self.nivel = nivel
+
+    def comprimir(self, datos):
+        return gzip.compress(datos, compresslevel=self.nivel, mtime=0)
+
+    def comprimir_flujo(self, partes):
+        # 16 + MAX_WBITS: formato gzip; sin flush por parte para no perder compresión
+        compresor = zlib.compressobj(self.nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for parte in partes:
+            salida = compresor.compress(parte)
+            if salida:
+                yield salida
+        yield compresor.flush()
+
+
+class Brotli:
+    nombre = 'br'
+
+    def __init__(self, nivel):
+        self.nivel = nivel
+
+    def comprimir(self, datos):
+        return brotli.compress(datos, quality=self.nivel)
+
+    def comprimir_flujo(self, partes):
+        compresor = brotli.Compressor(quality=self.nivel)
+        for parte in partes:
+            salida = compresor.process(parte)
+            if salida:
+                yield salida
+        yield compresor.finish()
+
+
+def compresores(config):
+    """Codificaciones disponibles, en orden de preferencia del servidor"""
+    disponibles = {}
+    if brotli is not None:
+        disponibles[Brotli.nombre] = Brotli(config['NIVEL_BROTLI'])
+    disponibles[Gzip.nombre] = Gzip(config['NIVEL_GZIP'])
+    return disponibles
+
+
+def elegir_codificacion(accept_encoding, disponibles):
+    """
+    La codificación de Accept-Encoding con mayor q entre las disponibles;
+    a igual q gana el orden de `disponibles`. None: sin comprimir.
+    """
+    aceptadas = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.partition(';')
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip().lower()] = q
+
+    elegida, mejor = None, 0.0
+    for nombre in disponibles:
+        q = aceptadas.get(nombre, aceptadas.get('*', 0.0))
+        if q > mejor:
+            elegida, mejor = nombre, q
+    return elegida
+
+
+class CompresionMiddleware(MiddlewareHibrido):
+    """
+    Comprime con brotli (si está instalado) o gzip según Accept-Encoding las
+    respuestas de los tipos de TIPOS que superan MIN_BYTES; los listados en
+    streaming se comprimen parte por parte. text/event-stream nunca se
+    comprime: el navegador recibiría los eventos recién al llenarse el buffer.
+    El tiempo de compresión se agrega a Server-Timing. Se configura con API_COMPRESION.
+    """
+    excluidos = ('text/event-stream',)
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = {**COMPRESION_POR_DEFECTO, **getattr(settings, 'API_COMPRESION', {})}
+        self.activo = config['ACTIVO']
+        self.minimo = config['MIN_BYTES']
+        self.tipos = tuple(config['TIPOS'])
+        self.compresores = compresores(config)
+
+    def procesar(self, request):
+        return self.comprimir(request, self.get_response(request))
+
+    async def aprocesar(self, request):
+        return self.comprimir(request, await self.get_response(request))
+
+    def comprimible(self, response):
+        if not self.activo or response.has_header('Content-Encoding'):
+            return False
+        tipo = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if tipo in self.excluidos or tipo not in self.tipos:
+            return False
+        if response.streaming:
+            # Los iteradores async se envían tal cual
+            return not response.is_async
+        return len(response.content) >= self.minimo
+
+    def comprimir(self, request, response):
+        if not self.comprimible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        nombre = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.compresores)
+        if nombre is None:
+            return response
+        compresor = self.compresores[nombre]
+
+        if response.streaming:
+            response.streaming_content = compresor.comprimir_flujo(response.streaming_content)
+            del response['Content-Length']
+        else:
+            inicio = time.perf_counter()
+            comprimido = compresor.comprimir(response.content)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response['Content-Length'] = str(len(comprimido))
+            if response.has_header('Server-Timing'):
+                duracion = (time.perf_counter() - inicio) * 1000
+                response['Server-Timing'] += f', compresion;dur={duracion:.2f}'
+
+        # Los bytes cambian: el ETag fuerte pasa a débil (los 304 siguen funcionando)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = nombre
+        return response
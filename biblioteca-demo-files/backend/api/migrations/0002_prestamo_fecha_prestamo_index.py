@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prestamo',
+            name='fecha_prestamo',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
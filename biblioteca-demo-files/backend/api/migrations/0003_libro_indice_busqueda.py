@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# SQL copiado aquí y no importado de api.search: la migración no debe
+# cambiar si después cambia el código de la aplicación
+SQL_CREAR_INDICE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_libro_fts USING fts5(
+        titulo, autor, editorial, isbn,
+        content='api_libro', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_ai AFTER INSERT ON api_libro BEGIN
+        INSERT INTO api_libro_fts(rowid, titulo, autor, editorial, isbn)
+        VALUES (new.rowid, new.titulo, new.autor, new.editorial, new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_ad AFTER DELETE ON api_libro BEGIN
+        INSERT INTO api_libro_fts(api_libro_fts, rowid, titulo, autor, editorial, isbn)
+        VALUES ('delete', old.rowid, old.titulo, old.autor, old.editorial, old.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_au
+    AFTER UPDATE OF titulo, autor, editorial, isbn ON api_libro BEGIN
+        INSERT INTO api_libro_fts(api_libro_fts, rowid, titulo, autor, editorial, isbn)
+        VALUES ('delete', old.rowid, old.titulo, old.autor, old.editorial, old.isbn);
+        INSERT INTO api_libro_fts(rowid, titulo, autor, editorial, isbn)
+        VALUES (new.rowid, new.titulo, new.autor, new.editorial, new.isbn);
+    END
+    """,
+]
+
+SQL_ELIMINAR_INDICE = [
+    'DROP TRIGGER IF EXISTS api_libro_fts_au',
+    'DROP TRIGGER IF EXISTS api_libro_fts_ad',
+    'DROP TRIGGER IF EXISTS api_libro_fts_ai',
+    'DROP TABLE IF EXISTS api_libro_fts',
+]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_CREAR_INDICE:
+        schema_editor.execute(sql)
+    # Indexar los libros existentes
+    schema_editor.execute("INSERT INTO api_libro_fts(api_libro_fts) VALUES ('rebuild')")
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_ELIMINAR_INDICE:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_prestamo_fecha_prestamo_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_libro_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgresoTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('fecha_referencia', models.DateField(blank=True, null=True)),
+                ('completada', models.BooleanField(default=False)),
+                ('procesados', models.BigIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Progreso de tarea',
+                'verbose_name_plural': 'Progreso de tareas',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_progresotarea'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['titulo'], name='libro_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['categoria', 'titulo'], name='libro_categoria_titulo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multa',
+            index=models.Index(condition=models.Q(('pagada', False)), fields=['prestamo'], name='multa_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', '-fecha_prestamo'], name='prestamo_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['usuario', 'estado'], name='prestamo_usuario_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('estado', 'ACTIVO')), fields=['fecha_devolucion_esperada'], name='prestamo_activo_vence_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 16:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_contadores(apps, schema_editor):
+    Usuario = apps.get_model('api', 'Usuario')
+    Prestamo = apps.get_model('api', 'Prestamo')
+    Multa = apps.get_model('api', 'Multa')
+
+    activos = Prestamo.objects.filter(usuario=OuterRef('pk')).exclude(estado='DEVUELTO')
+    pendientes = Multa.objects.filter(prestamo__usuario=OuterRef('pk'), pagada=False)
+    Usuario.objects.update(
+        prestamos_activos=Coalesce(Subquery(
+            activos.values('usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        multas_pendientes=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        monto_pendiente=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(m=Sum('monto_total')).values('m')
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='monto_pendiente',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='multas_pendientes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='prestamos_activos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(calcular_contadores, migrations.RunPython.noop),
+    ]
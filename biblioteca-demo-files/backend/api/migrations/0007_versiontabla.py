@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 16:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def crear_versiones(apps, schema_editor):
+    VersionTabla = apps.get_model('api', 'VersionTabla')
+    VersionTabla.objects.bulk_create([
+        VersionTabla(tabla=tabla) for tabla in ('usuario', 'libro', 'prestamo', 'multa')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_usuario_contadores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionTabla',
+            fields=[
+                ('tabla', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modificado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Versión de tabla',
+                'verbose_name_plural': 'Versiones de tablas',
+            },
+        ),
+        migrations.RunPython(crear_versiones, migrations.RunPython.noop),
+    ]
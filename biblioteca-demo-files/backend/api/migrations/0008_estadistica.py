@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_versiontabla'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Estadistica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('dimension', models.CharField(max_length=20)),
+                ('clave', models.CharField(max_length=20)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Estadística',
+                'verbose_name_plural': 'Estadísticas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='estadistica',
+            index=models.Index(fields=['dimension', 'fecha'], name='estadistica_dimension_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='estadistica',
+            constraint=models.UniqueConstraint(fields=('fecha', 'dimension', 'clave'), name='estadistica_unica'),
+        ),
+    ]
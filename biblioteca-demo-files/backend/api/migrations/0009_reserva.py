@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-18 16:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def crear_version(apps, schema_editor):
+    VersionTabla = apps.get_model('api', 'VersionTabla')
+    VersionTabla.objects.using(schema_editor.connection.alias).get_or_create(tabla='reserva')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_estadistica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('EN_ESPERA', 'En espera'), ('DISPONIBLE', 'Disponible para retiro'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada'), ('EXPIRADA', 'Expirada')], default='EN_ESPERA', max_length=10)),
+                ('fecha_reserva', models.DateTimeField(auto_now_add=True)),
+                ('fecha_asignacion', models.DateTimeField(blank=True, null=True)),
+                ('fecha_limite_retiro', models.DateTimeField(blank=True, null=True)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='api.libro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='api.usuario')),
+            ],
+            options={
+                'verbose_name': 'Reserva',
+                'verbose_name_plural': 'Reservas',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['libro', 'estado', 'id'], name='reserva_cola_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['estado', 'fecha_limite_retiro'], name='reserva_retiro_vence_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['EN_ESPERA', 'DISPONIBLE'])), fields=('usuario', 'libro'), name='reserva_activa_unica'),
+        ),
+        migrations.RunPython(crear_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 16:49
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def crear_version(apps, schema_editor):
+    VersionTabla = apps.get_model('api', 'VersionTabla')
+    VersionTabla.objects.using(schema_editor.connection.alias).get_or_create(tabla='evento')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_reserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Evento',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('PRESTAMO_CREADO', 'Préstamo creado'), ('PRESTAMO_RENOVADO', 'Préstamo renovado'), ('PRESTAMO_VENCIDO', 'Préstamo vencido'), ('PRESTAMO_DEVUELTO', 'Préstamo devuelto'), ('MULTA_GENERADA', 'Multa generada'), ('MULTA_PAGADA', 'Multa pagada'), ('MULTA_ELIMINADA', 'Multa eliminada'), ('USUARIO_BLOQUEADO', 'Usuario bloqueado'), ('USUARIO_DESBLOQUEADO', 'Usuario desbloqueado')], max_length=20)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.IntegerField(blank=True, null=True)),
+                ('libro', models.CharField(blank=True, max_length=13, null=True)),
+                ('prestamo', models.IntegerField(blank=True, null=True)),
+                ('multa', models.IntegerField(blank=True, null=True)),
+                ('datos', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'verbose_name': 'Evento',
+                'verbose_name_plural': 'Eventos',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(crear_version, migrations.RunPython.noop),
+    ]
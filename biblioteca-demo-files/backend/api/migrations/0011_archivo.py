@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 17:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_evento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrestamoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_prestamo', models.DateTimeField()),
+                ('fecha_devolucion_esperada', models.DateField()),
+                ('fecha_devolucion_real', models.DateField()),
+                ('estado', models.CharField(choices=[('ACTIVO', 'Activo'), ('DEVUELTO', 'Devuelto'), ('VENCIDO', 'Vencido')], default='DEVUELTO', max_length=10)),
+                ('renovado', models.BooleanField(default=False)),
+                ('fecha_archivado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_archivados', to='api.libro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prestamos_archivados', to='api.usuario')),
+            ],
+            options={
+                'verbose_name': 'Préstamo archivado',
+                'verbose_name_plural': 'Préstamos archivados',
+                'ordering': ['-fecha_prestamo'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MultaArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('dias_retraso', models.IntegerField()),
+                ('monto_por_dia', models.IntegerField()),
+                ('monto_total', models.IntegerField()),
+                ('pagada', models.BooleanField(default=True)),
+                ('fecha_generacion', models.DateTimeField()),
+                ('fecha_pago', models.DateTimeField(blank=True, null=True)),
+                ('prestamo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='multa', to='api.prestamoarchivado')),
+            ],
+            options={
+                'verbose_name': 'Multa archivada',
+                'verbose_name_plural': 'Multas archivadas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='prestamoarchivado',
+            index=models.Index(fields=['usuario', '-fecha_prestamo', '-id'], name='archivado_usuario_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_archivo'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='prestamo',
+            name='prestamo_activo_vence_idx',
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_devolucion_esperada'], name='prestamo_estado_vence_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evento',
+            name='tipo',
+            field=models.CharField(choices=[('PRESTAMO_CREADO', 'Préstamo creado'), ('PRESTAMO_RENOVADO', 'Préstamo renovado'), ('PRESTAMO_VENCIDO', 'Préstamo vencido'), ('PRESTAMO_DEVUELTO', 'Préstamo devuelto'), ('MULTA_GENERADA', 'Multa generada'), ('MULTA_PAGADA', 'Multa pagada'), ('MULTA_ELIMINADA', 'Multa eliminada'), ('USUARIO_BLOQUEADO', 'Usuario bloqueado'), ('USUARIO_DESBLOQUEADO', 'Usuario desbloqueado'), ('STOCK_ACTUALIZADO', 'Stock actualizado')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+# 0006 y 0007 escriben con los managers sin .using(): con `migrate --database
+# replica` los contadores y las versiones de tabla iban a 'default' y la base
+# migrada quedaba sin ellos. Se recalculan y se crean en la base que se migra;
+# en una base que ya los tiene no cambia nada.
+
+
+def recalcular_contadores(apps, schema_editor):
+    Usuario = apps.get_model('api', 'Usuario')
+    Prestamo = apps.get_model('api', 'Prestamo')
+    Multa = apps.get_model('api', 'Multa')
+
+    activos = Prestamo.objects.filter(usuario=OuterRef('pk')).exclude(estado='DEVUELTO')
+    pendientes = Multa.objects.filter(prestamo__usuario=OuterRef('pk'), pagada=False)
+    Usuario.objects.using(schema_editor.connection.alias).update(
+        prestamos_activos=Coalesce(Subquery(
+            activos.values('usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        multas_pendientes=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        monto_pendiente=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(m=Sum('monto_total')).values('m')
+        ), 0),
+    )
+
+
+def crear_versiones(apps, schema_editor):
+    VersionTabla = apps.get_model('api', 'VersionTabla')
+    VersionTabla.objects.using(schema_editor.connection.alias).bulk_create([
+        VersionTabla(tabla=tabla) for tabla in ('usuario', 'libro', 'prestamo', 'multa')
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_evento_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular_contadores, migrations.RunPython.noop),
+        migrations.RunPython(crear_versiones, migrations.RunPython.noop),
+    ]
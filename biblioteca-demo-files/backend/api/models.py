@@ -1,6 +1,7 @@
 """
 Modelos de la Base de Datos - Sistema de Gestión de Biblioteca
 """
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
@@ -20,6 +21,10 @@ class Usuario(models.Model):
     tipo_usuario = models.CharField(max_length=15, choices=TIPO_CHOICES, default='ESTUDIANTE')
     bloqueado = models.BooleanField(default=False)
     fecha_registro = models.DateTimeField(auto_now_add=True)
+    # Contadores mantenidos por api.services (reconciliar_contadores los recalcula)
+    prestamos_activos = models.IntegerField(default=0)
+    multas_pendientes = models.IntegerField(default=0)
+    monto_pendiente = models.IntegerField(default=0)
     
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
@@ -27,7 +32,11 @@ class Usuario(models.Model):
     @property
     def dias_prestamo(self):
         """Estudiantes: 7 días, Docentes: 14 días"""
-        return 14 if self.tipo_usuario == 'DOCENTE' else 7
+        return self.dias_prestamo_de(self.tipo_usuario)
+    
+    @staticmethod
+    def dias_prestamo_de(tipo_usuario):
+        return 14 if tipo_usuario == 'DOCENTE' else 7
     
     class Meta:
         verbose_name = 'Usuario'
@@ -64,6 +73,10 @@ class Libro(models.Model):
     class Meta:
         verbose_name = 'Libro'
         verbose_name_plural = 'Libros'
+        indexes = [
+            models.Index(fields=['titulo'], name='libro_titulo_idx'),
+            models.Index(fields=['categoria', 'titulo'], name='libro_categoria_titulo_idx'),
+        ]
 
 
 class Prestamo(models.Model):
@@ -76,7 +89,7 @@ class Prestamo(models.Model):
     
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='prestamos')
     libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='prestamos')
-    fecha_prestamo = models.DateTimeField(auto_now_add=True)
+    fecha_prestamo = models.DateTimeField(auto_now_add=True, db_index=True)
     fecha_devolucion_esperada = models.DateField()
     fecha_devolucion_real = models.DateField(null=True, blank=True)
     estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='ACTIVO')
@@ -94,19 +107,33 @@ class Prestamo(models.Model):
     @property
     def dias_retraso(self):
         """Calcula días de retraso si el préstamo está vencido"""
-        if self.estado == 'DEVUELTO' and self.fecha_devolucion_real:
-            if self.fecha_devolucion_real > self.fecha_devolucion_esperada:
-                return (self.fecha_devolucion_real - self.fecha_devolucion_esperada).days
-        elif self.estado == 'ACTIVO':
-            hoy = timezone.now().date()
-            if hoy > self.fecha_devolucion_esperada:
-                return (hoy - self.fecha_devolucion_esperada).days
+        return self.calcular_dias_retraso(
+            self.estado, self.fecha_devolucion_esperada, self.fecha_devolucion_real, timezone.now().date()
+        )
+    
+    @staticmethod
+    def calcular_dias_retraso(estado, fecha_devolucion_esperada, fecha_devolucion_real, hoy):
+        """También usado por api.serializacion sobre filas de .values()"""
+        if estado == 'DEVUELTO' and fecha_devolucion_real:
+            if fecha_devolucion_real > fecha_devolucion_esperada:
+                return (fecha_devolucion_real - fecha_devolucion_esperada).days
+        elif estado in ('ACTIVO', 'VENCIDO'):
+            if hoy > fecha_devolucion_esperada:
+                return (hoy - fecha_devolucion_esperada).days
         return 0
     
     class Meta:
         verbose_name = 'Préstamo'
         verbose_name_plural = 'Préstamos'
         ordering = ['-fecha_prestamo']
+        indexes = [
+            models.Index(fields=['estado', '-fecha_prestamo'], name='prestamo_estado_fecha_idx'),
+            models.Index(fields=['usuario', 'estado'], name='prestamo_usuario_estado_idx'),
+            # Préstamos por estado y fecha de vencimiento (barrido de vencidos y
+            # ?vencidos=true). Completo y no parcial: SQLite no usa un índice
+            # parcial si el estado llega como parámetro de la consulta.
+            models.Index(fields=['estado', 'fecha_devolucion_esperada'], name='prestamo_estado_vence_idx'),
+        ]
 
 
 class Multa(models.Model):
@@ -130,4 +157,233 @@ class Multa(models.Model):
     
     class Meta:
         verbose_name = 'Multa'
-        verbose_name_plural = 'Multas'
\ No newline at end of file
+        verbose_name_plural = 'Multas'
+        indexes = [
+            # Multas pendientes por préstamo (conteo de multas de un usuario)
+            models.Index(fields=['prestamo'], condition=models.Q(pagada=False), name='multa_pendiente_idx'),
+        ]
+
+
+class PrestamoArchivado(models.Model):
+    """
+    Préstamo DEVUELTO movido fuera de Prestamo por archivar_historial, con
+    el mismo id. Solo lectura: GET /api/usuarios/{id}/historial/ lo muestra
+    junto con los préstamos vigentes. Ver api.archivo.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='prestamos_archivados')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='prestamos_archivados')
+    fecha_prestamo = models.DateTimeField()
+    fecha_devolucion_esperada = models.DateField()
+    fecha_devolucion_real = models.DateField()
+    estado = models.CharField(max_length=10, choices=Prestamo.ESTADO_CHOICES, default='DEVUELTO')
+    renovado = models.BooleanField(default=False)
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Préstamo archivado #{self.id}"
+    
+    @property
+    def dias_retraso(self):
+        return Prestamo.calcular_dias_retraso(
+            self.estado, self.fecha_devolucion_esperada, self.fecha_devolucion_real, timezone.now().date()
+        )
+    
+    class Meta:
+        verbose_name = 'Préstamo archivado'
+        verbose_name_plural = 'Préstamos archivados'
+        ordering = ['-fecha_prestamo']
+        indexes = [
+            # Historial de un usuario, en el orden de la paginación
+            models.Index(fields=['usuario', '-fecha_prestamo', '-id'], name='archivado_usuario_fecha_idx'),
+        ]
+
+
+class MultaArchivada(models.Model):
+    """Multa pagada de un préstamo archivado (mismo id que tenía en Multa)"""
+    id = models.BigIntegerField(primary_key=True)
+    prestamo = models.OneToOneField(PrestamoArchivado, on_delete=models.CASCADE, related_name='multa')
+    dias_retraso = models.IntegerField()
+    monto_por_dia = models.IntegerField()
+    monto_total = models.IntegerField()
+    pagada = models.BooleanField(default=True)
+    fecha_generacion = models.DateTimeField()
+    fecha_pago = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Multa archivada ${self.monto_total}"
+    
+    class Meta:
+        verbose_name = 'Multa archivada'
+        verbose_name_plural = 'Multas archivadas'
+
+
+class Reserva(models.Model):
+    """
+    Cola de espera por un libro sin stock. Al devolverse un ejemplar,
+    api.services lo aparta para la reserva más antigua (EN_ESPERA -> DISPONIBLE)
+    y el usuario tiene hasta fecha_limite_retiro para retirarlo.
+    """
+    ESTADO_CHOICES = [
+        ('EN_ESPERA', 'En espera'),
+        ('DISPONIBLE', 'Disponible para retiro'),
+        ('COMPLETADA', 'Completada'),
+        ('CANCELADA', 'Cancelada'),
+        ('EXPIRADA', 'Expirada'),
+    ]
+    ACTIVAS = ('EN_ESPERA', 'DISPONIBLE')
+    
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='reservas')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='reservas')
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='EN_ESPERA')
+    fecha_reserva = models.DateTimeField(auto_now_add=True)
+    fecha_asignacion = models.DateTimeField(null=True, blank=True)
+    fecha_limite_retiro = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Reserva: {self.libro_id} -> {self.usuario_id} ({self.estado})"
+    
+    class Meta:
+        verbose_name = 'Reserva'
+        verbose_name_plural = 'Reservas'
+        ordering = ['id']
+        constraints = [
+            # Una sola reserva activa por usuario y libro
+            models.UniqueConstraint(
+                fields=['usuario', 'libro'], condition=models.Q(estado__in=['EN_ESPERA', 'DISPONIBLE']),
+                name='reserva_activa_unica'
+            ),
+        ]
+        indexes = [
+            # Cola de cada libro en orden de llegada: la siguiente reserva es un recorrido
+            # del índice. Completo y no parcial: SQLite no usa un índice parcial si el
+            # estado llega como parámetro de la consulta.
+            models.Index(fields=['libro', 'estado', 'id'], name='reserva_cola_idx'),
+            # Reservas apartadas por fecha límite (barrido de expiradas)
+            models.Index(fields=['estado', 'fecha_limite_retiro'], name='reserva_retiro_vence_idx'),
+        ]
+
+
+class ProgresoTarea(models.Model):
+    """Checkpoint de tareas por lotes, para retomarlas donde quedaron"""
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    fecha_referencia = models.DateField(null=True, blank=True)
+    completada = models.BooleanField(default=False)
+    procesados = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.nombre}: id {self.ultimo_id}"
+    
+    class Meta:
+        verbose_name = 'Progreso de tarea'
+        verbose_name_plural = 'Progreso de tareas'
+
+
+class VersionTabla(models.Model):
+    """Contador de cambios por tabla, base de los ETag de la API"""
+    tabla = models.CharField(max_length=30, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    modificado = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.tabla} v{self.version}"
+    
+    class Meta:
+        verbose_name = 'Versión de tabla'
+        verbose_name_plural = 'Versiones de tablas'
+
+
+class Estadistica(models.Model):
+    """
+    Rollup diario de la circulación: cada fila suma los eventos de un día
+    para una dimensión y clave (por ejemplo fecha, 'categoria', 'PROGRAMACION').
+    Los totales actuales son la suma de todas las fechas. Ver api.estadisticas.
+    """
+    fecha = models.DateField()
+    dimension = models.CharField(max_length=20)
+    clave = models.CharField(max_length=20)
+    valor = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.fecha} {self.dimension}/{self.clave}: {self.valor}"
+    
+    class Meta:
+        verbose_name = 'Estadística'
+        verbose_name_plural = 'Estadísticas'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'dimension', 'clave'], name='estadistica_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'fecha'], name='estadistica_dimension_idx'),
+        ]
+
+
+class Evento(models.Model):
+    """
+    Registro append-only de los cambios de circulación (outbox). api.services
+    agrega los eventos en la misma transacción que cada operación; el id es la
+    secuencia que usan los consumidores (GET /api/eventos/?since=). Las
+    referencias no son FK: el evento se conserva aunque se borre el registro.
+    """
+    TIPO_CHOICES = [
+        ('PRESTAMO_CREADO', 'Préstamo creado'),
+        ('PRESTAMO_RENOVADO', 'Préstamo renovado'),
+        ('PRESTAMO_VENCIDO', 'Préstamo vencido'),
+        ('PRESTAMO_DEVUELTO', 'Préstamo devuelto'),
+        ('MULTA_GENERADA', 'Multa generada'),
+        ('MULTA_PAGADA', 'Multa pagada'),
+        ('MULTA_ELIMINADA', 'Multa eliminada'),
+        ('USUARIO_BLOQUEADO', 'Usuario bloqueado'),
+        ('USUARIO_DESBLOQUEADO', 'Usuario desbloqueado'),
+        ('STOCK_ACTUALIZADO', 'Stock actualizado'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    fecha = models.DateTimeField(default=timezone.now)
+    usuario = models.IntegerField(null=True, blank=True)
+    libro = models.CharField(max_length=13, null=True, blank=True)
+    prestamo = models.IntegerField(null=True, blank=True)
+    multa = models.IntegerField(null=True, blank=True)
+    # Datos del cambio (fechas, montos); las claves dependen del tipo
+    datos = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    
+    def __str__(self):
+        return f"#{self.id} {self.tipo}"
+    
+    class Meta:
+        verbose_name = 'Evento'
+        verbose_name_plural = 'Eventos'
+        ordering = ['id']
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un POST con header Idempotency-Key (ver
+    api.idempotencia). Se inserta en la misma transacción que la operación:
+    un duplicado simultáneo espera el commit y luego la reutiliza.
+    """
+    id = models.BigAutoField(primary_key=True)
+    clave = models.CharField(max_length=255)
+    ruta = models.CharField(max_length=255)
+    # sha256 del cuerpo: la misma clave con otro contenido se rechaza
+    firma = models.CharField(max_length=64)
+    status = models.PositiveSmallIntegerField(null=True)
+    datos = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    creado = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.ruta} {self.clave}"
+    
+    class Meta:
+        verbose_name = 'Clave de idempotencia'
+        verbose_name_plural = 'Claves de idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['clave', 'ruta'], name='idempotencia_clave_unica'),
+        ]
+        indexes = [
+            # Purga por antigüedad (TTL)
+            models.Index(fields=['creado'], name='idempotencia_creado_idx'),
+        ]
@@ -0,0 +1,120 @@
+"""
+Paginación de la API - Cursor (keyset) sobre columnas indexadas
+"""
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class CursorPaginacion(CursorPagination):
+    """
+    Paginación por cursor: cada página es un WHERE (columnas) > cursor ORDER BY
+    columnas LIMIT n, por lo que el costo no crece con el número de página.
+    Cada ViewSet declara su orden en `cursor_ordering` (o `get_cursor_ordering()`
+    si depende del request); el último campo debe ser único (id, isbn).
+
+    El cursor de DRF solo guarda el primer campo del orden y recorre los
+    empates con un offset limitado a offset_cutoff: con más empates que eso
+    (p. ej. miles de préstamos con dias_retraso = 0) repetía páginas sin
+    terminar. Aquí el cursor guarda todos los campos del orden y la
+    comparación es por la tupla completa, así que nunca hay empates.
+    GET /api/prestamos/?page_size=100
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, 'get_cursor_ordering'):
+            ordering = view.get_cursor_ordering()
+        else:
+            ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def _get_position_from_instance(self, instance, ordering):
+        valores = []
+        for campo in ordering:
+            nombre = campo.lstrip('-')
+            valor = instance[nombre] if isinstance(instance, dict) else getattr(instance, nombre)
+            valores.append(str(valor))
+        return json.dumps(valores, separators=(',', ':'))
+
+    def despues_de(self, posicion, reverse):
+        """
+        Q de las filas posteriores a `posicion` en el orden del cursor:
+        (a, b) > (x, y)  =>  a > x OR (a = x AND b > y), cada campo en su sentido
+        """
+        try:
+            valores = json.loads(posicion)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(valores, list) or len(valores) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condicion = Q()
+        iguales = {}
+        for campo, valor in zip(self.ordering, valores):
+            nombre = campo.lstrip('-')
+            operador = 'lt' if reverse != campo.startswith('-') else 'gt'
+            condicion |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+            iguales[nombre] = valor
+        return condicion
+
+    def preparar(self, queryset, request, view):
+        """(queryset ordenado y filtrado por el cursor, offset)"""
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, posicion = self.cursor or (0, False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if posicion is not None:
+            queryset = queryset.filter(self.despues_de(posicion, reverse))
+        return queryset, offset
+
+    def paginar(self, resultados):
+        """Página y enlaces a partir de las filas leídas (una de más si hay siguiente)"""
+        offset, reverse, posicion = self.cursor or (0, False, None)
+        self.page = resultados[:self.page_size]
+        siguiente = None
+        if len(resultados) > len(self.page):
+            siguiente = self._get_position_from_instance(resultados[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = posicion is not None or offset > 0
+            self.has_previous = siguiente is not None
+            self.next_position, self.previous_position = posicion, siguiente
+        else:
+            self.has_next = siguiente is not None
+            self.has_previous = posicion is not None or offset > 0
+            self.next_position, self.previous_position = siguiente, posicion
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        queryset, offset = self.preparar(queryset, request, view)
+        # Un elemento extra indica si hay una página siguiente
+        return self.paginar(list(queryset[offset:offset + self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Versión async de paginate_queryset (vistas de api/async_views.py): misma
+        lógica y mismo formato de cursor, con la página leída por el ORM async.
+        """
+        self.page_size = self.get_page_size(request)
+        queryset, offset = self.preparar(queryset, request, view)
+        return self.paginar([obj async for obj in queryset[offset:offset + self.page_size + 1]])
+
+    def respuesta_paginada(self, datos):
+        """Mismo cuerpo que get_paginated_response, sin el Response de DRF"""
+        return {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': datos}
@@ -0,0 +1,80 @@
+"""
+Proyección de campos en las respuestas: ?fields= y ?expand=
+GET /api/usuarios/?fields=id,nombre                 solo esos campos
+GET /api/prestamos/?fields=id,estado&expand=libro   y el libro como objeto anidado
+Con SerializadorRapido la proyección también reduce el SELECT: solo se
+piden a .values() las columnas (y los JOIN) de los campos pedidos.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def lista(texto):
+    return tuple(dict.fromkeys(nombre.strip() for nombre in texto.split(',') if nombre.strip()))
+
+
+def leer_proyeccion(query_params, serializer_class):
+    """
+    (campos, expandir) de la query string: campos es None sin ?fields=.
+    ValidationError (400) si se pide un campo o expansión que no existe.
+    """
+    if not issubclass(serializer_class, CamposDinamicosMixin):
+        return None, ()
+    expandibles = getattr(serializer_class.Meta, 'expandibles', {})
+    expandir = lista(query_params.get('expand', ''))
+    desconocidos = [nombre for nombre in expandir if nombre not in expandibles]
+    if desconocidos:
+        validos = ', '.join(expandibles) or 'ninguna'
+        raise ValidationError({'expand': f'No se puede expandir {", ".join(desconocidos)} (válidos: {validos})'})
+
+    if 'fields' not in query_params:
+        return None, expandir
+    campos = lista(query_params['fields'])
+    validos = serializer_class().fields
+    desconocidos = [nombre for nombre in campos if nombre not in validos]
+    if not campos or desconocidos:
+        raise ValidationError({
+            'fields': f'Campos desconocidos: {", ".join(desconocidos)}' if desconocidos else 'Indique al menos un campo'
+        })
+    return tuple(sorted(campos)), expandir
+
+
+class CamposDinamicosMixin:
+    """
+    ModelSerializer con campos elegidos al instanciarlo:
+    campos: nombres a conservar (None: todos); las expansiones se agregan solas.
+    expandir: relaciones de Meta.expandibles ({campo: serializador}) que se
+    entregan como objeto anidado en vez del id.
+    """
+
+    def __init__(self, *args, campos=None, expandir=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        expandibles = getattr(self.Meta, 'expandibles', {})
+        for nombre in expandir:
+            self.fields[nombre] = expandibles[nombre](read_only=True)
+        if campos is not None:
+            conservar = set(campos).union(expandir)
+            for nombre in list(self.fields):
+                if nombre not in conservar:
+                    self.fields.pop(nombre)
+
+
+class ProyeccionMixin:
+    """
+    ViewSet que acepta ?fields= y ?expand= en los GET. La proyección se lee
+    una vez por request; ListaRapidaMixin la usa para compilar el SerializadorRapido.
+    """
+
+    def proyeccion(self):
+        if not hasattr(self, '_proyeccion'):
+            if self.request.method == 'GET':
+                self._proyeccion = leer_proyeccion(self.request.query_params, self.get_serializer_class())
+            else:
+                self._proyeccion = (None, ())
+        return self._proyeccion
+
+    def get_serializer(self, *args, **kwargs):
+        campos, expandir = self.proyeccion()
+        if campos is not None or expandir:
+            kwargs.setdefault('campos', campos)
+            kwargs.setdefault('expandir', expandir)
+        return super().get_serializer(*args, **kwargs)
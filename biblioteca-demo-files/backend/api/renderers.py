@@ -0,0 +1,59 @@
+"""
+Renderers de la API - JSON con orjson cuando está instalado y MessagePack
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa el json de la librería estándar
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # opcional: sin msgpack no se ofrece application/msgpack
+    msgpack = None
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """
+    Mismos bytes que JSONRenderer (compacto, UTF-8, \\u2028/\\u2029 escapados),
+    generados por orjson. Fechas, Decimal y demás tipos pasan por el
+    JSONEncoder de DRF; con indentación (API navegable, ?indent) o con algo
+    que orjson no admite (enteros de más de 64 bits) se usa JSONRenderer.
+    Diferencia conocida: un float NaN sale como null en vez de NaN.
+    """
+    opciones = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.opciones)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    application/msgpack (Accept: application/msgpack o ?format=msgpack).
+    Mismos valores que el JSON: fechas y Decimal pasan por el JSONEncoder
+    de DRF, así que llegan como texto igual que en JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
@@ -0,0 +1,50 @@
+"""
+Ruteo de base de datos - Lecturas a la réplica, escrituras al primario
+Las lecturas van a la réplica solo dentro de un request GET/HEAD de la API
+(ReplicaMiddleware); las acciones POST/PUT/DELETE, los comandos y las
+tareas programadas leen y escriben en 'default'. Durante `migrate --database`
+todo va a la base que se migra.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+ALIAS_REPLICA = 'replica'
+
+# ContextVar y no threading.local: se propaga a las vistas async y al ORM async
+_usar_replica = ContextVar('usar_replica', default=False)
+
+# Base que está migrando `migrate --database X` (lo fijan pre_migrate/post_migrate
+# en api.signals): el RunPython de 0006/0007 usa los managers sin .using() y
+# sin esto leería y escribiría en 'default'
+_alias_migracion = ContextVar('alias_migracion', default=None)
+
+
+def fijar_alias_migracion(alias):
+    _alias_migracion.set(alias)
+
+
+@contextmanager
+def lecturas_en_replica():
+    token = _usar_replica.set(True)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _alias_migracion.get():
+            return _alias_migracion.get()
+        if _usar_replica.get() and ALIAS_REPLICA in settings.DATABASES:
+            return ALIAS_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return _alias_migracion.get() or 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplica tienen los mismos datos
+        return True
@@ -0,0 +1,176 @@
+"""
+Búsqueda en el catálogo de libros
+Índice invertido FTS5 en SQLite, con backend intercambiable vía settings
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+# Tabla virtual FTS5 con contenido externo (api_libro) y mantenida por triggers,
+# así también se indexan las escrituras masivas (bulk_create, update).
+# remove_diacritics 2: "programacion" encuentra "Programación".
+# prefix='2 3': índices de prefijo para búsqueda mientras se escribe.
+SQL_CREAR_INDICE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_libro_fts USING fts5(
+        titulo, autor, editorial, isbn,
+        content='api_libro', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_ai AFTER INSERT ON api_libro BEGIN
+        INSERT INTO api_libro_fts(rowid, titulo, autor, editorial, isbn)
+        VALUES (new.rowid, new.titulo, new.autor, new.editorial, new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_ad AFTER DELETE ON api_libro BEGIN
+        INSERT INTO api_libro_fts(api_libro_fts, rowid, titulo, autor, editorial, isbn)
+        VALUES ('delete', old.rowid, old.titulo, old.autor, old.editorial, old.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_libro_fts_au
+    AFTER UPDATE OF titulo, autor, editorial, isbn ON api_libro BEGIN
+        INSERT INTO api_libro_fts(api_libro_fts, rowid, titulo, autor, editorial, isbn)
+        VALUES ('delete', old.rowid, old.titulo, old.autor, old.editorial, old.isbn);
+        INSERT INTO api_libro_fts(rowid, titulo, autor, editorial, isbn)
+        VALUES (new.rowid, new.titulo, new.autor, new.editorial, new.isbn);
+    END
+    """,
+]
+
+# Si falta uno, el índice dejó de seguir a api_libro (ver BusquedaFTS5.asegurar_indice)
+TRIGGERS = ('api_libro_fts_ai', 'api_libro_fts_ad', 'api_libro_fts_au')
+
+SQL_ELIMINAR_INDICE = [
+    'DROP TRIGGER IF EXISTS api_libro_fts_au',
+    'DROP TRIGGER IF EXISTS api_libro_fts_ad',
+    'DROP TRIGGER IF EXISTS api_libro_fts_ai',
+    'DROP TABLE IF EXISTS api_libro_fts',
+]
+
+# Pesos bm25 por columna: titulo, autor, editorial, isbn
+PESOS_BM25 = (10.0, 5.0, 1.0, 2.0)
+
+# Tope de coincidencias de una búsqueda FTS5 (el ranking se ordena completo en
+# SQLite); se cambia con API_BUSQUEDA_MAX_RESULTADOS. Si hay más, la respuesta
+# lo indica con "truncado": true
+MAX_RESULTADOS = 200
+
+
+def max_resultados():
+    return getattr(settings, 'API_BUSQUEDA_MAX_RESULTADOS', MAX_RESULTADOS)
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Programación' -> 'programacion'"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return re.findall(r'\w+', normalizar(texto))
+
+
+class BusquedaBasica:
+    """Búsqueda con LIKE sobre titulo/autor/editorial/isbn (cualquier motor)"""
+    # Orden de los resultados (usado también por la paginación por cursor)
+    ordering = ('isbn',)
+    # True si la última búsqueda dejó coincidencias fuera del tope
+    truncado = False
+
+    def buscar(self, queryset, texto):
+        filtro = Q()
+        for termino in texto.split():
+            filtro &= (
+                Q(titulo__icontains=termino) | Q(autor__icontains=termino) |
+                Q(editorial__icontains=termino) | Q(isbn__icontains=termino)
+            )
+        return queryset.filter(filtro)
+
+    def reconstruir(self, using='default'):
+        pass
+
+    def asegurar_indice(self, using='default'):
+        """Sin índice que mantener; retorna False"""
+        return False
+
+
+class BusquedaFTS5(BusquedaBasica):
+    """Índice invertido FTS5 de SQLite, con ranking bm25 y búsqueda por prefijo"""
+    ordering = ('relevancia',)
+
+    def consulta_match(self, texto):
+        # Cada término se cita (evita la sintaxis FTS5) y se busca como prefijo
+        return ' '.join(f'"{termino}"*' for termino in tokenizar(texto))
+
+    def buscar(self, queryset, texto):
+        consulta = self.consulta_match(texto)
+        if not consulta:
+            return queryset.annotate(relevancia=Value(0)).none()
+
+        pesos = ', '.join(str(p) for p in PESOS_BM25)
+        limite = max_resultados()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT l.isbn FROM api_libro_fts '
+                'JOIN api_libro l ON l.rowid = api_libro_fts.rowid '
+                f'WHERE api_libro_fts MATCH %s ORDER BY bm25(api_libro_fts, {pesos}) LIMIT %s',
+                [consulta, limite + 1]
+            )
+            isbns = [fila[0] for fila in cursor.fetchall()]
+        # Una fila de más indica que quedaron coincidencias fuera
+        self.truncado = len(isbns) > limite
+        isbns = isbns[:limite]
+
+        if not isbns:
+            return queryset.annotate(relevancia=Value(0)).none()
+        # La posición en el ranking queda como anotación para ordenar y paginar
+        relevancia = Case(
+            *[When(isbn=isbn, then=Value(posicion)) for posicion, isbn in enumerate(isbns)],
+            output_field=IntegerField()
+        )
+        return queryset.filter(isbn__in=isbns).annotate(relevancia=relevancia)
+
+    def reconstruir(self, using='default'):
+        with connections[using].cursor() as cursor:
+            for sql in SQL_CREAR_INDICE:
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO api_libro_fts(api_libro_fts) VALUES ('rebuild')")
+
+    def asegurar_indice(self, using='default'):
+        """
+        Una migración que rehace api_libro en SQLite (AlterField, RemoveField:
+        copia la tabla y borra la original) elimina sus triggers, y la copia
+        puede cambiar los rowid. Si el índice existe pero falta algún trigger,
+        recrea los triggers y reindexa. Retorna True si reindexó.
+        """
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)", ['api_libro_fts', *TRIGGERS]
+            )
+            existentes = {fila[0] for fila in cursor.fetchall()}
+        # Sin la tabla FTS la migración 0003 no está aplicada (o se revirtió)
+        if 'api_libro_fts' not in existentes or existentes.issuperset(TRIGGERS):
+            return False
+        self.reconstruir(using)
+        return True
+
+
+def get_backend(using='default'):
+    """
+    Backend definido en API_BUSQUEDA_BACKEND; por defecto FTS5 si la base
+    de datos es SQLite y búsqueda básica en los demás motores.
+    """
+    ruta = getattr(settings, 'API_BUSQUEDA_BACKEND', None)
+    if ruta:
+        return import_string(ruta)()
+    if connections[using].vendor == 'sqlite':
+        return BusquedaFTS5()
+    return BusquedaBasica()
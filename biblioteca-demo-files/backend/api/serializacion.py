@@ -0,0 +1,215 @@
+"""
+Serialización rápida de listados (solo lectura)
+Compila una vez los campos de un ModelSerializer a una lista de
+(nombre, columna de .values(), conversión) y arma cada fila desde un dict,
+sin instanciar modelos ni recorrer los Field de DRF por fila. El resultado
+es el mismo dict que to_representation() del serializador.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.http import Http404
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import anotaciones
+from .models import Usuario, Libro, Prestamo, PrestamoArchivado
+from .proyeccion import ProyeccionMixin
+
+# Campos que DRF ya entrega tal cual vienen de la base de datos
+SIN_CONVERSION = (
+    serializers.BooleanField, serializers.CharField, serializers.ChoiceField,
+    serializers.IntegerField, serializers.PrimaryKeyRelatedField,
+)
+
+# Propiedades de los modelos: (modelo, propiedad) -> (columnas, función(contexto, *valores))
+CALCULADOS = {
+    (Libro, 'disponible'): (('stock_disponible',), lambda ctx, stock: stock > 0),
+    (Usuario, 'dias_prestamo'): (('tipo_usuario',), lambda ctx, tipo: Usuario.dias_prestamo_de(tipo)),
+    (Prestamo, 'dias_retraso'): (
+        ('estado', 'fecha_devolucion_esperada', 'fecha_devolucion_real'),
+        lambda ctx, *valores: Prestamo.calcular_dias_retraso(*valores, ctx['hoy']),
+    ),
+    (PrestamoArchivado, 'dias_retraso'): (
+        ('estado', 'fecha_devolucion_esperada', 'fecha_devolucion_real'),
+        lambda ctx, *valores: Prestamo.calcular_dias_retraso(*valores, ctx['hoy']),
+    ),
+}
+
+# Propiedades que el queryset puede traer ya calculadas (api.anotaciones):
+# si la fila incluye la anotación, se usa en vez de la función de CALCULADOS
+ANOTACIONES = {
+    (Usuario, 'dias_prestamo'): anotaciones.PLAZO,
+    (Prestamo, 'dias_retraso'): anotaciones.RETRASO,
+}
+
+
+class SerializadorRapido:
+    """
+    SerializadorRapido(LibroSerializer).serializar(queryset_de_values) -> [dict]
+    columnas: lo que hay que pedir a .values() (incluye relaciones con '__').
+    campos / expandir: proyección de api.proyeccion (?fields= / ?expand=);
+    solo se piden las columnas de los campos que quedan.
+    """
+
+    def __init__(self, serializer_class, campos=None, expandir=()):
+        self.campos = []
+        self.columnas = []
+        self.anotaciones = []
+        if campos is not None or expandir:
+            serializer = serializer_class(campos=campos, expandir=expandir)
+        else:
+            serializer = serializer_class()
+        self.compilar(serializer, '', self.campos)
+
+    def compilar(self, serializer, prefijo, campos):
+        modelo = serializer.Meta.model
+        for nombre, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            if isinstance(campo, serializers.BaseSerializer):
+                # Serializador anidado (p. ej. multa): None si la relación no existe
+                ruta = prefijo + '__'.join(campo.source_attrs) + '__'
+                anidados = []
+                self.compilar(campo, ruta, anidados)
+                pk = self.columna(ruta + campo.Meta.model._meta.pk.name)
+                campos.append((nombre, 'anidado', (pk, anidados)))
+                continue
+            if isinstance(campo, serializers.ReadOnlyField):
+                if (modelo, campo.source) in CALCULADOS:
+                    dependencias, funcion = CALCULADOS[(modelo, campo.source)]
+                    columnas = tuple(self.columna(prefijo + c) for c in dependencias)
+                    # Solo en el modelo principal: las anotaciones no llegan a los anidados
+                    anotacion = ANOTACIONES.get((modelo, campo.source)) if not prefijo else None
+                    if anotacion:
+                        self.anotaciones.append(anotacion)
+                    campos.append((nombre, 'calculado', (columnas, funcion, anotacion)))
+                    continue
+                if campo.source not in {f.attname for f in modelo._meta.concrete_fields}:
+                    raise ImproperlyConfigured(f'{modelo.__name__}.{campo.source} no está en CALCULADOS')
+            if isinstance(campo, serializers.RelatedField) and not isinstance(campo, serializers.PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f'{type(campo).__name__} ({nombre}) no tiene serialización rápida')
+            columna = self.columna(prefijo + '__'.join(campo.source_attrs))
+            if isinstance(campo, SIN_CONVERSION) or isinstance(campo, serializers.ReadOnlyField):
+                campos.append((nombre, 'directo', columna))
+            elif self.fecha_hora_iso(campo):
+                campos.append((nombre, 'fecha_hora', (columna, campo.to_representation)))
+            else:
+                # Fechas y demás: la misma conversión que usa DRF
+                campos.append((nombre, 'convertido', (columna, campo.to_representation)))
+
+    @staticmethod
+    def fecha_hora_iso(campo):
+        """DateTimeField en ISO 8601 con la zona horaria actual (el caso por defecto)"""
+        formato = getattr(campo, 'format', api_settings.DATETIME_FORMAT)
+        return (
+            isinstance(campo, serializers.DateTimeField) and not hasattr(campo, 'timezone')
+            and formato is not None and formato.lower() == ISO_8601
+        )
+
+    def columna(self, ruta):
+        if ruta not in self.columnas:
+            self.columnas.append(ruta)
+        return ruta
+
+    def fila(self, valores, campos, contexto):
+        resultado = {}
+        for nombre, tipo, datos in campos:
+            if tipo == 'directo':
+                resultado[nombre] = valores[datos]
+            elif tipo == 'fecha_hora':
+                # DateTimeField.to_representation con la zona horaria resuelta una vez por página
+                valor = valores[datos[0]]
+                if not valor:
+                    resultado[nombre] = None
+                elif valor.tzinfo is None or contexto['zona'] is None:
+                    resultado[nombre] = datos[1](valor)
+                else:
+                    texto = valor.astimezone(contexto['zona']).isoformat()
+                    resultado[nombre] = texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+            elif tipo == 'convertido':
+                valor = valores[datos[0]]
+                resultado[nombre] = None if valor is None else datos[1](valor)
+            elif tipo == 'calculado':
+                columnas, funcion, anotacion = datos
+                if anotacion in valores:
+                    resultado[nombre] = valores[anotacion]
+                else:
+                    resultado[nombre] = funcion(contexto, *(valores[c] for c in columnas))
+            else:
+                pk, anidados = datos
+                resultado[nombre] = None if valores[pk] is None else self.fila(valores, anidados, contexto)
+        return resultado
+
+    def serializar(self, filas):
+        contexto = {
+            'hoy': timezone.now().date(),
+            'zona': timezone.get_current_timezone() if settings.USE_TZ else None,
+        }
+        return [self.fila(valores, self.campos, contexto) for valores in filas]
+
+
+_serializadores_rapidos = {}
+
+# Proyecciones compiladas que se conservan (las combinaciones de ?fields= no tienen límite)
+MAX_SERIALIZADORES = 256
+
+
+def obtener_serializador_rapido(serializer_class, campos=None, expandir=()):
+    """SerializadorRapido compilado una vez por clase de serializador y proyección"""
+    clave = (serializer_class, campos, expandir)
+    rapido = _serializadores_rapidos.get(clave)
+    if rapido is None:
+        if len(_serializadores_rapidos) >= MAX_SERIALIZADORES:
+            # Se descarta el compilado más antiguo
+            del _serializadores_rapidos[next(iter(_serializadores_rapidos))]
+        rapido = _serializadores_rapidos[clave] = SerializadorRapido(serializer_class, campos, expandir)
+    return rapido
+
+
+class ListaRapidaMixin(ProyeccionMixin):
+    """
+    list() con SerializadorRapido: la página se lee con .values() y se
+    serializa sin pasar por los Field de DRF. Mismo JSON que el serializador
+    del ViewSet (ver benchmark_serializacion). lista_rapida = False lo desactiva.
+    Con ?fields= / ?expand= el SELECT solo trae las columnas de esos campos,
+    también en el detalle (retrieve); sin proyección el detalle usa el serializador.
+    """
+    lista_rapida = True
+
+    def list(self, request, *args, **kwargs):
+        if not self.lista_rapida:
+            return super().list(request, *args, **kwargs)
+        rapido = obtener_serializador_rapido(self.get_serializer_class(), *self.proyeccion())
+        queryset = self.filter_queryset(self.get_queryset())
+        # El cursor lee la posición desde la fila: las columnas del orden también van
+        orden = self.paginator.get_ordering(request, queryset, self) if self.paginator else ()
+        extra = [campo.lstrip('-') for campo in orden if campo.lstrip('-') not in rapido.columnas]
+        # Propiedades ya calculadas por la base de datos (api.anotaciones)
+        extra += [
+            nombre for nombre in rapido.anotaciones if nombre in queryset.query.annotations and nombre not in extra
+        ]
+        filas = queryset.values(*rapido.columnas, *extra)
+
+        pagina = self.paginate_queryset(filas)
+        if pagina is None:
+            return Response(rapido.serializar(filas))
+        return self.get_paginated_response(rapido.serializar(pagina))
+
+    def retrieve(self, request, *args, **kwargs):
+        campos, expandir = self.proyeccion()
+        if not self.lista_rapida or (campos is None and not expandir):
+            return super().retrieve(request, *args, **kwargs)
+        rapido = obtener_serializador_rapido(self.get_serializer_class(), campos, expandir)
+        # El mismo filtro que get_object(), con la fila leída por .values()
+        # (sin instancia no hay permisos por objeto; la API usa AllowAny)
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filas = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        extra = [nombre for nombre in rapido.anotaciones if nombre in queryset.query.annotations]
+        fila = filas.values(*rapido.columnas, *extra)[:1]
+        if not fila:
+            raise Http404
+        return Response(rapido.serializar(fila)[0])
+
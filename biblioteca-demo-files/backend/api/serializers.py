@@ -2,17 +2,20 @@
 Serializadores - Convierten modelos a JSON y viceversa
 """
 from rest_framework import serializers
-from .models import Usuario, Libro, Prestamo, Multa
+from .proyeccion import CamposDinamicosMixin
+from .models import Usuario, Libro, Prestamo, Multa, Reserva, Evento, PrestamoArchivado, MultaArchivada
+from .services import LOTE_MAXIMO
 
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     dias_prestamo = serializers.ReadOnlyField()
     
     class Meta:
         model = Usuario
         fields = '__all__'
+        read_only_fields = ['prestamos_activos', 'multas_pendientes', 'monto_pendiente']
 
 
-class LibroSerializer(serializers.ModelSerializer):
+class LibroSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     disponible = serializers.ReadOnlyField()
     
     class Meta:
@@ -20,13 +23,13 @@ class LibroSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MultaSerializer(serializers.ModelSerializer):
+class MultaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Multa
         fields = '__all__'
 
 
-class PrestamoSerializer(serializers.ModelSerializer):
+class PrestamoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     usuario_nombre = serializers.CharField(source='usuario.nombre', read_only=True)
     libro_titulo = serializers.CharField(source='libro.titulo', read_only=True)
     dias_retraso = serializers.ReadOnlyField()
@@ -35,6 +38,26 @@ class PrestamoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prestamo
         fields = '__all__'
+        # ?expand=usuario,libro: el objeto completo en vez del id
+        expandibles = {'usuario': UsuarioSerializer, 'libro': LibroSerializer}
+
+
+class MultaArchivadaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MultaArchivada
+        fields = '__all__'
+
+
+class PrestamoArchivadoSerializer(serializers.ModelSerializer):
+    """Mismo JSON que PrestamoSerializer (historial de un usuario)"""
+    usuario_nombre = serializers.CharField(source='usuario.nombre', read_only=True)
+    libro_titulo = serializers.CharField(source='libro.titulo', read_only=True)
+    dias_retraso = serializers.ReadOnlyField()
+    multa = MultaArchivadaSerializer(read_only=True)
+    
+    class Meta:
+        model = PrestamoArchivado
+        exclude = ['fecha_archivado']
 
 
 class PrestamoCreateSerializer(serializers.ModelSerializer):
@@ -48,8 +71,43 @@ class PrestamoCreateSerializer(serializers.ModelSerializer):
         if data['usuario'].bloqueado:
             raise serializers.ValidationError("El usuario está bloqueado por multas pendientes")
         
-        # Validar que el libro esté disponible
-        if data['libro'].stock_disponible <= 0:
-            raise serializers.ValidationError("El libro no está disponible")
+        # Validar que el libro esté disponible (o apartado para este usuario)
+        if data['libro'].stock_disponible <= 0 and not Reserva.objects.filter(
+            usuario=data['usuario'], libro=data['libro'], estado='DISPONIBLE'
+        ).exists():
+            raise serializers.ValidationError(
+                "El libro no está disponible; puede reservarlo en /api/reservas/"
+            )
         
-        return data
\ No newline at end of file
+        return data
+
+
+class ReservaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Reserva
+        fields = '__all__'
+        expandibles = {'usuario': UsuarioSerializer, 'libro': LibroSerializer}
+        read_only_fields = ['estado', 'fecha_asignacion', 'fecha_limite_retiro']
+
+
+class EventoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Evento
+        fields = '__all__'
+
+
+class PrestamoLoteItemSerializer(serializers.Serializer):
+    usuario = serializers.IntegerField()
+    libro = serializers.CharField(max_length=13)
+
+
+class PrestamoLoteSerializer(serializers.Serializer):
+    """Entrada de POST /api/prestamos/bulk/"""
+    prestamos = PrestamoLoteItemSerializer(many=True, allow_empty=False, max_length=LOTE_MAXIMO)
+
+
+class DevolucionLoteSerializer(serializers.Serializer):
+    """Entrada de POST /api/prestamos/bulk-devolver/"""
+    prestamos = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=LOTE_MAXIMO
+    )
@@ -0,0 +1,562 @@
+"""
+Servicios de circulación - Préstamos, devoluciones y stock
+Cada operación corre en una transacción y usa UPDATE condicionales,
+por lo que dos requests concurrentes no pueden prestar el mismo ejemplar.
+Las escrituras masivas no emiten post_save: cada una llama a notificar_cambios().
+Cada operación suma sus eventos a los rollups de api.estadisticas y los
+agrega al registro de eventos (api.eventos) en la misma transacción.
+Los ejemplares devueltos pasan primero por la cola de reservas del libro.
+Préstamo, renovación, devolución y pago usan atomic(savepoint=False): dentro
+de la transacción de api.idempotencia no agregan un SAVEPOINT por request, y
+un error revierte también la clave (que no se guarda).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import estadisticas, eventos as registro_eventos
+from .models import Usuario, Libro, Prestamo, Multa, Reserva
+from .signals import notificar_cambios
+
+
+class OperacionInvalida(Exception):
+    """Error de negocio; el mensaje se devuelve tal cual al cliente"""
+
+
+class StockNoDisponible(OperacionInvalida):
+    def __init__(self, mensaje='El libro no está disponible'):
+        super().__init__(mensaje)
+
+
+class ConflictoConcurrente(OperacionInvalida):
+    """Otro request modificó los mismos registros; el lote completo se revierte"""
+
+
+# Máximo de ítems por operación en lote
+LOTE_MAXIMO = 500
+
+# Contadores desnormalizados de Usuario
+CONTADORES = ('prestamos_activos', 'multas_pendientes', 'monto_pendiente')
+
+
+def reservar_ejemplar(libro_id):
+    """
+    UPDATE api_libro SET stock_disponible = stock_disponible - 1
+    WHERE isbn = %s AND stock_disponible > 0
+    """
+    actualizados = Libro.objects.filter(pk=libro_id, stock_disponible__gt=0).update(
+        stock_disponible=F('stock_disponible') - 1
+    )
+    if not actualizados:
+        raise StockNoDisponible()
+    notificar_cambios(Libro)
+
+
+def dias_retiro():
+    return getattr(settings, 'API_RESERVAS', {}).get('DIAS_RETIRO', 3)
+
+
+def asignar_reservas(libro_id, cantidad, ahora=None):
+    """
+    Aparta hasta `cantidad` ejemplares para las reservas más antiguas del libro
+    cuyos usuarios no están bloqueados (los bloqueados conservan su lugar).
+    Cada UPDATE exige estado EN_ESPERA: si otro request tomó una reserva,
+    se vuelve a leer la cola. Retorna cuántos ejemplares se apartaron.
+    """
+    ahora = ahora or timezone.now()
+    limite = ahora + timedelta(days=dias_retiro())
+    asignadas = 0
+    while asignadas < cantidad:
+        siguientes = list(
+            Reserva.objects.filter(libro_id=libro_id, estado='EN_ESPERA', usuario__bloqueado=False)
+            .order_by('id').values_list('pk', flat=True)[:cantidad - asignadas]
+        )
+        if not siguientes:
+            break
+        asignadas += Reserva.objects.filter(pk__in=siguientes, estado='EN_ESPERA').update(
+            estado='DISPONIBLE', fecha_asignacion=ahora, fecha_limite_retiro=limite
+        )
+    if asignadas:
+        notificar_cambios(Reserva)
+    return asignadas
+
+
+def devolver_ejemplares(cantidades):
+    """
+    Ejemplares que vuelven a la biblioteca, {isbn: n}: primero se apartan
+    para la cola de reservas de cada libro y el resto vuelve al stock.
+    Sin reservas en espera son dos consultas para cualquier cantidad de libros.
+    """
+    con_cola = set(
+        Reserva.objects.filter(libro_id__in=list(cantidades), estado='EN_ESPERA')
+        .order_by().values_list('libro_id', flat=True).distinct()
+    )
+    sobrantes = Counter(cantidades)
+    for libro_id in con_cola:
+        sobrantes[libro_id] -= asignar_reservas(libro_id, cantidades[libro_id])
+    sobrantes = {pk: n for pk, n in sobrantes.items() if n > 0}
+    if sobrantes:
+        _ajustar_stock_en_lote(sobrantes, +1)
+
+
+def ajustar_contadores(deltas, **extra):
+    """
+    Suma deltas a los contadores de varios usuarios en un solo UPDATE:
+    deltas = {usuario_id: {'prestamos_activos': -1, 'multas_pendientes': 1, ...}}
+    `extra` agrega asignaciones al mismo UPDATE (por ejemplo bloqueado).
+    """
+    cambios = dict(extra)
+    for campo in CONTADORES:
+        casos = [When(pk=pk, then=Value(d[campo])) for pk, d in deltas.items() if d.get(campo)]
+        if casos:
+            cambios[campo] = F(campo) + Case(*casos, default=Value(0))
+    if cambios:
+        Usuario.objects.filter(pk__in=list(deltas)).update(**cambios)
+        notificar_cambios(Usuario)
+
+
+def descontar_multa(multa):
+    """
+    Resta una multa pendiente; si era la última y el usuario no tiene
+    préstamos VENCIDO (marcar_vencidos también bloquea), lo desbloquea.
+    Retorna los eventos de la multa (tipo según el llamador) y del desbloqueo.
+    """
+    usuario_id = multa.prestamo.usuario_id
+    vencidos = Prestamo.objects.filter(usuario_id=OuterRef('pk'), estado='VENCIDO')
+    Usuario.objects.filter(pk=usuario_id).update(
+        multas_pendientes=F('multas_pendientes') - 1,
+        monto_pendiente=F('monto_pendiente') - multa.monto_total,
+        # El CASE ve el valor anterior al UPDATE: 1 -> 0 pendientes
+        bloqueado=Case(
+            When(Q(multas_pendientes__lte=1) & ~Exists(vencidos), then=Value(False)),
+            default=F('bloqueado'),
+        ),
+    )
+    notificar_cambios(Usuario)
+    # Con una multa pendiente el usuario siempre está bloqueado: 0 y no bloqueado es un desbloqueo
+    if Usuario.objects.filter(pk=usuario_id, multas_pendientes=0, bloqueado=False).exists():
+        return [registro_eventos.usuario('USUARIO_DESBLOQUEADO', usuario_id)]
+    return []
+
+
+def completar_reserva(pk, estado):
+    """La reserva se cumple con el préstamo, si sigue en el estado leído"""
+    completada = Reserva.objects.filter(pk=pk, estado=estado).update(estado='COMPLETADA')
+    if completada:
+        notificar_cambios(Reserva)
+    return completada
+
+
+def prestar_libro(usuario, libro):
+    """Descuenta un ejemplar y crea el préstamo en la misma transacción"""
+    if usuario.bloqueado:
+        raise OperacionInvalida('El usuario está bloqueado por multas pendientes')
+
+    # Fuera de la transacción: en SQLite su primera sentencia debe ser una escritura
+    reserva = Reserva.objects.filter(
+        usuario=usuario, libro=libro, estado__in=Reserva.ACTIVAS
+    ).values_list('pk', 'estado').first()
+    with transaction.atomic(savepoint=False):
+        # Un ejemplar apartado para el usuario se entrega sin tocar el stock
+        # (si la reserva expiró entretanto, se pide uno del stock)
+        if reserva is None or reserva[1] != 'DISPONIBLE' or not completar_reserva(*reserva):
+            reservar_ejemplar(libro.pk)
+            if reserva is not None:
+                # Si además esperaba en la cola, deja de esperar
+                completar_reserva(reserva[0], 'EN_ESPERA')
+        ajustar_contadores({usuario.pk: {'prestamos_activos': 1}})
+        estadisticas.registrar(estadisticas.deltas_prestamo(usuario, libro))
+        prestamo = Prestamo.objects.create(usuario=usuario, libro=libro)
+        registro_eventos.registrar([registro_eventos.prestamo_creado(prestamo)])
+    return prestamo
+
+
+def renovar_prestamo(prestamo):
+    """Extiende la fecha de devolución una sola vez"""
+    if prestamo.renovado:
+        raise OperacionInvalida('Este préstamo ya fue renovado una vez')
+    if prestamo.estado != 'ACTIVO':
+        raise OperacionInvalida('Solo se pueden renovar préstamos activos')
+
+    nueva_fecha = prestamo.fecha_devolucion_esperada + timedelta(days=prestamo.usuario.dias_prestamo)
+    with transaction.atomic(savepoint=False):
+        # La condición evita que dos renovaciones simultáneas se apliquen ambas
+        actualizados = Prestamo.objects.filter(pk=prestamo.pk, renovado=False, estado='ACTIVO').update(
+            fecha_devolucion_esperada=nueva_fecha, renovado=True
+        )
+        if not actualizados:
+            raise OperacionInvalida('Este préstamo ya fue renovado una vez')
+        notificar_cambios(Prestamo)
+
+        prestamo.fecha_devolucion_esperada = nueva_fecha
+        prestamo.renovado = True
+        registro_eventos.registrar([registro_eventos.prestamo_renovado(prestamo)])
+    return prestamo
+
+
+def registrar_devolucion(prestamo):
+    """Marca el préstamo como devuelto, repone el stock y genera multa si hay retraso"""
+    hoy = timezone.now().date()
+    eventos = Counter({('estado', prestamo.estado): -1, ('estado', 'DEVUELTO'): 1})
+
+    with transaction.atomic(savepoint=False):
+        actualizados = Prestamo.objects.filter(pk=prestamo.pk).exclude(estado='DEVUELTO').update(
+            estado='DEVUELTO', fecha_devolucion_real=hoy
+        )
+        if not actualizados:
+            raise OperacionInvalida('Este préstamo ya fue devuelto')
+        notificar_cambios(Prestamo)
+        prestamo.estado = 'DEVUELTO'
+        prestamo.fecha_devolucion_real = hoy
+        registro = [registro_eventos.prestamo_devuelto(prestamo)]
+
+        devolver_ejemplares({prestamo.libro_id: 1})
+
+        if hoy > prestamo.fecha_devolucion_esperada:
+            multa = Multa.objects.create(
+                prestamo=prestamo,
+                dias_retraso=(hoy - prestamo.fecha_devolucion_esperada).days
+            )
+            eventos.update(estadisticas.deltas_multa('generada', multa.monto_total))
+            # Antes del UPDATE: si prestamo.usuario no estaba cargado, leerlo después ya lo ve bloqueado
+            se_bloquea = not prestamo.usuario.bloqueado
+            ajustar_contadores(
+                {prestamo.usuario_id: {
+                    'prestamos_activos': -1, 'multas_pendientes': 1, 'monto_pendiente': multa.monto_total
+                }},
+                bloqueado=True
+            )
+            registro.append(registro_eventos.multa('MULTA_GENERADA', multa, prestamo.usuario_id))
+            if se_bloquea:
+                registro.append(registro_eventos.usuario('USUARIO_BLOQUEADO', prestamo.usuario_id))
+            prestamo.usuario.bloqueado = True
+        else:
+            ajustar_contadores({prestamo.usuario_id: {'prestamos_activos': -1}})
+        estadisticas.registrar(eventos)
+        registro_eventos.registrar(registro)
+
+    return prestamo
+
+
+def _ajustar_stock_en_lote(cantidades, signo):
+    """
+    Un solo UPDATE para varios libros:
+    stock_disponible = stock_disponible +/- CASE isbn WHEN ... THEN n END
+    Al descontar, cada libro exige stock suficiente en el WHERE.
+    """
+    delta = Case(*[When(pk=pk, then=Value(n)) for pk, n in cantidades.items()])
+    if signo < 0:
+        filtro = Q()
+        for pk, n in cantidades.items():
+            filtro |= Q(pk=pk, stock_disponible__gte=n)
+        nuevo_stock = F('stock_disponible') - delta
+    else:
+        filtro = Q(pk__in=list(cantidades))
+        nuevo_stock = F('stock_disponible') + delta
+    actualizados = Libro.objects.filter(filtro).update(stock_disponible=nuevo_stock)
+    notificar_cambios(Libro)
+    return actualizados
+
+
+def prestar_en_lote(items):
+    """
+    Crea varios préstamos con un número fijo de consultas.
+    items: lista de dicts {'usuario': id, 'libro': isbn}
+    Retorna (prestamos creados, errores por índice del ítem).
+    """
+    usuarios = Usuario.objects.in_bulk({item.get('usuario') for item in items} - {None})
+    libros = Libro.objects.in_bulk({item.get('libro') for item in items} - {None})
+    # Reservas activas de los pares del lote: un ejemplar apartado no usa stock
+    reservas = {
+        (usuario_id, libro_id): (pk, estado)
+        for pk, usuario_id, libro_id, estado in Reserva.objects.filter(
+            usuario_id__in=list(usuarios), libro_id__in=list(libros), estado__in=Reserva.ACTIVAS
+        ).values_list('pk', 'usuario_id', 'libro_id', 'estado')
+    }
+
+    errores = {}
+    validos = []
+    reservados = Counter()
+    completadas = {'DISPONIBLE': [], 'EN_ESPERA': []}
+    for indice, item in enumerate(items):
+        usuario = usuarios.get(item.get('usuario'))
+        libro = libros.get(item.get('libro'))
+        if usuario is None or libro is None:
+            errores[indice] = 'Usuario o libro inexistente'
+            continue
+        if usuario.bloqueado:
+            errores[indice] = 'El usuario está bloqueado por multas pendientes'
+            continue
+        reserva = reservas.get((usuario.pk, libro.pk))
+        apartado = reserva is not None and reserva[1] == 'DISPONIBLE'
+        if not apartado and libro.stock_disponible - reservados[libro.pk] <= 0:
+            errores[indice] = 'El libro no está disponible'
+            continue
+        if reserva is not None:
+            del reservas[(usuario.pk, libro.pk)]
+            completadas[reserva[1]].append(reserva[0])
+        if not apartado:
+            reservados[libro.pk] += 1
+        validos.append((indice, usuario, libro))
+
+    if not validos:
+        return [], errores
+
+    hoy = timezone.now().date()
+    with transaction.atomic():
+        if reservados and _ajustar_stock_en_lote(reservados, -1) != len(reservados):
+            raise ConflictoConcurrente('El stock cambió durante la operación, reintente el lote')
+        for estado, pks in completadas.items():
+            if pks and Reserva.objects.filter(pk__in=pks, estado=estado).update(estado='COMPLETADA') != len(pks):
+                raise ConflictoConcurrente('Las reservas cambiaron durante la operación, reintente el lote')
+        if completadas['DISPONIBLE'] or completadas['EN_ESPERA']:
+            notificar_cambios(Reserva)
+        # bulk_create no llama a save(): la fecha de devolución se calcula aquí
+        prestamos = Prestamo.objects.bulk_create([
+            Prestamo(
+                usuario=usuario, libro=libro,
+                fecha_devolucion_esperada=hoy + timedelta(days=usuario.dias_prestamo)
+            )
+            for _, usuario, libro in validos
+        ])
+        notificar_cambios(Prestamo)
+        por_usuario = Counter(usuario.pk for _, usuario, _ in validos)
+        ajustar_contadores({pk: {'prestamos_activos': n} for pk, n in por_usuario.items()})
+        eventos = Counter()
+        for _, usuario, libro in validos:
+            eventos.update(estadisticas.deltas_prestamo(usuario, libro))
+        estadisticas.registrar(eventos)
+        registro_eventos.registrar([registro_eventos.prestamo_creado(p) for p in prestamos])
+
+    for prestamo, (indice, _, _) in zip(prestamos, validos):
+        prestamo.indice = indice
+    return prestamos, errores
+
+
+def devolver_en_lote(ids):
+    """
+    Registra varias devoluciones con un número fijo de consultas.
+    Retorna (préstamos devueltos, errores por índice del ítem).
+    """
+    prestamos = Prestamo.objects.select_related('usuario').in_bulk(set(ids))
+
+    errores = {}
+    validos = []
+    vistos = set()
+    for indice, pk in enumerate(ids):
+        prestamo = prestamos.get(pk)
+        if prestamo is None:
+            errores[indice] = 'Préstamo inexistente'
+        elif pk in vistos:
+            errores[indice] = 'Préstamo repetido en el lote'
+        elif prestamo.estado == 'DEVUELTO':
+            errores[indice] = 'Este préstamo ya fue devuelto'
+        else:
+            vistos.add(pk)
+            prestamo.indice = indice
+            validos.append(prestamo)
+
+    if not validos:
+        return [], errores
+
+    hoy = timezone.now().date()
+    atrasados = [p for p in validos if hoy > p.fecha_devolucion_esperada]
+    with transaction.atomic():
+        actualizados = Prestamo.objects.filter(pk__in=[p.pk for p in validos]).exclude(
+            estado='DEVUELTO'
+        ).update(estado='DEVUELTO', fecha_devolucion_real=hoy)
+        if actualizados != len(validos):
+            raise ConflictoConcurrente('Algún préstamo fue devuelto durante la operación, reintente el lote')
+        notificar_cambios(Prestamo)
+
+        devolver_ejemplares(Counter(p.libro_id for p in validos))
+
+        deltas = {}
+        eventos = Counter()
+        registro = []
+        for prestamo in validos:
+            delta = deltas.setdefault(prestamo.usuario_id, Counter())
+            delta['prestamos_activos'] -= 1
+            eventos[('estado', prestamo.estado)] -= 1
+            eventos[('estado', 'DEVUELTO')] += 1
+            prestamo.estado = 'DEVUELTO'
+            prestamo.fecha_devolucion_real = hoy
+            registro.append(registro_eventos.prestamo_devuelto(prestamo))
+
+        if atrasados:
+            # bulk_create no llama a save(): el monto total se calcula aquí
+            multas = []
+            for prestamo in atrasados:
+                multa = Multa(prestamo=prestamo, dias_retraso=(hoy - prestamo.fecha_devolucion_esperada).days)
+                multa.monto_total = multa.dias_retraso * multa.monto_por_dia
+                multas.append(multa)
+                deltas[prestamo.usuario_id]['multas_pendientes'] += 1
+                deltas[prestamo.usuario_id]['monto_pendiente'] += multa.monto_total
+                eventos.update(estadisticas.deltas_multa('generada', multa.monto_total))
+            Multa.objects.bulk_create(multas)
+            notificar_cambios(Multa)
+            registro += [registro_eventos.multa('MULTA_GENERADA', m, m.prestamo.usuario_id) for m in multas]
+
+        morosos = {p.usuario_id for p in atrasados}
+        ajustar_contadores(
+            deltas,
+            bloqueado=Case(When(pk__in=morosos, then=Value(True)), default=F('bloqueado'))
+        )
+        bloqueados = {p.usuario_id for p in atrasados if not p.usuario.bloqueado}
+        registro += [registro_eventos.usuario('USUARIO_BLOQUEADO', pk) for pk in sorted(bloqueados)]
+        estadisticas.registrar(eventos)
+        registro_eventos.registrar(registro)
+
+    return validos, errores
+
+
+def marcar_vencidos(ids, hoy):
+    """
+    Pasa a VENCIDO los préstamos ACTIVO de `ids` cuya fecha esperada ya pasó
+    y bloquea a sus usuarios. Se llama dentro de una transacción: lee las
+    filas del lote una vez (para los eventos) y las actualiza con dos UPDATE.
+    """
+    # Primera sentencia de la transacción, una escritura (SQLite); además
+    # el turno de la secuencia de eventos ya queda tomado
+    registro_eventos.turno()
+    filas = list(
+        Prestamo.objects.filter(pk__in=ids, estado='ACTIVO', fecha_devolucion_esperada__lt=hoy)
+        .order_by('pk').values_list('pk', 'usuario_id', 'libro_id', 'usuario__bloqueado')
+    )
+    if not filas:
+        return 0, 0
+    por_bloquear = sorted({usuario_id for _, usuario_id, _, bloqueado in filas if not bloqueado})
+    bloqueados = Usuario.objects.filter(pk__in=por_bloquear, bloqueado=False).update(bloqueado=True)
+    vencidos = Prestamo.objects.filter(pk__in=[fila[0] for fila in filas], estado='ACTIVO').update(
+        estado='VENCIDO'
+    )
+    notificar_cambios(Prestamo, Usuario)
+    estadisticas.registrar({('estado', 'ACTIVO'): -vencidos, ('estado', 'VENCIDO'): vencidos})
+    registro_eventos.registrar(
+        [registro_eventos.prestamo_vencido(*fila[:3]) for fila in filas]
+        + [registro_eventos.usuario('USUARIO_BLOQUEADO', pk) for pk in por_bloquear]
+    )
+    return vencidos, bloqueados
+
+
+def pagar_multa(multa):
+    """Marca la multa como pagada y descuenta los contadores del usuario"""
+    ahora = timezone.now()
+    with transaction.atomic(savepoint=False):
+        actualizados = Multa.objects.filter(pk=multa.pk, pagada=False).update(
+            pagada=True, fecha_pago=ahora
+        )
+        if not actualizados:
+            raise OperacionInvalida('Esta multa ya fue pagada')
+        notificar_cambios(Multa)
+        desbloqueo = descontar_multa(multa)
+        estadisticas.registrar(estadisticas.deltas_multa('pagada', multa.monto_total))
+        registro_eventos.registrar(
+            [registro_eventos.multa('MULTA_PAGADA', multa, multa.prestamo.usuario_id)] + desbloqueo
+        )
+
+    multa.pagada = True
+    multa.fecha_pago = ahora
+    return multa
+
+
+def eliminar_multa(multa):
+    with transaction.atomic():
+        if Multa.objects.filter(pk=multa.pk, pagada=False).delete()[0]:
+            desbloqueo = descontar_multa(multa)
+            estadisticas.registrar(estadisticas.deltas_multa('eliminada', multa.monto_total))
+            registro_eventos.registrar(
+                [registro_eventos.multa('MULTA_ELIMINADA', multa, multa.prestamo.usuario_id)] + desbloqueo
+            )
+        else:
+            multa.delete()
+
+
+def eliminar_prestamo(prestamo):
+    """Elimina el préstamo (y su multa) manteniendo los contadores del usuario"""
+    eventos = Counter({('estado', prestamo.estado): -1})
+    with transaction.atomic():
+        if prestamo.estado != 'DEVUELTO':
+            ajustar_contadores({prestamo.usuario_id: {'prestamos_activos': -1}})
+        multa = getattr(prestamo, 'multa', None)
+        if multa is not None and not multa.pagada:
+            registro_eventos.registrar(
+                [registro_eventos.multa('MULTA_ELIMINADA', multa, prestamo.usuario_id)] + descontar_multa(multa)
+            )
+            eventos.update(estadisticas.deltas_multa('eliminada', multa.monto_total))
+        prestamo.delete()
+        estadisticas.registrar(eventos)
+
+
+def reservar_libro(usuario, libro):
+    """Pone al usuario en la cola del libro; solo si no quedan ejemplares"""
+    if usuario.bloqueado:
+        raise OperacionInvalida('El usuario está bloqueado por multas pendientes')
+    if libro.stock_disponible > 0:
+        raise OperacionInvalida('El libro está disponible, solicite el préstamo')
+    try:
+        with transaction.atomic():
+            reserva = Reserva.objects.create(usuario=usuario, libro=libro)
+    except IntegrityError:
+        raise OperacionInvalida('El usuario ya tiene una reserva activa de este libro')
+    return reserva
+
+
+def cancelar_reserva(reserva):
+    """Cancela una reserva activa; un ejemplar ya apartado pasa al siguiente de la cola"""
+    with transaction.atomic():
+        if Reserva.objects.filter(pk=reserva.pk, estado='DISPONIBLE').update(estado='CANCELADA'):
+            devolver_ejemplares({reserva.libro_id: 1})
+            registro_eventos.registrar(registro_eventos.stock_actualizado([reserva.libro_id]))
+        elif not Reserva.objects.filter(pk=reserva.pk, estado='EN_ESPERA').update(estado='CANCELADA'):
+            raise OperacionInvalida('La reserva ya no está activa')
+        notificar_cambios(Reserva)
+    reserva.estado = 'CANCELADA'
+    return reserva
+
+
+def expirar_reservas(ahora=None, limite=1000):
+    """
+    Marca EXPIRADA las reservas apartadas cuyo plazo de retiro venció y
+    entrega cada ejemplar al siguiente de la cola (o lo devuelve al stock).
+    Una transacción por reserva: el UPDATE condicional evita expirar una
+    reserva que se completó en paralelo. Retorna cuántas expiraron.
+    """
+    ahora = ahora or timezone.now()
+    vencidas = Reserva.objects.filter(estado='DISPONIBLE', fecha_limite_retiro__lt=ahora).order_by(
+        'fecha_limite_retiro'
+    ).values_list('pk', 'libro_id')[:limite]
+    expiradas = 0
+    for pk, libro_id in vencidas:
+        with transaction.atomic():
+            if Reserva.objects.filter(pk=pk, estado='DISPONIBLE').update(estado='EXPIRADA'):
+                devolver_ejemplares({libro_id: 1})
+                registro_eventos.registrar(registro_eventos.stock_actualizado([libro_id]))
+                expiradas += 1
+    if expiradas:
+        notificar_cambios(Reserva)
+    return expiradas
+
+
+def contadores_calculados(queryset=None):
+    """Usuarios anotados con sus contadores recalculados desde Prestamo y Multa"""
+    if queryset is None:
+        queryset = Usuario.objects.all()
+    activos = Prestamo.objects.filter(usuario=OuterRef('pk')).exclude(estado='DEVUELTO')
+    pendientes = Multa.objects.filter(prestamo__usuario=OuterRef('pk'), pagada=False)
+    return queryset.annotate(
+        calculado_prestamos_activos=Coalesce(Subquery(
+            activos.values('usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        calculado_multas_pendientes=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(n=Count('pk')).values('n')
+        ), 0),
+        calculado_monto_pendiente=Coalesce(Subquery(
+            pendientes.values('prestamo__usuario').annotate(m=Sum('monto_total')).values('m')
+        ), 0),
+    )
@@ -0,0 +1,131 @@
+"""
+Señales de la API - Aviso de cambios en los datos
+Las escrituras con save()/delete() se detectan con post_save/post_delete;
+las escrituras masivas (update, bulk_create) de api.services avisan con
+notificar_cambios(), que emite la misma señal datos_modificados.
+También se configura cada conexión SQLite nueva (WAL, busy_timeout), las
+migraciones se rutean a la base que se migra y, tras migrar, se verifican
+los triggers del índice de búsqueda.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
+from django.dispatch import Signal, receiver
+
+from . import estadisticas, routers
+from .cache import get_cache
+from .conditional import incrementar_version
+from .models import Usuario, Libro, Prestamo, Multa, Reserva, Evento
+from .search import get_backend
+
+logger = logging.getLogger('api.signals')
+
+# sender: clase del modelo modificado
+datos_modificados = Signal()
+
+# Espacios del caché afectados por cada modelo: un préstamo cambia el stock
+# del libro y los contadores del usuario; una multa, los del usuario.
+ESPACIOS_CACHE = {
+    Libro: ('libros',),
+    Usuario: ('usuarios',),
+    Prestamo: ('libros', 'usuarios'),
+    Multa: ('usuarios',),
+    Reserva: (),
+}
+
+# Fila de VersionTabla de cada modelo (ETag de la API)
+TABLAS_VERSIONADAS = {
+    Usuario: 'usuario',
+    Libro: 'libro',
+    Prestamo: 'prestamo',
+    Multa: 'multa',
+    Reserva: 'reserva',
+    # También ordena los id de los eventos (ver api.eventos)
+    Evento: 'evento',
+}
+
+
+def notificar_cambios(*modelos):
+    for modelo in modelos:
+        datos_modificados.send(sender=modelo)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def cambio_por_orm(sender, **kwargs):
+    if sender in ESPACIOS_CACHE:
+        datos_modificados.send(sender=sender)
+
+
+# Clave de cada modelo en la dimensión 'catalogo' de los rollups
+CATALOGO = {
+    Usuario: 'usuarios',
+    Libro: 'libros',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def contar_catalogo(sender, created=True, **kwargs):
+    # post_delete no trae `created`: la baja se distingue por la señal
+    if sender in CATALOGO and created:
+        delta = -1 if kwargs['signal'] is post_delete else 1
+        estadisticas.registrar({('catalogo', CATALOGO[sender]): delta})
+
+
+@receiver(datos_modificados)
+def invalidar_cache(sender, **kwargs):
+    espacios = ESPACIOS_CACHE.get(sender, ())
+    if espacios:
+        # Después del commit: antes, otro request podría volver a cachear datos viejos
+        transaction.on_commit(lambda: get_cache().invalidar(*espacios))
+
+
+@receiver(datos_modificados)
+def versionar_tabla(sender, **kwargs):
+    # Dentro de la misma transacción que el cambio: serializa las escrituras de
+    # cada tabla en bases con locks por fila (ver api.conditional)
+    if sender in TABLAS_VERSIONADAS:
+        incrementar_version(TABLAS_VERSIONADAS[sender])
+
+
+@receiver(connection_created)
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    WAL: las lecturas no esperan a la escritura en curso y cada commit no
+    reescribe el archivo completo; busy_timeout: una escritura concurrente
+    espera su turno en vez de fallar con "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in getattr(settings, 'API_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
+
+
+@receiver(pre_migrate)
+def iniciar_migracion(sender, using, **kwargs):
+    """Las migraciones de datos leen y escriben en la base que se migra (ver api.routers)"""
+    if sender.name == 'api':
+        routers.fijar_alias_migracion(using)
+
+
+@receiver(post_migrate)
+def asegurar_indice_busqueda(sender, using, **kwargs):
+    """Recrea los triggers del índice de búsqueda si una migración los eliminó"""
+    if sender.name != 'api':
+        return
+    if get_backend(using).asegurar_indice(using):
+        logger.warning('Índice de búsqueda: faltaban triggers de api_libro; se recrearon y se reindexó')
+        # Las búsquedas en caché (y sus ETag) se calcularon con el índice incompleto
+        notificar_cambios(Libro)
+
+
+@receiver(post_migrate)
+def terminar_migracion(sender, **kwargs):
+    # Después de asegurar_indice_busqueda, que también escribe en la base migrada
+    if sender.name == 'api':
+        routers.fijar_alias_migracion(None)
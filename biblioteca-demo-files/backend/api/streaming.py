@@ -0,0 +1,33 @@
+"""
+Respuestas en streaming - Listados completos sin cargar la tabla en memoria
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamingListMixin:
+    """
+    Modo opcional ?stream=ndjson para el listado: recorre el queryset con
+    un cursor del servidor (iterator) y escribe una fila JSON por línea.
+    GET /api/prestamos/?stream=ndjson
+    """
+    stream_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == 'ndjson':
+            queryset = self.filter_queryset(self.get_queryset())
+            return self.stream_ndjson(queryset)
+        return super().list(request, *args, **kwargs)
+
+    def stream_ndjson(self, queryset):
+        # Una sola instancia del serializador: los campos se construyen una vez
+        serializer = self.get_serializer()
+
+        def filas():
+            for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+                fila = serializer.to_representation(obj)
+                yield json.dumps(fila, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(filas(), content_type='application/x-ndjson')
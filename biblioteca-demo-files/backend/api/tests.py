@@ -0,0 +1,1169 @@
+"""
+Tests de api.services, api.anotaciones y de los endpoints de la API
+Ejecutar: python manage.py test api
+(los benchmark_* miden lo mismo a escala; estos casos fijan el comportamiento)
+"""
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal, emit_pre_migrate_signal
+from django.db import OperationalError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api import anotaciones, catalogo, difusion, eventos, search, services
+from api.cache import CacheAPI, CacheDjango, CacheLRU, _Generaciones, get_cache
+from api.models import (
+    Usuario, Libro, Prestamo, Reserva, Multa, Evento, ProgresoTarea, PrestamoArchivado, MultaArchivada,
+)
+from api.routers import ReplicaRouter
+
+
+def crear_libro(isbn='9780000000001', stock=1):
+    return Libro.objects.create(
+        isbn=isbn, titulo=f'Libro {isbn}', autor='Autor', editorial='Editorial',
+        anio_publicacion=2020, stock_total=stock, stock_disponible=stock,
+    )
+
+
+def crear_usuarios(cantidad, **campos):
+    return Usuario.objects.bulk_create([
+        Usuario(rut=f'T-{i}', nombre=f'Usuario {i}', email=f'u{i}@mail.com', **campos)
+        for i in range(cantidad)
+    ])
+
+
+class StockConcurrenteTests(TransactionTestCase):
+    """Préstamos simultáneos del mismo libro (benchmark_reservas a escala)"""
+    hilos = 8
+    solicitudes = 40
+    stock = 5
+
+    def pedir(self, usuario, libro):
+        try:
+            services.prestar_libro(usuario, libro)
+            return 'ok'
+        except services.StockNoDisponible:
+            return 'sin_stock'
+        except OperationalError:
+            return 'bloqueo_bd'
+        finally:
+            connection.close()
+
+    def test_nunca_presta_mas_que_el_stock(self):
+        libro = crear_libro(stock=self.stock)
+        usuarios = crear_usuarios(self.solicitudes)
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            resultados = list(pool.map(lambda usuario: self.pedir(usuario, libro), usuarios))
+
+        libro.refresh_from_db()
+        self.assertEqual(resultados.count('bloqueo_bd'), 0)
+        self.assertEqual(resultados.count('ok'), self.stock)
+        self.assertEqual(resultados.count('sin_stock'), self.solicitudes - self.stock)
+        self.assertEqual(libro.stock_disponible, 0)
+        self.assertEqual(Prestamo.objects.filter(libro=libro).count(), self.stock)
+
+    def test_devolucion_repone_un_ejemplar(self):
+        libro = crear_libro(stock=1)
+        usuario, = crear_usuarios(1)
+        prestamo = services.prestar_libro(usuario, libro)
+        with self.assertRaises(services.StockNoDisponible):
+            services.prestar_libro(usuario, libro)
+
+        services.registrar_devolucion(prestamo)
+        with self.assertRaises(services.OperacionInvalida):
+            services.registrar_devolucion(prestamo)
+        libro.refresh_from_db()
+        usuario.refresh_from_db()
+        self.assertEqual(libro.stock_disponible, 1)
+        self.assertEqual(usuario.prestamos_activos, 0)
+
+
+class ColaReservasTests(TestCase):
+    """Asignación de ejemplares devueltos a la cola de reservas"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=1)
+        self.lector, *self.cola = crear_usuarios(4)
+        self.prestamo = services.prestar_libro(self.lector, self.libro)
+        self.libro.refresh_from_db()
+        self.reservas = [services.reservar_libro(usuario, self.libro) for usuario in self.cola]
+        # El primero de la cola queda bloqueado después de reservar
+        Usuario.objects.filter(pk=self.cola[0].pk).update(bloqueado=True)
+
+    def estados(self):
+        return list(Reserva.objects.filter(pk__in=[r.pk for r in self.reservas]).order_by('id').values_list(
+            'estado', flat=True
+        ))
+
+    def test_devolucion_aparta_para_el_primero_no_bloqueado(self):
+        antes = timezone.now()
+        services.registrar_devolucion(self.prestamo)
+
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'DISPONIBLE', 'EN_ESPERA'])
+        apartada = Reserva.objects.get(pk=self.reservas[1].pk)
+        self.assertGreaterEqual(apartada.fecha_limite_retiro, antes + timedelta(days=services.dias_retiro()))
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 0)
+
+    def test_bloqueado_conserva_su_lugar(self):
+        services.registrar_devolucion(self.prestamo)
+        Usuario.objects.filter(pk=self.cola[0].pk).update(bloqueado=False)
+        services.cancelar_reserva(Reserva.objects.get(pk=self.reservas[1].pk))
+
+        self.assertEqual(self.estados(), ['DISPONIBLE', 'CANCELADA', 'EN_ESPERA'])
+
+    def test_reserva_vencida_pasa_al_siguiente(self):
+        services.registrar_devolucion(self.prestamo)
+
+        expiradas = services.expirar_reservas(timezone.now() + timedelta(days=services.dias_retiro() + 1))
+        self.assertEqual(expiradas, 1)
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'EXPIRADA', 'DISPONIBLE'])
+
+    def test_retiro_no_descuenta_stock(self):
+        services.registrar_devolucion(self.prestamo)
+        services.prestar_libro(Usuario.objects.get(pk=self.cola[1].pk), self.libro)
+
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'COMPLETADA', 'EN_ESPERA'])
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 0)
+
+    def test_sin_cola_habilitada_vuelve_al_stock(self):
+        Reserva.objects.filter(pk__in=[r.pk for r in self.reservas[1:]]).update(estado='CANCELADA')
+        services.registrar_devolucion(self.prestamo)
+
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'CANCELADA', 'CANCELADA'])
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 1)
+
+    def importar_stock(self, stock_total):
+        archivo = StringIO(
+            'isbn,titulo,autor,editorial,anio_publicacion,stock_total\n'
+            f'{self.libro.isbn},{self.libro.titulo},Autor,Editorial,2020,{stock_total}\n'
+        )
+        return catalogo.importar(archivo, 'csv', 'libros')
+
+    def test_importar_mas_ejemplares_aparta_para_la_cola(self):
+        resultado = self.importar_stock(4)
+
+        self.assertEqual((resultado.actualizadas, resultado.errores), (1, 0))
+        # 3 ejemplares nuevos: 2 para la cola habilitada, 1 al stock
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'DISPONIBLE', 'DISPONIBLE'])
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.stock_total, self.libro.stock_disponible), (4, 1))
+
+    def test_importar_menos_ejemplares_que_los_ocupados(self):
+        self.importar_stock(2)
+        self.assertEqual(self.estados(), ['EN_ESPERA', 'DISPONIBLE', 'EN_ESPERA'])
+
+        # Uno prestado y uno apartado: no se puede bajar a 1
+        resultado = self.importar_stock(1)
+        self.assertEqual(resultado.errores, 1)
+        self.assertEqual(resultado.detalle_errores[0]['errores'], {
+            'stock_total': ['Menor que los ejemplares prestados o apartados; el resto de la fila se importó.']
+        })
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.stock_total, self.libro.stock_disponible), (2, 0))
+
+
+class ColaReservasConcurrenteTests(TransactionTestCase):
+    """Devoluciones simultáneas de un título con cola (benchmark_reservas --cola a escala)"""
+    hilos = 8
+    stock = 6
+    en_espera = 30
+
+    def devolver(self, prestamo):
+        try:
+            services.registrar_devolucion(prestamo)
+            return 'ok'
+        except OperationalError:
+            return 'bloqueo_bd'
+        finally:
+            connection.close()
+
+    def test_cada_ejemplar_a_una_reserva_en_orden(self):
+        libro = crear_libro(stock=self.stock)
+        usuarios = crear_usuarios(self.stock + self.en_espera)
+        prestamos = [services.prestar_libro(usuario, libro) for usuario in usuarios[:self.stock]]
+        libro.refresh_from_db()
+        reservas = [services.reservar_libro(usuario, libro) for usuario in usuarios[self.stock:]]
+        # Uno de cada tres en espera queda bloqueado
+        bloqueados = {r.usuario_id for r in reservas[::3]}
+        Usuario.objects.filter(pk__in=bloqueados).update(bloqueado=True)
+
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            resultados = list(pool.map(self.devolver, prestamos))
+
+        self.assertEqual(resultados, ['ok'] * self.stock)
+        habilitadas = [r.pk for r in reservas if r.usuario_id not in bloqueados]
+        apartadas = list(Reserva.objects.filter(libro=libro, estado='DISPONIBLE').order_by('id').values_list(
+            'pk', flat=True
+        ))
+        self.assertEqual(apartadas, habilitadas[:self.stock])
+        libro.refresh_from_db()
+        self.assertEqual(libro.stock_disponible, 0)
+
+
+class AnotacionesTests(TestCase):
+    """dias_retraso / dias_prestamo en SQL contra las propiedades en Python"""
+    # Día siguiente a un 29 de febrero: cruza fin de mes y año bisiesto
+    hoy = date(2024, 3, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        libro = crear_libro()
+        usuario, = crear_usuarios(1)
+        hoy = cls.hoy
+        casos = [
+            ('ACTIVO', hoy, None),                          # vence hoy: sin retraso
+            ('ACTIVO', hoy - timedelta(days=1), None),      # venció ayer
+            ('ACTIVO', hoy + timedelta(days=1), None),      # vence mañana
+            ('ACTIVO', date(2024, 2, 28), None),            # cruza el 29 de febrero
+            ('VENCIDO', date(2023, 3, 1), None),            # un año bisiesto completo
+            ('DEVUELTO', hoy - timedelta(days=5), hoy - timedelta(days=5)),  # devuelto el día del vencimiento
+            ('DEVUELTO', hoy - timedelta(days=5), hoy - timedelta(days=4)),  # un día tarde
+            ('DEVUELTO', hoy - timedelta(days=5), hoy - timedelta(days=9)),  # antes de tiempo
+            ('DEVUELTO', date(2024, 2, 27), hoy),           # tarde, cruzando el 29 de febrero
+            ('DEVUELTO', hoy - timedelta(days=5), None),    # devuelto sin fecha real
+        ]
+        Prestamo.objects.bulk_create([
+            Prestamo(usuario=usuario, libro=libro, estado=estado,
+                     fecha_devolucion_esperada=esperada, fecha_devolucion_real=real)
+            for estado, esperada, real in casos
+        ])
+
+    def test_dias_retraso_igual_a_la_propiedad(self):
+        prestamos = Prestamo.objects.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso(self.hoy)})
+        columnas = ('estado', 'fecha_devolucion_esperada', 'fecha_devolucion_real')
+        filas = list(prestamos.order_by('id').values_list(*columnas, anotaciones.RETRASO))
+        for *valores, retraso in filas:
+            with self.subTest(valores=valores):
+                self.assertEqual(retraso, Prestamo.calcular_dias_retraso(*valores, self.hoy))
+        self.assertEqual([retraso for *_, retraso in filas], [0, 1, 0, 2, 366, 0, 1, 0, 3, 0])
+
+    def test_vencidos_son_los_que_tienen_retraso(self):
+        prestamos = Prestamo.objects.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso(self.hoy)})
+        vencidos = set(prestamos.filter(anotaciones.vencidos(self.hoy)).values_list('pk', flat=True))
+        con_retraso = set(
+            prestamos.filter(estado__in=('ACTIVO', 'VENCIDO'), **{f'{anotaciones.RETRASO}__gt': 0})
+            .values_list('pk', flat=True)
+        )
+        self.assertEqual(vencidos, con_retraso)
+        self.assertEqual(len(vencidos), 3)
+
+    def test_dias_prestamo_igual_a_la_propiedad(self):
+        for tipo, _ in Usuario.TIPO_CHOICES:
+            Usuario.objects.create(rut=f'T-{tipo}', nombre=tipo, email=f'{tipo.lower()}@mail.com', tipo_usuario=tipo)
+        usuarios = Usuario.objects.annotate(**{anotaciones.PLAZO: anotaciones.dias_prestamo()})
+        for usuario in usuarios:
+            with self.subTest(tipo=usuario.tipo_usuario):
+                self.assertEqual(getattr(usuario, anotaciones.PLAZO), usuario.dias_prestamo)
+
+
+class PaginacionCursorTests(TestCase):
+    """El cursor recorre todas las filas una vez aunque el orden tenga empates"""
+    page_size = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        libro = crear_libro()
+        usuario, = crear_usuarios(1)
+        hoy = anotaciones.hoy()
+        # Más empates en dias_retraso = 0 que el offset_cutoff (1000) del cursor de DRF
+        # y la misma fecha_prestamo en todo el bulk_create
+        Prestamo.objects.bulk_create([
+            Prestamo(usuario=usuario, libro=libro,
+                     fecha_devolucion_esperada=hoy - timedelta(days=i % 4 if i % 3 == 0 else -1))
+            for i in range(1203)
+        ])
+        cls.ids = set(Prestamo.objects.values_list('id', flat=True))
+
+    def recorrer(self, url, enlace='next'):
+        cliente = Client()
+        vistos = []
+        for _ in range(len(self.ids) // self.page_size + 2):
+            datos = cliente.get(url).json()
+            vistos += [fila['id'] for fila in datos['results']]
+            url = datos[enlace]
+            if url is None:
+                return vistos, datos
+        self.fail(f'{url}: la paginación no termina')
+
+    def test_cada_orden_recorre_todas_las_filas_una_vez(self):
+        urls = [f'/api/prestamos/?page_size={self.page_size}&ordering={orden}'
+                for orden in ('', 'dias_retraso', '-dias_retraso')]
+        # La vista async usa el mismo cursor (apaginate_queryset)
+        urls.append(f'/api/async/prestamos/?page_size={self.page_size}')
+        for url in urls:
+            with self.subTest(url=url):
+                vistos, ultima = self.recorrer(url)
+                self.assertEqual(len(vistos), len(set(vistos)))
+                self.assertEqual(set(vistos), self.ids)
+
+                # Y de vuelta desde la última página con los enlaces previous
+                url = ultima['previous']
+                if url is not None:
+                    anteriores, _ = self.recorrer(url, 'previous')
+                    self.assertEqual(len(anteriores), len(set(anteriores)))
+                    self.assertEqual(set(anteriores) | {fila['id'] for fila in ultima['results']}, self.ids)
+
+    def test_orden_por_retraso(self):
+        vistos, _ = self.recorrer(f'/api/prestamos/?page_size={self.page_size}&ordering=-dias_retraso')
+        retrasos = dict(
+            Prestamo.objects.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso()})
+            .values_list('id', anotaciones.RETRASO)
+        )
+        claves = [(-retrasos[pk], -pk) for pk in vistos]
+        self.assertEqual(claves, sorted(claves))
+
+    def test_cursor_invalido(self):
+        self.assertEqual(Client().get('/api/prestamos/?cursor=cD1hYmM=').status_code, 404)
+
+
+class IndiceBusquedaTests(TestCase):
+    """El índice FTS5 sigue a api_libro (triggers) y se repara tras migrar"""
+
+    def buscar(self, texto):
+        response = Client().get('/api/libros/', {'search': texto})
+        self.assertEqual(response.status_code, 200)
+        return [fila['isbn'] for fila in response.json()['results']]
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_libro'")
+            return {fila[0] for fila in cursor.fetchall()}
+
+    def test_libro_creado_por_el_orm_se_encuentra(self):
+        libro = crear_libro()
+        Libro.objects.filter(pk=libro.pk).update(titulo='Programación funcional')
+
+        self.assertEqual(self.buscar('programacion'), [libro.isbn])
+        self.assertEqual(self.buscar('Libro'), [])
+
+    def test_triggers_perdidos_se_recrean_al_migrar(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('índice FTS5 solo en SQLite')
+        crear_libro('9780000000001')
+        # Lo que deja una migración que rehace api_libro: la tabla FTS sin triggers
+        with connection.cursor() as cursor:
+            for nombre in search.TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {nombre}')
+        crear_libro('9780000000002')
+        self.assertEqual(self.buscar('9780000000002'), [])
+
+        # La invalidación del caché corre en on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+        self.assertEqual(self.triggers(), set(search.TRIGGERS))
+        # Reindexado: aparece el libro creado sin triggers, y los nuevos se indexan
+        self.assertEqual(self.buscar('9780000000002'), ['9780000000002'])
+        crear_libro('9780000000003')
+        self.assertEqual(self.buscar('9780000000003'), ['9780000000003'])
+
+
+class RuteoMigracionTests(TestCase):
+    """`migrate --database X`: las migraciones de datos leen y escriben en X"""
+
+    def test_migracion_usa_la_base_migrada(self):
+        router = ReplicaRouter()
+        emit_pre_migrate_signal(verbosity=0, interactive=False, db='replica')
+        self.assertEqual(router.db_for_write(Usuario), 'replica')
+        self.assertEqual(router.db_for_read(Usuario), 'replica')
+        with self.captureOnCommitCallbacks(execute=True):
+            emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+        self.assertEqual(router.db_for_write(Usuario), 'default')
+        self.assertEqual(router.db_for_read(Usuario), 'default')
+
+
+class PresupuestoConsultasTests(TransactionTestCase):
+    """
+    Consultas por endpoint: fijas sin importar cuántas filas haya (N+1).
+    TransactionTestCase para contar las transacciones reales; assertNumQueries
+    incluye BEGIN y COMMIT, el contador del middleware no cuenta el COMMIT.
+    """
+    filas = 5
+
+    def setUp(self):
+        # El caché de lectura es del proceso y sobrevive al flush entre tests
+        get_cache().invalidar('libros', 'usuarios')
+        self.libro = crear_libro(stock=2 * self.filas)
+        agotado = crear_libro('9780000000002', stock=0)
+        crear_usuarios(self.filas + 1)
+        *usuarios, self.usuario = Usuario.objects.order_by('id')
+        atrasado = timezone.localdate() - timedelta(days=3)
+        for usuario in usuarios:
+            prestamo = services.prestar_libro(usuario, self.libro)
+            services.prestar_libro(usuario, self.libro)
+            Prestamo.objects.filter(pk=prestamo.pk).update(fecha_devolucion_esperada=atrasado)
+            prestamo.refresh_from_db()
+            services.registrar_devolucion(prestamo)
+            services.reservar_libro(usuario, agotado)
+
+    def post(self, url, datos=None, clave=None, cliente=None):
+        extra = {'HTTP_IDEMPOTENCY_KEY': clave} if clave else {}
+        return (cliente or self.client).post(url, datos, content_type='application/json', **extra)
+
+    def test_listados(self):
+        urls = ['/api/libros/', '/api/usuarios/', '/api/prestamos/', '/api/multas/', '/api/reservas/',
+                '/api/async/libros/', '/api/async/prestamos/']
+        for url in urls:
+            # Versión de las tablas (ETag) y la página
+            with self.subTest(url=url), self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(len(response.json()['results']), 1)
+
+    def test_escrituras_de_circulacion(self):
+        with self.assertNumQueries(17):
+            response = self.post('/api/prestamos/', {'usuario': self.usuario.pk, 'libro': self.libro.isbn}, 'p')
+        self.assertEqual(response.status_code, 201)
+        prestamo = response.json()['id']
+
+        with self.assertNumQueries(9):
+            response = self.post(f'/api/prestamos/{prestamo}/renovar/', clave='r')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(15):
+            response = self.post(f'/api/prestamos/{prestamo}/devolver/', clave='d')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['multa'])
+
+        # Devolución atrasada: además la multa y el bloqueo del usuario
+        prestamo = services.prestar_libro(self.usuario, self.libro)
+        Prestamo.objects.filter(pk=prestamo.pk).update(fecha_devolucion_esperada=timezone.localdate() - timedelta(days=1))
+        with self.assertNumQueries(17):
+            response = self.post(f'/api/prestamos/{prestamo.pk}/devolver/', clave='d2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['multa'])
+
+    def test_presupuesto_por_accion(self):
+        """El middleware usa el presupuesto de la acción; sin él, el global"""
+        multa = Multa.objects.first()
+        # Devoluciones en lote atrasadas: el peor camino (multas y bloqueos)
+        Prestamo.objects.filter(estado='ACTIVO').update(
+            fecha_devolucion_esperada=timezone.localdate() - timedelta(days=1)
+        )
+        escrituras = [
+            ('/api/prestamos/', {'usuario': self.usuario.pk, 'libro': self.libro.isbn}),
+            (f'/api/multas/{multa.pk}/pagar/', None),
+            ('/api/prestamos/bulk/', {'prestamos': [
+                {'usuario': usuario.pk, 'libro': self.libro.isbn} for usuario in Usuario.objects.all()
+            ]}),
+            ('/api/prestamos/bulk-devolver/', {'prestamos': list(
+                Prestamo.objects.filter(estado='ACTIVO').values_list('id', flat=True)
+            )}),
+        ]
+        with override_settings(API_INSTRUMENTACION_CONSULTAS=True, API_PRESUPUESTO_CONSULTAS=1):
+            cliente = Client()
+            with self.assertNoLogs('api.consultas', 'WARNING'):
+                for i, (url, datos) in enumerate(escrituras):
+                    response = self.post(url, datos, f'clave-{i}', cliente)
+                    self.assertLess(response.status_code, 300, url)
+            with self.assertLogs('api.consultas', 'WARNING'):
+                response = cliente.get('/api/prestamos/')
+            self.assertEqual(response['X-Query-Count'], '2')
+
+
+class IdempotenciaTests(TransactionTestCase):
+    """Idempotency-Key en POST /api/prestamos/: una sola ejecución por clave"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=5)
+        crear_usuarios(2)
+        self.usuario, self.otro = Usuario.objects.order_by('id')
+
+    def prestar(self, usuario, clave, cliente=None):
+        return (cliente or self.client).post(
+            '/api/prestamos/', {'usuario': usuario.pk, 'libro': self.libro.isbn},
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=clave,
+        )
+
+    def test_reintento_recibe_la_respuesta_guardada(self):
+        primera = self.prestar(self.usuario, 'clave-1')
+        self.assertEqual(primera.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', primera)
+
+        repetida = self.prestar(self.usuario, 'clave-1')
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(Prestamo.objects.count(), 1)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 4)
+
+    def test_misma_clave_con_otro_cuerpo(self):
+        self.assertEqual(self.prestar(self.usuario, 'clave-1').status_code, 201)
+        response = self.prestar(self.otro, 'clave-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Prestamo.objects.count(), 1)
+
+    def test_operacion_fallida_libera_la_clave(self):
+        Usuario.objects.filter(pk=self.usuario.pk).update(bloqueado=True)
+        self.assertEqual(self.prestar(self.usuario, 'clave-1').status_code, 400)
+        Usuario.objects.filter(pk=self.usuario.pk).update(bloqueado=False)
+        self.assertEqual(self.prestar(self.usuario, 'clave-1').status_code, 201)
+
+    def test_duplicados_simultaneos_prestan_una_vez(self):
+        hilos = 6
+
+        def pedir(_):
+            try:
+                response = self.prestar(self.usuario, 'clave-1', Client())
+                return response.status_code, response.get('Idempotent-Replayed'), response.json()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            respuestas = list(pool.map(pedir, range(hilos)))
+
+        self.assertEqual({status for status, _, _ in respuestas}, {201})
+        self.assertEqual([repetida for _, repetida, _ in respuestas].count(None), 1)
+        self.assertEqual(len({datos['id'] for _, _, datos in respuestas}), 1)
+        self.assertEqual(Prestamo.objects.count(), 1)
+        self.libro.refresh_from_db()
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 4)
+        self.assertEqual(self.usuario.prestamos_activos, 1)
+
+
+class RespuestasCondicionalesTests(TestCase):
+    """ETag de los GET: 304 mientras no cambien las tablas del endpoint"""
+
+    def setUp(self):
+        get_cache().invalidar('libros', 'usuarios')
+        self.libro = crear_libro(stock=5)
+        crear_usuarios(3)
+        self.usuarios = list(Usuario.objects.order_by('id'))
+
+    def prestar(self, usuario):
+        # La invalidación del caché de lectura corre en on_commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/prestamos/', {'usuario': usuario.pk, 'libro': self.libro.isbn},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_304_hasta_que_cambian_los_datos(self):
+        urls = ['/api/libros/', f'/api/libros/{self.libro.isbn}/', '/api/prestamos/']
+        for url, usuario in zip(urls, self.usuarios):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # Solo la consulta de las versiones
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+                self.prestar(usuario)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_escritura_de_otra_tabla_no_cambia_el_etag(self):
+        etag = self.client.get('/api/reservas/')['ETag']
+        self.prestar(self.usuarios[0])
+        self.assertEqual(self.client.get('/api/reservas/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class CacheLecturaTests(TestCase):
+    """
+    El LRU es por proceso; con BACKEND 'django' entradas y generaciones viven en
+    CACHES[ALIAS] y una invalidación llega a todos los procesos que lo comparten.
+    Cada CacheAPI hace de un worker distinto.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_lru_solo_invalida_su_proceso(self):
+        a, b = (CacheAPI(CacheLRU(16, 60), 60, generaciones=_Generaciones()) for _ in range(2))
+        for cache in (a, b):
+            cache.guardar(cache.clave('libros', 'x'), {'titulo': 'viejo'})
+        a.invalidar('libros')
+        self.assertIsNone(a.obtener(a.clave('libros', 'x'), 'libros'))
+        self.assertEqual(b.obtener(b.clave('libros', 'x'), 'libros'), {'titulo': 'viejo'})
+
+    def test_backend_django_comparte_la_invalidacion(self):
+        a, b = (CacheAPI(CacheDjango('default'), 60, generaciones=CacheDjango('default')) for _ in range(2))
+        a.guardar(a.clave('libros', 'x'), {'titulo': 'viejo'})
+        self.assertEqual(b.obtener(b.clave('libros', 'x'), 'libros'), {'titulo': 'viejo'})
+        b.invalidar('libros')
+        self.assertIsNone(a.obtener(a.clave('libros', 'x'), 'libros'))
+
+    @override_settings(API_CACHE={'BACKEND': 'django', 'ALIAS': 'default', 'TTL': 60})
+    def test_vista_con_backend_django(self):
+        libro = crear_libro()
+        url = f'/api/libros/{libro.isbn}/'
+        with mock.patch('api.cache._cache', None):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(url, {'titulo': 'Nuevo'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['titulo'], 'Nuevo')
+
+
+class ProyeccionDetalleTests(TestCase):
+    """?fields= / ?expand= en el detalle: mismo JSON recortado y SELECT de esas columnas"""
+
+    def setUp(self):
+        get_cache().invalidar('libros', 'usuarios')
+        self.libro = crear_libro(stock=2)
+        crear_usuarios(1)
+        self.usuario = Usuario.objects.get()
+        self.prestamo = services.prestar_libro(self.usuario, self.libro)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [q['sql'] for q in consultas.captured_queries if 'api_versiontabla' not in q['sql']]
+        return response.json(), selects
+
+    def test_fields_limita_respuesta_y_select(self):
+        casos = [
+            (f'/api/libros/{self.libro.isbn}/', 'titulo,disponible', 'editorial'),
+            (f'/api/async/libros/{self.libro.isbn}/', 'titulo,disponible', 'editorial'),
+            (f'/api/usuarios/{self.usuario.pk}/', 'nombre,dias_prestamo', 'email'),
+            (f'/api/prestamos/{self.prestamo.pk}/', 'id,estado,dias_retraso', 'renovado'),
+            (f'/api/async/prestamos/{self.prestamo.pk}/', 'id,estado,dias_retraso', 'renovado'),
+        ]
+        for url, campos, omitida in casos:
+            with self.subTest(url=url):
+                completo, _ = self.get(url)
+                datos, selects = self.get(f'{url}?fields={campos}')
+                self.assertEqual(datos, {c: completo[c] for c in campos.split(',')})
+                self.assertEqual(len(selects), 1)
+                self.assertNotIn(f'"{omitida}"', selects[0])
+
+    def test_expand_en_el_detalle(self):
+        for url in (f'/api/prestamos/{self.prestamo.pk}/', f'/api/async/prestamos/{self.prestamo.pk}/'):
+            with self.subTest(url=url):
+                datos, selects = self.get(f'{url}?fields=id&expand=libro')
+                self.assertEqual(datos['libro'], self.get(f'/api/libros/{self.libro.isbn}/')[0])
+                self.assertEqual(set(datos), {'id', 'libro'})
+                self.assertEqual(len(selects), 1)
+
+    def test_detalle_inexistente(self):
+        for url in ('/api/usuarios/999/?fields=nombre', '/api/async/libros/999/?fields=titulo'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class LotesTests(TestCase):
+    """prestar_en_lote / devolver_en_lote: errores por ítem y todo o nada"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=2)
+        self.agotado = crear_libro('9780000000002', stock=0)
+        crear_usuarios(3)
+        self.usuario, self.otro, self.bloqueado = Usuario.objects.order_by('id')
+        Usuario.objects.filter(pk=self.bloqueado.pk).update(bloqueado=True)
+
+    def prestamos_activos(self):
+        return dict(Usuario.objects.values_list('id', 'prestamos_activos'))
+
+    def test_prestar_con_errores_por_item(self):
+        items = [
+            {'usuario': self.usuario.pk, 'libro': self.libro.isbn},
+            {'usuario': 999, 'libro': self.libro.isbn},
+            {'usuario': self.bloqueado.pk, 'libro': self.libro.isbn},
+            {'usuario': self.otro.pk, 'libro': self.agotado.isbn},
+            {'usuario': self.otro.pk, 'libro': self.libro.isbn},
+            # El stock ya lo usaron los ítems anteriores del lote
+            {'usuario': self.otro.pk, 'libro': self.libro.isbn},
+        ]
+        prestamos, errores = services.prestar_en_lote(items)
+
+        self.assertEqual([p.indice for p in prestamos], [0, 4])
+        self.assertEqual(errores, {
+            1: 'Usuario o libro inexistente',
+            2: 'El usuario está bloqueado por multas pendientes',
+            3: 'El libro no está disponible',
+            5: 'El libro no está disponible',
+        })
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 0)
+        self.assertEqual(self.prestamos_activos(), {self.usuario.pk: 1, self.otro.pk: 1, self.bloqueado.pk: 0})
+
+    def test_prestar_sin_items_validos(self):
+        prestamos, errores = services.prestar_en_lote([{'usuario': self.bloqueado.pk, 'libro': self.libro.isbn}])
+        self.assertEqual((prestamos, list(errores)), ([], [0]))
+        self.assertFalse(Prestamo.objects.exists())
+
+    def test_prestar_con_stock_cambiado_revierte_el_lote(self):
+        items = [{'usuario': self.usuario.pk, 'libro': self.libro.isbn},
+                 {'usuario': self.otro.pk, 'libro': self.libro.isbn}]
+        # El lote lee stock 2; antes del UPDATE otro request presta un ejemplar
+        leidos = Libro.objects.in_bulk([self.libro.isbn])
+        Libro.objects.filter(pk=self.libro.pk).update(stock_disponible=1)
+        with mock.patch.object(Libro.objects, 'in_bulk', return_value=leidos):
+            with self.assertRaises(services.ConflictoConcurrente):
+                services.prestar_en_lote(items)
+
+        self.assertFalse(Prestamo.objects.exists())
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 1)
+        self.assertEqual(set(self.prestamos_activos().values()), {0})
+
+    def test_devolver_con_errores_por_item(self):
+        atrasado = services.prestar_libro(self.usuario, self.libro)
+        a_tiempo = services.prestar_libro(self.otro, self.libro)
+        Prestamo.objects.filter(pk=atrasado.pk).update(fecha_devolucion_esperada=timezone.localdate() - timedelta(days=2))
+        devuelto = services.prestar_libro(self.usuario, crear_libro('9780000000003'))
+        services.registrar_devolucion(devuelto)
+
+        ids = [atrasado.pk, 999, a_tiempo.pk, atrasado.pk, devuelto.pk]
+        devueltos, errores = services.devolver_en_lote(ids)
+
+        self.assertEqual([p.indice for p in devueltos], [0, 2])
+        self.assertEqual(errores, {
+            1: 'Préstamo inexistente',
+            3: 'Préstamo repetido en el lote',
+            4: 'Este préstamo ya fue devuelto',
+        })
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 2)
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        self.assertEqual((usuario.prestamos_activos, usuario.multas_pendientes, usuario.bloqueado), (0, 1, True))
+        self.assertEqual(Multa.objects.get().prestamo_id, atrasado.pk)
+
+    def test_devolver_con_prestamo_ya_devuelto_revierte_el_lote(self):
+        ids = [services.prestar_libro(usuario, self.libro).pk for usuario in (self.usuario, self.otro)]
+        # El lote lee los dos activos; antes del UPDATE otro request devuelve uno
+        leidos = Prestamo.objects.select_related('usuario').in_bulk(ids)
+        services.registrar_devolucion(Prestamo.objects.get(pk=ids[0]))
+        lectura = mock.Mock(in_bulk=mock.Mock(return_value=leidos))
+        with mock.patch.object(Prestamo.objects, 'select_related', return_value=lectura):
+            with self.assertRaises(services.ConflictoConcurrente):
+                services.devolver_en_lote(ids)
+
+        self.assertEqual(Prestamo.objects.get(pk=ids[1]).estado, 'ACTIVO')
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock_disponible, 1)
+        self.assertEqual(self.prestamos_activos()[self.otro.pk], 1)
+
+
+class MarcarVencidosTests(TestCase):
+    """Barrido por lotes de marcar_vencidos: checkpoint, reanudación e idempotencia"""
+    lote = 3
+
+    def setUp(self):
+        libro = crear_libro(stock=20)
+        crear_usuarios(4)
+        usuarios = list(Usuario.objects.order_by('id'))
+        hoy = timezone.localdate()
+        # 10 atrasados (4 lotes de 3), repartidos entre los 4 usuarios
+        Prestamo.objects.bulk_create(
+            [Prestamo(usuario=usuarios[i % 4], libro=libro, fecha_devolucion_esperada=hoy - timedelta(days=1 + i))
+             for i in range(10)]
+            # No vencen: al día, o devuelto tarde
+            + [Prestamo(usuario=usuarios[0], libro=libro, fecha_devolucion_esperada=hoy),
+               Prestamo(usuario=usuarios[1], libro=libro, fecha_devolucion_esperada=hoy - timedelta(days=5),
+                        estado='DEVUELTO', fecha_devolucion_real=hoy)]
+        )
+        self.atrasados = set(
+            Prestamo.objects.filter(estado='ACTIVO', fecha_devolucion_esperada__lt=hoy).values_list('id', flat=True)
+        )
+
+    def barrer(self):
+        salida = StringIO()
+        call_command('marcar_vencidos', lote=self.lote, stdout=salida)
+        return salida.getvalue()
+
+    def vencidos(self):
+        return set(Prestamo.objects.filter(estado='VENCIDO').values_list('id', flat=True))
+
+    def test_barrido_en_varios_lotes(self):
+        with mock.patch.object(services, 'marcar_vencidos', wraps=services.marcar_vencidos) as marcar:
+            self.barrer()
+
+        self.assertEqual(marcar.call_count, 4)
+        self.assertEqual(self.vencidos(), self.atrasados)
+        self.assertEqual(Usuario.objects.filter(bloqueado=True).count(), 4)
+        self.assertEqual(Evento.objects.filter(tipo='PRESTAMO_VENCIDO').count(), 10)
+        progreso = ProgresoTarea.objects.get(nombre='marcar_vencidos')
+        self.assertEqual((progreso.completada, progreso.procesados, progreso.ultimo_id),
+                         (True, 10, max(self.atrasados)))
+
+    def test_retoma_desde_el_ultimo_lote_confirmado(self):
+        original = services.marcar_vencidos
+        llamadas = []
+
+        def falla_en_el_tercero(ids, hoy):
+            llamadas.append(ids)
+            if len(llamadas) == 3:
+                raise OperationalError('interrumpido')
+            return original(ids, hoy)
+
+        with mock.patch.object(services, 'marcar_vencidos', side_effect=falla_en_el_tercero):
+            with self.assertRaises(OperationalError):
+                self.barrer()
+
+        confirmados = set(llamadas[0] + llamadas[1])
+        self.assertEqual(self.vencidos(), confirmados)
+        progreso = ProgresoTarea.objects.get(nombre='marcar_vencidos')
+        self.assertEqual((progreso.completada, progreso.procesados, progreso.ultimo_id),
+                         (False, 6, llamadas[1][-1]))
+
+        with mock.patch.object(services, 'marcar_vencidos', wraps=original) as marcar:
+            salida = self.barrer()
+        self.assertIn(f'Retomando desde el préstamo {llamadas[1][-1]}', salida)
+        # Solo los lotes pendientes
+        self.assertEqual(sorted(pk for (ids, _), _ in marcar.call_args_list for pk in ids),
+                         sorted(self.atrasados - confirmados))
+        self.assertEqual(self.vencidos(), self.atrasados)
+        self.assertEqual(Evento.objects.filter(tipo='PRESTAMO_VENCIDO').count(), 10)
+
+    def test_repetir_no_cambia_nada(self):
+        self.barrer()
+        eventos = Evento.objects.count()
+        estados = dict(Prestamo.objects.values_list('id', 'estado'))
+
+        salida = self.barrer()
+        self.assertIn('0 préstamos marcados como VENCIDO, 0 usuarios bloqueados', salida)
+        self.assertEqual(dict(Prestamo.objects.values_list('id', 'estado')), estados)
+        self.assertEqual(Evento.objects.count(), eventos)
+
+
+class ArchivoTests(TestCase):
+    """archivar_historial: lo archivado sale de api_prestamo y sigue en el historial"""
+
+    def setUp(self):
+        libro = crear_libro(stock=5)
+        crear_usuarios(1)
+        self.usuario = Usuario.objects.get()
+        hoy = timezone.localdate()
+        antiguo = hoy - timedelta(days=400)
+
+        def prestamo(dias_atrasado=0, devuelto=None, pagar=False):
+            p = services.prestar_libro(self.usuario, libro)
+            if dias_atrasado:
+                Prestamo.objects.filter(pk=p.pk).update(fecha_devolucion_esperada=hoy - timedelta(days=dias_atrasado))
+                p.refresh_from_db()
+            if devuelto is not None:
+                services.registrar_devolucion(p)
+                Prestamo.objects.filter(pk=p.pk).update(fecha_devolucion_real=devuelto)
+            if pagar:
+                services.pagar_multa(Multa.objects.get(prestamo=p))
+                Multa.objects.filter(prestamo=p).update(fecha_pago=timezone.now() - timedelta(days=400))
+            # Fechas de préstamo distintas: el historial se ordena por ellas
+            Prestamo.objects.filter(pk=p.pk).update(fecha_prestamo=timezone.now() - timedelta(days=500 - p.pk))
+            return p.pk
+
+        self.sin_multa = prestamo(devuelto=antiguo)
+        self.multa_pagada = prestamo(dias_atrasado=3, devuelto=antiguo, pagar=True)
+        self.multa_pendiente = prestamo(dias_atrasado=3, devuelto=antiguo)
+        self.reciente = prestamo(devuelto=hoy)
+        self.activo = prestamo()
+
+    def contadores(self):
+        return Usuario.objects.filter(pk=self.usuario.pk).values(*services.CONTADORES).get()
+
+    def test_archiva_solo_lo_antiguo_y_cerrado(self):
+        contadores = self.contadores()
+        call_command('archivar_historial', dias=365, stdout=StringIO())
+
+        archivados = {self.sin_multa, self.multa_pagada}
+        self.assertEqual(set(PrestamoArchivado.objects.values_list('id', flat=True)), archivados)
+        self.assertEqual(set(Prestamo.objects.values_list('id', flat=True)),
+                         {self.multa_pendiente, self.reciente, self.activo})
+        self.assertEqual(list(MultaArchivada.objects.values_list('prestamo_id', flat=True)), [self.multa_pagada])
+        self.assertEqual(list(Multa.objects.values_list('prestamo_id', flat=True)), [self.multa_pendiente])
+
+        ids = {fila['id'] for fila in self.client.get('/api/prestamos/').json()['results']}
+        self.assertFalse(ids & archivados)
+
+        # Los contadores no cambian y coinciden con los recalculados sin el archivo
+        self.assertEqual(self.contadores(), contadores)
+        self.assertEqual(contadores, {'prestamos_activos': 1, 'multas_pendientes': 1,
+                                      'monto_pendiente': Multa.objects.get().monto_total})
+        salida = StringIO()
+        call_command('reconciliar_contadores', solo_reportar=True, stdout=salida)
+        self.assertIn('con diferencias: 0', salida.getvalue())
+
+    def test_historial_incluye_lo_archivado(self):
+        antes = self.client.get(f'/api/usuarios/{self.usuario.pk}/historial/').json()['results']
+        call_command('archivar_historial', dias=365, stdout=StringIO())
+
+        url = f'/api/usuarios/{self.usuario.pk}/historial/?page_size=2'
+        filas = []
+        while url:
+            datos = self.client.get(url).json()
+            filas += datos['results']
+            url = datos['next']
+
+        self.assertEqual([fila['id'] for fila in filas],
+                         [self.activo, self.reciente, self.multa_pendiente, self.multa_pagada, self.sin_multa])
+        self.assertEqual({fila['id'] for fila in filas if fila['archivado']}, {self.sin_multa, self.multa_pagada})
+        # Mismo JSON que antes de archivar, salvo la marca
+        for fila in filas:
+            fila.pop('archivado')
+        for fila in antes:
+            fila.pop('archivado')
+        self.assertEqual(filas, antes)
+
+    def test_repetir_no_archiva_de_nuevo(self):
+        call_command('archivar_historial', dias=365, stdout=StringIO())
+        call_command('archivar_historial', dias=365, stdout=StringIO())
+        self.assertEqual(PrestamoArchivado.objects.count(), 2)
+        self.assertEqual(Prestamo.objects.count(), 3)
+
+
+class EventosTests(TestCase):
+    """Registro de eventos: uno por cambio, en el orden de las operaciones"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=2)
+        crear_usuarios(2)
+        self.usuario, self.otro = Usuario.objects.order_by('id')
+
+    def test_operaciones_en_orden(self):
+        prestamo = services.prestar_libro(self.usuario, self.libro)
+        services.renovar_prestamo(prestamo)
+        Prestamo.objects.filter(pk=prestamo.pk).update(fecha_devolucion_esperada=timezone.localdate() - timedelta(days=2))
+        prestamo.refresh_from_db()
+        services.registrar_devolucion(prestamo)
+        services.pagar_multa(Multa.objects.select_related('prestamo').get())
+
+        datos = self.client.get('/api/eventos/').json()
+        tipos = [evento['tipo'] for evento in datos['eventos']]
+        self.assertEqual(tipos, [
+            'PRESTAMO_CREADO', 'PRESTAMO_RENOVADO', 'PRESTAMO_DEVUELTO', 'MULTA_GENERADA',
+            'USUARIO_BLOQUEADO', 'MULTA_PAGADA', 'USUARIO_DESBLOQUEADO',
+        ])
+        ids = [evento['id'] for evento in datos['eventos']]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(datos['ultimo'], ids[-1])
+
+        # De a dos con since=ultimo: los mismos eventos, y al final ninguno
+        desde, leidos = 0, []
+        while True:
+            pagina = self.client.get('/api/eventos/', {'since': desde, 'limit': 2}).json()
+            if not pagina['eventos']:
+                break
+            leidos += [evento['id'] for evento in pagina['eventos']]
+            desde = pagina['ultimo']
+        self.assertEqual((leidos, desde), (ids, ids[-1]))
+
+        # Con filtro el consumidor avanza igual hasta el último evento
+        pagina = self.client.get('/api/eventos/', {'usuario': self.otro.pk}).json()
+        self.assertEqual((pagina['eventos'], pagina['ultimo']), ([], ids[-1]))
+
+    def test_operacion_revertida_sin_evento(self):
+        services.prestar_libro(self.usuario, self.libro)
+        services.prestar_libro(self.otro, self.libro)
+        # Los servicios no usan savepoint: el del test aísla la transacción revertida
+        with self.assertRaises(services.StockNoDisponible), transaction.atomic():
+            services.prestar_libro(self.usuario, self.libro)
+        self.assertEqual(Evento.objects.filter(tipo='PRESTAMO_CREADO').count(), 2)
+
+
+class EventosConcurrentesTests(TransactionTestCase):
+    """Un consumidor que lee durante escrituras simultáneas no salta ni repite eventos"""
+    hilos = 6
+    solicitudes = 30
+
+    def test_consumidor_recibe_cada_evento_una_vez(self):
+        libro = crear_libro(stock=self.solicitudes)
+        crear_usuarios(self.solicitudes)
+        usuarios = list(Usuario.objects.all())
+        leidos = []
+        terminado = threading.Event()
+
+        def consumir():
+            desde = 0
+            try:
+                while True:
+                    fin = terminado.is_set()
+                    desde, filas = eventos.leer(desde, eventos.LIMITE_MAXIMO)
+                    leidos.extend(fila['id'] for fila in filas)
+                    if fin and not filas:
+                        return
+            finally:
+                connection.close()
+
+        def prestar(usuario):
+            try:
+                services.prestar_libro(usuario, libro)
+            finally:
+                connection.close()
+
+        consumidor = threading.Thread(target=consumir)
+        consumidor.start()
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            list(pool.map(prestar, usuarios))
+        terminado.set()
+        consumidor.join()
+
+        self.assertEqual(leidos, sorted(set(leidos)))
+        self.assertEqual(leidos, list(Evento.objects.values_list('id', flat=True)))
+        self.assertEqual(len(leidos), self.solicitudes)
+
+
+class DifusionTests(TestCase):
+    """Mensajes SSE: armado por tanda, canales de la suscripción y flujo de un cliente"""
+
+    def test_un_mensaje_de_stock_por_libro_y_tanda(self):
+        libro, otro = crear_libro(stock=2), crear_libro('9780000000002', stock=1)
+        crear_usuarios(2)
+        usuario, segundo = Usuario.objects.order_by('id')
+        desde = eventos.ultimo_id()
+        prestamo = services.prestar_libro(usuario, libro)
+        services.prestar_libro(segundo, libro)
+        services.registrar_devolucion(prestamo)
+        services.prestar_libro(usuario, otro)
+        with transaction.atomic():
+            eventos.registrar(eventos.stock_actualizado(['9780000000003']))
+
+        _, filas = eventos.leer(desde, 100)
+        ids = [fila['id'] for fila in filas]
+        # Una consulta para el stock de toda la tanda
+        with self.assertNumQueries(1):
+            mensajes = difusion.armar_mensajes(filas)
+
+        usuario_canal, segundo_canal = difusion.canal_usuario(usuario.pk), difusion.canal_usuario(segundo.pk)
+        self.assertEqual([(m.id, m.evento, m.canales) for m in mensajes], [
+            (ids[0], 'prestamo', (usuario_canal,)),
+            (ids[1], 'prestamo', (segundo_canal,)),
+            (ids[2], 'prestamo', (usuario_canal,)),
+            # El último cambio de cada libro, con el stock actual
+            (ids[2], 'libro', (difusion.TODOS_LOS_LIBROS, difusion.canal_libro(libro.isbn))),
+            (ids[3], 'prestamo', (usuario_canal,)),
+            (ids[3], 'libro', (difusion.TODOS_LOS_LIBROS, difusion.canal_libro(otro.isbn))),
+        ])
+        self.assertEqual([m.datos['estado'] for m in mensajes if m.evento == 'prestamo'],
+                         ['ACTIVO', 'ACTIVO', 'DEVUELTO', 'ACTIVO'])
+        self.assertEqual([m.datos for m in mensajes if m.evento == 'libro'], [
+            {'isbn': libro.isbn, 'stock_disponible': 1, 'disponible': True},
+            {'isbn': otro.isbn, 'stock_disponible': 0, 'disponible': False},
+        ])
+
+    def test_canales(self):
+        config = {**difusion.configuracion(), 'MAX_LIBROS': 2}
+        casos = {
+            'libros=*': ([difusion.TODOS_LOS_LIBROS], None),
+            'libros=111,222&usuario=7': (['libro:111', 'libro:222', 'usuario:7'], None),
+            'libros=1,2,3': (None, {'libros': 'Máximo 2 libros por conexión'}),
+            'usuario=abc': (None, {'usuario': 'Debe ser un id numérico'}),
+            'libros=': (None, {'error': 'Indique ?libros= y/o ?usuario='}),
+        }
+        for consulta, esperado in casos.items():
+            with self.subTest(consulta=consulta):
+                parametros = dict(parte.split('=') for parte in consulta.split('&'))
+                self.assertEqual(difusion.StreamASGI.canales(parametros, config), esperado)
+
+    async def leer_flujo(self, suscripcion, recuperados, hasta, completo):
+        difusor = mock.Mock()
+        config = {'LATIDO': 0.01, 'DURACION_MAXIMA': 0.05}
+        partes = [parte async for parte in
+                  difusion.StreamASGI.flujo(difusor, suscripcion, recuperados, hasta, completo, config)]
+        difusor.cancelar.assert_called_once_with(suscripcion)
+        return partes
+
+    async def test_flujo_descarta_lo_ya_recuperado(self):
+        canal = difusion.canal_usuario(1)
+        suscripcion = difusion.Suscripcion([canal], 10)
+        mensaje = lambda pk, canales=(canal,): difusion.Mensaje(pk, 'prestamo', canales, {'id': pk})
+        recuperados = [mensaje(4), mensaje(5, (difusion.canal_usuario(2),))]
+        # El lector repartió el 5 mientras se leían los perdidos
+        suscripcion.entregar(mensaje(5))
+        suscripcion.entregar(mensaje(6))
+
+        partes = await self.leer_flujo(suscripcion, recuperados, 5, True)
+
+        self.assertEqual(partes[:4], [
+            'retry: 2000\n\n',
+            mensaje(4).sse(),
+            'id: 5\nevent: conectado\ndata: {"ultimo": 5}\n\n',
+            mensaje(6).sse(),
+        ])
+        self.assertEqual(set(partes[4:]), {': latido\n\n'})
+
+    async def test_flujo_reinicio_y_desborde(self):
+        suscripcion = difusion.Suscripcion([difusion.canal_usuario(1)], 10)
+        suscripcion.desbordada = True
+        partes = await self.leer_flujo(suscripcion, [], 9, False)
+        # Sin los perdidos: el cliente recarga y sigue desde el id actual; desbordada, se cierra
+        self.assertEqual(partes, [
+            'retry: 2000\n\n', 'event: reinicio\ndata: {}\n\n',
+            'id: 9\nevent: conectado\ndata: {"ultimo": 9}\n\n',
+        ])
+
+
+@override_settings(
+    API_DIFUSION={'DURACION_MAXIMA': 0.2, 'LATIDO': 0.05},
+    API_EVENTOS={'INTERVALO_SONDEO': 0.01},
+)
+class StreamReconexionTests(TransactionTestCase):
+    """GET /api/async/stream/ con Last-Event-ID: reenvía lo perdido o pide reiniciar"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=2)
+        crear_usuarios(2)
+        self.usuario, self.otro = Usuario.objects.order_by('id')
+
+    async def conectar(self, consulta, ultimo_evento):
+        scope = {
+            'type': 'http', 'path': '/api/async/stream/', 'method': 'GET',
+            'query_string': consulta.encode(), 'headers': [(b'last-event-id', str(ultimo_evento).encode())],
+        }
+        enviados = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        await difusion.StreamASGI(aplicacion=None)(scope, receive, send)
+        # El lector termina al no quedar suscripciones
+        lector = difusion.obtener_difusor().lector
+        if lector is not None:
+            await lector
+        self.assertEqual(enviados[0]['status'], 200)
+        cuerpo = ''.join(mensaje.get('body', b'').decode() for mensaje in enviados[1:])
+        recibidos = [(int(pk), evento) for pk, evento in re.findall(r'^id: (\d+)\nevent: (\w+)$', cuerpo, re.M)]
+        return recibidos, 'event: reinicio' in cuerpo
+
+    def prestar_y_devolver(self):
+        desde = eventos.ultimo_id()
+        prestamo = services.prestar_libro(self.usuario, self.libro)
+        services.prestar_libro(self.otro, self.libro)
+        services.registrar_devolucion(prestamo)
+        ids = list(Evento.objects.filter(id__gt=desde, usuario=self.usuario.pk).values_list('id', flat=True))
+        return desde, ids, eventos.ultimo_id()
+
+    async def test_reenvia_los_cambios_perdidos_del_canal(self):
+        desde, ids, ultimo = await sync_to_async(self.prestar_y_devolver)()
+
+        recibidos, reinicio = await self.conectar(f'usuario={self.usuario.pk}', desde)
+
+        self.assertFalse(reinicio)
+        # Solo los del usuario (no los del otro ni los de stock), y el id actual
+        self.assertEqual(recibidos, [(pk, 'prestamo') for pk in ids] + [(ultimo, 'conectado')])
+
+    async def test_demasiados_perdidos_pide_reiniciar(self):
+        desde, _, _ = await sync_to_async(self.prestar_y_devolver)()
+        await sync_to_async(Evento.objects.bulk_create)([
+            Evento(tipo='USUARIO_BLOQUEADO', usuario=self.usuario.pk) for _ in range(eventos.LIMITE_MAXIMO)
+        ])
+        ultimo = await sync_to_async(eventos.ultimo_id)()
+
+        recibidos, reinicio = await self.conectar(f'usuario={self.usuario.pk}', desde)
+
+        self.assertTrue(reinicio)
+        self.assertEqual(recibidos, [(ultimo, 'conectado')])
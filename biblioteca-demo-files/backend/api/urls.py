@@ -3,14 +3,25 @@ URLs de la API
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'usuarios', views.UsuarioViewSet)
 router.register(r'libros', views.LibroViewSet)
 router.register(r'prestamos', views.PrestamoViewSet)
 router.register(r'multas', views.MultaViewSet)
+router.register(r'reservas', views.ReservaViewSet)
 
 urlpatterns = [
+    path('_metrics', views.exportar_metricas, name='metricas'),
+    path('estadisticas/', views.resumen_estadisticas, name='estadisticas'),
+    path('eventos/', views.listar_eventos, name='eventos'),
+    # Lecturas async del catálogo y préstamos (servir con biblioteca_api.asgi)
+    path('async/libros/', async_views.LibroLecturaAsyncView.as_view(), name='libro-async-list'),
+    path('async/libros/<str:pk>/', async_views.LibroLecturaAsyncView.as_view(), name='libro-async-detail'),
+    path('async/prestamos/', async_views.PrestamoLecturaAsyncView.as_view(), name='prestamo-async-list'),
+    path('async/prestamos/<int:pk>/', async_views.PrestamoLecturaAsyncView.as_view(), name='prestamo-async-detail'),
+    # Cambios de stock y de préstamos por Server-Sent Events (solo ASGI)
+    path('async/stream/', async_views.stream_cambios, name='stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,76 +1,252 @@
 """
 Vistas de la API - Endpoints REST
 """
+import io
+from datetime import timedelta
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from django.utils import timezone
-from .models import Usuario, Libro, Prestamo, Multa
+from rest_framework.utils.urls import replace_query_param
+from . import anotaciones, archivo, catalogo, estadisticas, eventos, services
+from .cache import CacheLecturaMixin
+from .conditional import ConditionalGetMixin
+from .idempotencia import idempotente
+from .metricas import metricas
+from .pagination import CursorPaginacion
+from .models import Usuario, Libro, Prestamo, Multa, Reserva
 from .serializers import (
     UsuarioSerializer, LibroSerializer, 
-    PrestamoSerializer, PrestamoCreateSerializer, MultaSerializer
+    PrestamoSerializer, PrestamoCreateSerializer, MultaSerializer,
+    PrestamoLoteSerializer, DevolucionLoteSerializer, ReservaSerializer, EventoSerializer
 )
+from .search import get_backend as get_search_backend
+from .serializacion import ListaRapidaMixin, obtener_serializador_rapido
+from .streaming import StreamingListMixin
+
+class CatalogoMixin:
+    """
+    POST {prefijo}/importar/ - Upsert masivo desde un archivo CSV o NDJSON (campo "archivo")
+    GET {prefijo}/exportar/?formato=csv|ndjson - Tabla completa en streaming
+    """
+    catalogo_entidad = None
+
+    def formato_pedido(self, request, nombre=''):
+        formato = request.query_params.get('formato') or catalogo.detectar_formato(nombre)
+        return formato if formato in catalogo.FORMATOS else None
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'error': 'Falta el archivo (campo "archivo")'}, status=status.HTTP_400_BAD_REQUEST)
+        formato = self.formato_pedido(request, archivo.name)
+        if formato is None:
+            return Response({'error': 'Formato no soportado, use csv o ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Archivos grandes quedan en disco (FILE_UPLOAD_MAX_MEMORY_SIZE) y se leen por líneas
+        texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+        try:
+            resultado = catalogo.importar(texto, formato, self.catalogo_entidad)
+        except UnicodeDecodeError:
+            return Response({'error': 'El archivo debe estar en UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado.como_dict())
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        formato = self.formato_pedido(request) or 'csv'
+        response = StreamingHttpResponse(
+            catalogo.exportar(self.catalogo_entidad, formato), content_type=catalogo.FORMATOS[formato]
+        )
+        extension = 'csv' if formato == 'csv' else 'jsonl'
+        response['Content-Disposition'] = f'attachment; filename="{self.catalogo_entidad}.{extension}"'
+        return response
+
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(
+    CatalogoMixin, ConditionalGetMixin, CacheLecturaMixin, StreamingListMixin, ListaRapidaMixin,
+    viewsets.ModelViewSet,
+):
     """
     CRUD completo para Usuarios
-    GET /api/usuarios/ - Listar todos
+    GET /api/usuarios/ - Listar (paginado por cursor)
     POST /api/usuarios/ - Crear nuevo
     GET /api/usuarios/{id}/ - Obtener uno
     PUT /api/usuarios/{id}/ - Actualizar
     DELETE /api/usuarios/{id}/ - Eliminar
+    POST /api/usuarios/importar/ - Importar CSV/NDJSON (upsert por rut)
+    GET /api/usuarios/exportar/ - Exportar
+    GET /api/usuarios/{id}/historial/ - Préstamos vigentes y archivados
     """
     queryset = Usuario.objects.all()
     serializer_class = UsuarioSerializer
+    cursor_ordering = ('id',)
+    cache_espacio = 'usuarios'
+    tablas_version = ('usuario',)
+    cache_acciones = ('retrieve',)
+    catalogo_entidad = 'usuarios'
+    
+    def get_queryset(self):
+        queryset = Usuario.objects.all()
+        if self.action == 'list':
+            # dias_prestamo calculado por la base de datos (ver api.anotaciones)
+            queryset = queryset.annotate(**{anotaciones.PLAZO: anotaciones.dias_prestamo()})
+        return queryset
+    
+    @action(detail=True, methods=['get'])
+    def historial(self, request, pk=None):
+        """
+        Todos los préstamos del usuario (con su multa), de la tabla vigente y
+        del archivo, del más reciente al más antiguo. Solo lectura; se pagina
+        hacia adelante con el link "next" (?cursor=).
+        """
+        usuario = self.get_object()
+        tamano = entero(
+            request.query_params.get('page_size', CursorPaginacion.page_size), 'page_size',
+            1, CursorPaginacion.max_page_size
+        )
+        posicion = None
+        if request.query_params.get('cursor'):
+            posicion = archivo.leer_cursor(request.query_params['cursor'])
+            if posicion is None:
+                raise NotFound('Cursor inválido')
+
+        filas, siguiente = archivo.historial(usuario.pk, posicion, tamano)
+        if siguiente is not None:
+            siguiente = replace_query_param(
+                request.build_absolute_uri(), 'cursor', archivo.codificar_cursor(siguiente)
+            )
+        return Response({'next': siguiente, 'results': filas})
 
 
-class LibroViewSet(viewsets.ModelViewSet):
+class LibroViewSet(
+    CatalogoMixin, ConditionalGetMixin, CacheLecturaMixin, StreamingListMixin, ListaRapidaMixin,
+    viewsets.ModelViewSet,
+):
     """
     CRUD completo para Libros
-    GET /api/libros/ - Listar todos
-    GET /api/libros/?search=python - Buscar por título/autor
+    GET /api/libros/ - Listar (paginado por cursor)
+    GET /api/libros/?search=python - Buscar por título/autor/editorial/isbn (por relevancia);
+        "truncado": true si hubo más coincidencias que el tope
     POST /api/libros/ - Crear nuevo
+    POST /api/libros/importar/ - Importar CSV/NDJSON (upsert por isbn)
+    GET /api/libros/exportar/ - Exportar
     """
     queryset = Libro.objects.all()
     serializer_class = LibroSerializer
+    cursor_ordering = ('isbn',)
+    cache_espacio = 'libros'
+    tablas_version = ('libro',)
+    catalogo_entidad = 'libros'
+    
+    def get_search(self):
+        search = self.request.query_params.get('search', '').strip()
+        return search if self.action == 'list' else ''
+    
+    def get_cursor_ordering(self):
+        if self.get_search():
+            return get_search_backend(self.queryset.db).ordering
+        return self.cursor_ordering
     
     def get_queryset(self):
         queryset = Libro.objects.all()
-        search = self.request.query_params.get('search', None)
+        search = self.get_search()
         if search:
-            queryset = queryset.filter(titulo__icontains=search) | queryset.filter(autor__icontains=search)
+            self.busqueda = get_search_backend(queryset.db)
+            queryset = self.busqueda.buscar(queryset, search)
         return queryset
+    
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.get_search():
+            # La búsqueda tiene un tope de coincidencias (api.search.max_resultados)
+            response.data['truncado'] = self.busqueda.truncado
+        return response
 
 
-class PrestamoViewSet(viewsets.ModelViewSet):
+class PrestamoViewSet(ConditionalGetMixin, StreamingListMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     CRUD para Préstamos con acciones especiales
+    GET /api/prestamos/?vencidos=true - Sin devolver y con la fecha esperada vencida
+    GET /api/prestamos/?min_retraso=5 - Con 5 o más días de retraso (incluye devueltos tarde)
+    GET /api/prestamos/?ordering=-dias_retraso - Los más atrasados primero
     """
-    queryset = Prestamo.objects.all()
+    # usuario, libro y multa se leen en PrestamoSerializer: un solo JOIN evita N+1
+    queryset = Prestamo.objects.select_related('usuario', 'libro', 'multa')
+    cursor_ordering = ('-fecha_prestamo', '-id')
+    tablas_version = ('prestamo', 'usuario', 'libro', 'multa')
+    # dias_retraso, ?vencidos= y ?min_retraso= cambian con el día
+    depende_de_hoy = True
+    # ?ordering= -> orden del cursor, sobre la anotación de api.anotaciones
+    ordenes = {
+        'dias_retraso': (anotaciones.RETRASO, 'id'),
+        '-dias_retraso': ('-' + anotaciones.RETRASO, '-id'),
+    }
+    # Consultas por acción con Idempotency-Key, en el peor camino (devolución con multa);
+    # el resto usa API_PRESUPUESTO_CONSULTAS. Ver ContadorConsultasMiddleware (una vez cada
+    # PURGA_CADA claves se suma la purga de api.idempotencia y puede advertir)
+    presupuesto_consultas = {'create': 16, 'renovar': 8, 'devolver': 16, 'bulk': 14, 'bulk_devolver': 16}
+    
+    def get_cursor_ordering(self):
+        orden = self.request.query_params.get('ordering')
+        if not orden:
+            return self.cursor_ordering
+        if orden not in self.ordenes:
+            raise ValidationError({'ordering': f'Valores válidos: {", ".join(self.ordenes)}'})
+        return self.ordenes[orden]
+    
+    def get_queryset(self):
+        queryset = self.queryset.all()
+        if self.action != 'list':
+            return queryset
+        # dias_retraso en la base de datos: se puede filtrar y ordenar por él
+        hoy = anotaciones.hoy()
+        queryset = queryset.annotate(**{anotaciones.RETRASO: anotaciones.dias_retraso(hoy)})
+        parametros = self.request.query_params
+        vencidos = parametros.get('vencidos')
+        if vencidos in ('true', '1'):
+            queryset = queryset.filter(anotaciones.vencidos(hoy))
+        elif vencidos in ('false', '0'):
+            queryset = queryset.exclude(anotaciones.vencidos(hoy))
+        elif vencidos is not None:
+            raise ValidationError({'vencidos': 'Debe ser true o false'})
+        if parametros.get('min_retraso'):
+            minimo = entero(parametros['min_retraso'], 'min_retraso')
+            queryset = queryset.filter(**{f'{anotaciones.RETRASO}__gte': minimo})
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
             return PrestamoCreateSerializer
         return PrestamoSerializer
     
+    def perform_destroy(self, instance):
+        services.eliminar_prestamo(instance)
+    
+    @idempotente
     def create(self, request, *args, **kwargs):
         """Crear préstamo y actualizar stock"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Obtener libro y reducir stock
-        libro = serializer.validated_data['libro']
-        libro.stock_disponible -= 1
-        libro.save()
-        
-        # Crear préstamo
-        self.perform_create(serializer)
+        # Reducir stock y crear préstamo en una sola transacción
+        try:
+            prestamo = services.prestar_libro(
+                serializer.validated_data['usuario'], serializer.validated_data['libro']
+            )
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Retornar con datos completos
-        prestamo = Prestamo.objects.get(pk=serializer.instance.pk)
+        prestamo = self.get_queryset().get(pk=prestamo.pk)
         return Response(PrestamoSerializer(prestamo).data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
+    @idempotente
     def renovar(self, request, pk=None):
         """
         POST /api/prestamos/{id}/renovar/
@@ -78,27 +254,15 @@ class PrestamoViewSet(viewsets.ModelViewSet):
         """
         prestamo = self.get_object()
         
-        if prestamo.renovado:
-            return Response(
-                {'error': 'Este préstamo ya fue renovado una vez'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if prestamo.estado != 'ACTIVO':
-            return Response(
-                {'error': 'Solo se pueden renovar préstamos activos'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Extender fecha de devolución
-        from datetime import timedelta
-        prestamo.fecha_devolucion_esperada += timedelta(days=prestamo.usuario.dias_prestamo)
-        prestamo.renovado = True
-        prestamo.save()
+        try:
+            services.renovar_prestamo(prestamo)
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(PrestamoSerializer(prestamo).data)
     
     @action(detail=True, methods=['post'])
+    @idempotente
     def devolver(self, request, pk=None):
         """
         POST /api/prestamos/{id}/devolver/
@@ -106,71 +270,99 @@ class PrestamoViewSet(viewsets.ModelViewSet):
         """
         prestamo = self.get_object()
         
-        if prestamo.estado == 'DEVUELTO':
-            return Response(
-                {'error': 'Este préstamo ya fue devuelto'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        try:
+            services.registrar_devolucion(prestamo)
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        hoy = timezone.now().date()
-        prestamo.fecha_devolucion_real = hoy
-        prestamo.estado = 'DEVUELTO'
+        return Response(PrestamoSerializer(prestamo).data)
+    
+    def respuesta_lote(self, prestamos, errores):
+        """Resultado por ítem, en el orden en que llegaron"""
+        completos = self.get_queryset().in_bulk([p.pk for p in prestamos])
+        resultados = [
+            {'indice': p.indice, 'ok': True, 'prestamo': PrestamoSerializer(completos[p.pk]).data}
+            for p in prestamos
+        ]
+        resultados += [
+            {'indice': indice, 'ok': False, 'error': error}
+            for indice, error in errores.items()
+        ]
+        resultados.sort(key=lambda r: r['indice'])
+        return Response({
+            'procesados': len(prestamos),
+            'errores': len(errores),
+            'resultados': resultados,
+        })
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        POST /api/prestamos/bulk/
+        {"prestamos": [{"usuario": 1, "libro": "978..."}, ...]}
+        Crea todos los préstamos válidos en una transacción
+        """
+        serializer = PrestamoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Restaurar stock del libro
-        prestamo.libro.stock_disponible += 1
-        prestamo.libro.save()
+        try:
+            prestamos, errores = services.prestar_en_lote(serializer.validated_data['prestamos'])
+        except services.ConflictoConcurrente as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         
-        # Verificar si hay retraso y generar multa
-        if hoy > prestamo.fecha_devolucion_esperada:
-            dias_retraso = (hoy - prestamo.fecha_devolucion_esperada).days
-            Multa.objects.create(
-                prestamo=prestamo,
-                dias_retraso=dias_retraso
-            )
-            # Bloquear usuario
-            prestamo.usuario.bloqueado = True
-            prestamo.usuario.save()
+        return self.respuesta_lote(prestamos, errores)
+    
+    @action(detail=False, methods=['post'], url_path='bulk-devolver')
+    def bulk_devolver(self, request):
+        """
+        POST /api/prestamos/bulk-devolver/
+        {"prestamos": [1, 2, 3]}
+        Registra todas las devoluciones válidas en una transacción
+        """
+        serializer = DevolucionLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        prestamo.save()
+        try:
+            prestamos, errores = services.devolver_en_lote(serializer.validated_data['prestamos'])
+        except services.ConflictoConcurrente as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         
-        return Response(PrestamoSerializer(prestamo).data)
+        return self.respuesta_lote(prestamos, errores)
 
 
-class MultaViewSet(viewsets.ModelViewSet):
+class MultaViewSet(ConditionalGetMixin, StreamingListMixin, ListaRapidaMixin, viewsets.ModelViewSet):
     """
     CRUD para Multas
     """
     queryset = Multa.objects.all()
     serializer_class = MultaSerializer
+    cursor_ordering = ('-id',)
+    tablas_version = ('multa',)
+    presupuesto_consultas = {'pagar': 12}
+    
+    def get_queryset(self):
+        queryset = Multa.objects.all()
+        if self.action in ('pagar', 'eliminar', 'destroy'):
+            # Estas acciones actualizan los contadores del usuario del préstamo
+            queryset = queryset.select_related('prestamo')
+        return queryset
+    
+    def perform_destroy(self, instance):
+        services.eliminar_multa(instance)
     
     @action(detail=True, methods=['post'])
+    @idempotente
     def pagar(self, request, pk=None):
         """
         POST /api/multas/{id}/pagar/
-        Registra el pago de una multa
+        Registra el pago de una multa y desbloquea al usuario si no le quedan pendientes
         """
         multa = self.get_object()
         
-        if multa.pagada:
-            return Response(
-                {'error': 'Esta multa ya fue pagada'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        multa.pagada = True
-        multa.fecha_pago = timezone.now()
-        multa.save()
-        
-        # Verificar si el usuario tiene otras multas pendientes
-        usuario = multa.prestamo.usuario
-        multas_pendientes = Multa.objects.filter(
-            prestamo__usuario=usuario,
-            pagada=False
-        ).count()
-        
-        if multas_pendientes == 0:
-            usuario.bloqueado = False
-            usuario.save()
+        try:
+            services.pagar_multa(multa)
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(MultaSerializer(multa).data)
     
@@ -181,17 +373,130 @@ class MultaViewSet(viewsets.ModelViewSet):
         Elimina una multa (para demo)
         """
         multa = self.get_object()
-        usuario = multa.prestamo.usuario
-        multa.delete()
+        services.eliminar_multa(multa)
         
-        # Verificar si desbloquear usuario
-        multas_pendientes = Multa.objects.filter(
-            prestamo__usuario=usuario,
-            pagada=False
-        ).count()
+        return Response({'message': 'Multa eliminada correctamente'})
+
+
+class ReservaViewSet(ConditionalGetMixin, StreamingListMixin, ListaRapidaMixin, viewsets.ModelViewSet):
+    """
+    Cola de espera por libros sin stock
+    GET /api/reservas/?usuario=1&libro=978...&estado=EN_ESPERA - Listar (en orden de llegada)
+    POST /api/reservas/ - Reservar {"usuario": 1, "libro": "978..."}
+    POST /api/reservas/{id}/cancelar/ - Cancelar
+    Al devolverse un ejemplar queda apartado para la reserva más antigua (estado
+    DISPONIBLE) hasta fecha_limite_retiro; el préstamo se pide en POST /api/prestamos/.
+    """
+    queryset = Reserva.objects.all()
+    serializer_class = ReservaSerializer
+    cursor_ordering = ('id',)
+    tablas_version = ('reserva',)
+    http_method_names = ['get', 'post', 'head', 'options']
+    
+    def get_queryset(self):
+        queryset = Reserva.objects.all()
+        parametros = self.request.query_params
+        if parametros.get('usuario'):
+            if not parametros['usuario'].isdigit():
+                raise ValidationError({'usuario': 'Debe ser un id numérico'})
+            queryset = queryset.filter(usuario=parametros['usuario'])
+        if parametros.get('libro'):
+            queryset = queryset.filter(libro=parametros['libro'])
+        if parametros.get('estado'):
+            queryset = queryset.filter(estado=parametros['estado'])
+        return queryset
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        if multas_pendientes == 0:
-            usuario.bloqueado = False
-            usuario.save()
+        try:
+            reserva = services.reservar_libro(
+                serializer.validated_data['usuario'], serializer.validated_data['libro']
+            )
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({'message': 'Multa eliminada correctamente'})
\ No newline at end of file
+        return Response(ReservaSerializer(reserva).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        """
+        POST /api/reservas/{id}/cancelar/
+        Si el ejemplar ya estaba apartado, pasa al siguiente de la cola
+        """
+        reserva = self.get_object()
+        
+        try:
+            services.cancelar_reserva(reserva)
+        except services.OperacionInvalida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(ReservaSerializer(reserva).data)
+
+
+@api_view(['GET'])
+def resumen_estadisticas(request):
+    """
+    GET /api/estadisticas/?desde=2025-01-01&hasta=2025-01-31
+    Totales actuales y préstamos del período (por defecto los últimos 30 días)
+    """
+    try:
+        hasta = parse_date(request.query_params.get('hasta') or timezone.localdate().isoformat())
+        desde = parse_date(request.query_params.get('desde') or (hasta - timedelta(days=29)).isoformat())
+    except (TypeError, ValueError):
+        desde = hasta = None
+    if desde is None or hasta is None:
+        return Response({'error': 'Fechas inválidas, use el formato AAAA-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    if desde > hasta:
+        return Response({'error': 'desde debe ser anterior a hasta'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(estadisticas.resumen(desde, hasta))
+
+
+def entero(texto, nombre, minimo=0, maximo=None):
+    """Parámetro entero de la query string; ValidationError (400) si no lo es"""
+    try:
+        valor = int(texto)
+    except (TypeError, ValueError):
+        raise ValidationError({nombre: 'Debe ser un número entero'})
+    if valor < minimo:
+        raise ValidationError({nombre: f'Debe ser mayor o igual a {minimo}'})
+    if maximo is not None and valor > maximo:
+        raise ValidationError({nombre: f'Debe ser menor o igual a {maximo}'})
+    return valor
+
+
+@api_view(['GET'])
+def listar_eventos(request):
+    """
+    GET /api/eventos/?since=120&limit=100&wait=25&tipo=PRESTAMO_CREADO,MULTA_PAGADA&usuario=1
+    Eventos con id > since en orden. Con wait (segundos), si no hay eventos
+    nuevos la respuesta espera hasta que lleguen (long-poll). El consumidor
+    guarda "ultimo" y lo envía como since en el siguiente request.
+    """
+    parametros = request.query_params
+    espera_maxima, _ = eventos.configuracion()
+    desde = entero(parametros.get('since', 0), 'since')
+    limite = entero(parametros.get('limit', 100), 'limit', 1, eventos.LIMITE_MAXIMO)
+    espera = entero(parametros.get('wait', 0), 'wait', 0, espera_maxima)
+    tipos = [tipo for tipo in parametros.get('tipo', '').split(',') if tipo]
+    if set(tipos) - eventos.TIPOS:
+        raise ValidationError({'tipo': f'Tipos válidos: {", ".join(sorted(eventos.TIPOS))}'})
+    usuario = entero(parametros['usuario'], 'usuario') if parametros.get('usuario') else None
+
+    ultimo, filas = eventos.esperar(desde, limite, espera, tipos, usuario)
+    response = Response({
+        'ultimo': ultimo,
+        'eventos': obtener_serializador_rapido(EventoSerializer).serializar(filas),
+    })
+    # Los sondeos de la espera no cuentan para el presupuesto de consultas
+    response.sin_presupuesto = espera > 0
+    return response
+
+
+def exportar_metricas(request):
+    """
+    GET /api/_metrics
+    Histogramas de tiempos por vista y estadísticas del caché (formato Prometheus)
+    """
+    return HttpResponse(metricas.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,16 @@
+"""
+ASGI config for biblioteca_api project.
+Las vistas de /api/async/ no ocupan un hilo mientras esperan a la base de datos.
+/api/async/stream/ (Server-Sent Events) se atiende antes del handler de Django.
+Ejecutar: uvicorn biblioteca_api.asgi:application
+"""
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca_api.settings')
+application = get_asgi_application()
+
+# Después de get_asgi_application(): necesita las apps cargadas
+from api.difusion import StreamASGI  # noqa: E402
+
+application = StreamASGI(application)
@@ -3,8 +3,12 @@ Django settings for biblioteca_api project.
 Configuración para demo de Sistema de Gestión de Biblioteca
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'demo-secret-key-cambiar-en-produccion'
@@ -30,6 +34,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # IMPORTANTE: debe ir primero
+    'api.middleware.CompresionMiddleware',  # antes de todo lo que lea el cuerpo de la respuesta
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +43,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ContadorConsultasMiddleware',
+    'api.middleware.PerfilamientoMiddleware',
 ]
 
 ROOT_URLCONF = 'biblioteca_api.urls'
@@ -58,13 +66,50 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'biblioteca_api.wsgi.application'
-
-# Base de datos SQLite (simple para demo)
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+ASGI_APPLICATION = 'biblioteca_api.asgi.application'
+
+# Base de datos: SQLite por defecto; PostgreSQL con DB_ENGINE=postgresql
+# (requiere `pip install "psycopg[binary]"`). Ver README, "Base de datos".
+if os.environ.get('DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'biblioteca'),
+            'USER': os.environ.get('DB_USER', 'biblioteca'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Conexiones persistentes: se reutilizan entre requests del mismo hilo
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Con PgBouncer en modo transacción no hay cursores del servidor
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER') == '1',
+        }
+    }
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {**DATABASES['default'], 'HOST': os.environ['DB_REPLICA_HOST']}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # En archivo y no en memoria: los tests de concurrencia escriben desde varios hilos
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
+    # Otro archivo SQLite como réplica de prueba (migrar con --database replica)
+    if os.environ.get('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {**DATABASES['default'], 'NAME': os.environ['DB_REPLICA_NAME']}
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# PRAGMAs para cada conexión SQLite nueva
+API_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # ms
 }
 
 AUTH_PASSWORD_VALIDATORS = []  # Desactivado para demo
@@ -82,8 +127,109 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Sin auth para demo
-    ]
+    ],
+    # Paginación por cursor (keyset); ?stream=ndjson para listados completos
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CursorPaginacion',
+    'PAGE_SIZE': 50,
+    # JSON compacto (orjson si está instalado, mismos bytes que JSONRenderer),
+    # MessagePack si está instalado y la API navegable solo con DEBUG
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.JSONRapidoRenderer',
+        *(['api.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
+}
+
+# Compresión de respuestas (br si está instalado brotli, si no gzip) para los
+# tipos de TIPOS desde MIN_BYTES; text/event-stream nunca se comprime
+API_COMPRESION = {
+    'ACTIVO': True,
+    'MIN_BYTES': 1024,
+    'NIVEL_GZIP': 6,
+    'NIVEL_BROTLI': 4,
+}
+
+# Búsqueda de libros: None = FTS5 en SQLite, búsqueda básica (LIKE) en otros motores
+API_BUSQUEDA_BACKEND = None
+# Máximo de coincidencias por búsqueda FTS5 ("truncado": true si hubo más)
+API_BUSQUEDA_MAX_RESULTADOS = 200
+
+# Caché de lectura de libros (listado/detalle) y usuarios (detalle)
+# BACKEND 'lru': memoria del proceso. Cada worker (gunicorn, uvicorn --workers)
+# tiene su propia copia y una escritura solo invalida la del proceso que la hizo:
+# los demás pueden servir datos viejos hasta el TTL. Con varios procesos usar
+# 'django', que guarda entradas y generaciones en CACHES[ALIAS] compartido.
+# Con REDIS_URL (requiere `pip install redis`) ese es el valor por defecto.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+API_CACHE = {
+    'BACKEND': os.environ.get('API_CACHE_BACKEND', 'django' if os.environ.get('REDIS_URL') else 'lru'),
+    'ALIAS': 'default',
+    'TTL': 60,
+    'MAX_ENTRADAS': 2048,
+}
+
+# Instrumentación de consultas: headers X-Query-Count / X-DB-Time
+API_INSTRUMENTACION_CONSULTAS = DEBUG
+# Advertencia en el log si un request excede este presupuesto. Es el de las lecturas
+# y el CRUD simple; las escrituras de circulación (cambios, versiones de tabla,
+# rollups y eventos) declaran el suyo por acción en `presupuesto_consultas`
+API_PRESUPUESTO_CONSULTAS = 6
+
+# Reservas: días para retirar un ejemplar apartado (luego expira, ver expirar_reservas)
+API_RESERVAS = {
+    'DIAS_RETIRO': 3,
+}
+
+# Registro de eventos (GET /api/eventos/): espera máxima del long-poll (?wait=)
+# y cada cuántos segundos se consulta si llegaron eventos durante la espera
+API_EVENTOS = {
+    'ESPERA_MAXIMA': 30,
+    'INTERVALO_SONDEO': 0.5,
+}
+
+# Archivo (archivar_historial): préstamos devueltos y multas pagadas hace más
+# de DIAS días pasan a las tablas de archivo; siguen en /api/usuarios/{id}/historial/
+API_ARCHIVO = {
+    'DIAS': 365,
+}
+
+# Stream de cambios (GET /api/async/stream/, solo ASGI): conexiones por
+# proceso, mensajes pendientes por cliente antes de cortarlo, segundos entre
+# keep-alive y duración máxima de una conexión (luego reconecta)
+API_DIFUSION = {
+    'MAX_CONEXIONES': 10000,
+    'COLA': 100,
+    'LATIDO': 15,
+    'DURACION_MAXIMA': 300,
+    'MAX_LIBROS': 100,
+}
+
+# Idempotency-Key en POST de préstamos, renovación, devolución y pago de
+# multas: segundos que se recuerda cada clave y máximo de claves guardadas
+API_IDEMPOTENCIA = {
+    'TTL': 86400,
+    'MAX_CLAVES': 100000,
+    'PURGA_CADA': 500,
+}
+
+# Perfilamiento por request: header Server-Timing, histogramas en /api/_metrics
+# y perfiles cProfile de los requests lentos (una muestra) en DIRECTORIO
+API_PERFILAMIENTO = {
+    'ACTIVO': False,
+    'UMBRAL_LENTO_MS': 500,
+    'MUESTREO': 0.05,
+    'DIRECTORIO': BASE_DIR / 'perfiles',
 }
 
 # Permitir CORS (conexión con React)
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = [*default_headers, 'idempotency-key']
+CORS_EXPOSE_HEADERS = [
+    'X-Query-Count', 'X-DB-Time', 'X-Cache', 'ETag', 'Last-Modified', 'Server-Timing', 'Idempotent-Replayed',
+]
\ No newline at end of file
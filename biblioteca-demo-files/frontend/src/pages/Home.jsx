@@ -4,7 +4,7 @@ import BookIcon from '@mui/icons-material/Book';
 import SwapHorizIcon from '@mui/icons-material/SwapHoriz';
 import WarningIcon from '@mui/icons-material/Warning';
 import { useState, useEffect } from 'react';
-import { usuarioService, libroService, prestamoService, multaService } from '../services/api';
+import { estadisticaService } from '../services/api';
 
 function Home() {
   const [stats, setStats] = useState({
@@ -17,17 +17,13 @@ function Home() {
   useEffect(() => {
     const fetchStats = async () => {
       try {
-        const [usuarios, libros, prestamos, multas] = await Promise.all([
-          usuarioService.getAll(),
-          libroService.getAll(),
-          prestamoService.getAll(),
-          multaService.getAll()
-        ]);
+        // Totales pre-agregados en el backend: no se descargan los listados
+        const { data } = await estadisticaService.get();
         setStats({
-          usuarios: usuarios.data.length,
-          libros: libros.data.length,
-          prestamos: prestamos.data.filter(p => p.estado === 'ACTIVO').length,
-          multas: multas.data.filter(m => !m.pagada).length
+          usuarios: data.usuarios,
+          libros: data.libros,
+          prestamos: data.prestamos.activos,
+          multas: data.multas.pendientes
         });
       } catch (error) {
         console.error('Error cargando estadísticas:', error);
@@ -13,6 +13,7 @@ import { libroService } from '../services/api';
 
 function Libros() {
   const [libros, setLibros] = useState([]);
+  const [next, setNext] = useState(null);
   const [search, setSearch] = useState('');
   const [open, setOpen] = useState(false);
   const [editMode, setEditMode] = useState(false);
@@ -22,12 +23,17 @@ function Libros() {
     anio_publicacion: 2024, categoria: 'GENERAL', stock_total: 1, stock_disponible: 1
   });
 
-  const fetchLibros = async () => {
+  // Sin cursor: primera página (al cargar, al buscar o tras un cambio); con cursor se agrega la siguiente
+  const fetchLibros = async (cursor = null) => {
     try {
-      const response = search 
-        ? await libroService.search(search)
-        : await libroService.getAll();
-      setLibros(response.data);
+      const response = search
+        ? await libroService.search(search, cursor)
+        : await libroService.getAll(cursor);
+      setLibros((previos) => (cursor ? [...previos, ...response.data] : response.data));
+      setNext(response.next);
+      if (response.truncado && !response.next) {
+        showSnackbar('La búsqueda tiene más coincidencias que las mostradas; refine la búsqueda', 'info');
+      }
     } catch (error) {
       showSnackbar('Error al cargar libros', 'error');
     }
@@ -132,6 +138,9 @@ function Libros() {
           </TableBody>
         </Table>
       </TableContainer>
+      {next && (
+        <Button onClick={() => fetchLibros(next)} sx={{ mt: 2 }}>Cargar más</Button>
+      )}
 
       <Dialog open={open} onClose={() => setOpen(false)} maxWidth="sm" fullWidth>
         <DialogTitle>{editMode ? 'Editar Libro' : 'Nuevo Libro'}</DialogTitle>
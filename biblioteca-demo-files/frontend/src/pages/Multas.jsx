@@ -9,12 +9,15 @@ import { multaService } from '../services/api';
 
 function Multas() {
   const [multas, setMultas] = useState([]);
+  const [next, setNext] = useState(null);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
 
-  const fetchMultas = async () => {
+  // Sin cursor: primera página (al cargar o tras un cambio); con cursor se agrega la siguiente
+  const fetchMultas = async (cursor = null) => {
     try {
-      const response = await multaService.getAll();
-      setMultas(response.data);
+      const response = await multaService.getAll(cursor);
+      setMultas((previas) => (cursor ? [...previas, ...response.data] : response.data));
+      setNext(response.next);
     } catch (error) {
       showSnackbar('Error al cargar multas', 'error');
     }
@@ -119,6 +122,9 @@ function Multas() {
           </TableBody>
         </Table>
       </TableContainer>
+      {next && (
+        <Button onClick={() => fetchMultas(next)} sx={{ mt: 2 }}>Cargar más</Button>
+      )}
 
       <Snackbar open={snackbar.open} autoHideDuration={3000} onClose={() => setSnackbar({...snackbar, open: false})}>
         <Alert severity={snackbar.severity}>{snackbar.message}</Alert>
@@ -13,27 +13,53 @@ import { prestamoService, usuarioService, libroService } from '../services/api';
 
 function Prestamos() {
   const [prestamos, setPrestamos] = useState([]);
+  const [next, setNext] = useState(null);
   const [usuarios, setUsuarios] = useState([]);
+  const [usuariosNext, setUsuariosNext] = useState(null);
   const [libros, setLibros] = useState([]);
+  const [librosNext, setLibrosNext] = useState(null);
   const [open, setOpen] = useState(false);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
   const [formData, setFormData] = useState({ usuario: '', libro: '' });
 
-  const fetchData = async () => {
+  // Sin cursor: primera página (al cargar o tras un cambio); con cursor se agrega la siguiente
+  const fetchData = async (cursor = null) => {
     try {
-      const [prestamosRes, usuariosRes, librosRes] = await Promise.all([
-        prestamoService.getAll(),
-        usuarioService.getAll(),
-        libroService.getAll()
-      ]);
-      setPrestamos(prestamosRes.data);
-      setUsuarios(usuariosRes.data);
-      setLibros(librosRes.data);
+      const response = await prestamoService.getAll(cursor);
+      setPrestamos((previos) => (cursor ? [...previos, ...response.data] : response.data));
+      setNext(response.next);
     } catch (error) {
       showSnackbar('Error al cargar datos', 'error');
     }
   };
 
+  // Opciones del formulario: se piden al abrir el diálogo, una página a la vez
+  const fetchUsuarios = async (cursor = null) => {
+    try {
+      const response = await usuarioService.getOpciones(cursor);
+      setUsuarios((previos) => (cursor ? [...previos, ...response.data] : response.data));
+      setUsuariosNext(response.next);
+    } catch (error) {
+      showSnackbar('Error al cargar usuarios', 'error');
+    }
+  };
+
+  const fetchLibros = async (cursor = null) => {
+    try {
+      const response = await libroService.getOpciones(cursor);
+      setLibros((previos) => (cursor ? [...previos, ...response.data] : response.data));
+      setLibrosNext(response.next);
+    } catch (error) {
+      showSnackbar('Error al cargar libros', 'error');
+    }
+  };
+
+  const handleOpen = () => {
+    setOpen(true);
+    fetchUsuarios();
+    fetchLibros();
+  };
+
   useEffect(() => { fetchData(); }, []);
 
   const showSnackbar = (message, severity = 'success') => {
@@ -101,7 +127,7 @@ function Prestamos() {
     <Container maxWidth="lg" sx={{ mt: 4 }}>
       <Typography variant="h4" gutterBottom>Gestión de Préstamos</Typography>
       
-      <Button variant="contained" startIcon={<AddIcon />} onClick={() => setOpen(true)} sx={{ mb: 2 }}>
+      <Button variant="contained" startIcon={<AddIcon />} onClick={handleOpen} sx={{ mb: 2 }}>
         Nuevo Préstamo
       </Button>
 
@@ -156,6 +182,9 @@ function Prestamos() {
           </TableBody>
         </Table>
       </TableContainer>
+      {next && (
+        <Button onClick={() => fetchData(next)} sx={{ mt: 2 }}>Cargar más</Button>
+      )}
 
       <Dialog open={open} onClose={() => setOpen(false)} maxWidth="sm" fullWidth>
         <DialogTitle>Nuevo Préstamo</DialogTitle>
@@ -169,6 +198,9 @@ function Prestamos() {
               ))}
             </Select>
           </FormControl>
+          {usuariosNext && (
+            <Button size="small" onClick={() => fetchUsuarios(usuariosNext)}>Más usuarios</Button>
+          )}
           <FormControl fullWidth margin="normal">
             <InputLabel>Libro</InputLabel>
             <Select value={formData.libro} label="Libro"
@@ -178,6 +210,9 @@ function Prestamos() {
               ))}
             </Select>
           </FormControl>
+          {librosNext && (
+            <Button size="small" onClick={() => fetchLibros(librosNext)}>Más libros</Button>
+          )}
         </DialogContent>
         <DialogActions>
           <Button onClick={() => setOpen(false)}>Cancelar</Button>
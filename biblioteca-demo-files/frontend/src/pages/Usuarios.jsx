@@ -12,6 +12,7 @@ import { usuarioService } from '../services/api';
 
 function Usuarios() {
   const [usuarios, setUsuarios] = useState([]);
+  const [next, setNext] = useState(null);
   const [open, setOpen] = useState(false);
   const [editMode, setEditMode] = useState(false);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
@@ -24,10 +25,12 @@ function Usuarios() {
     tipo_usuario: 'ESTUDIANTE'
   });
 
-  const fetchUsuarios = async () => {
+  // Sin cursor: primera página (al cargar o tras un cambio); con cursor se agrega la siguiente
+  const fetchUsuarios = async (cursor = null) => {
     try {
-      const response = await usuarioService.getAll();
-      setUsuarios(response.data);
+      const response = await usuarioService.getAll(cursor);
+      setUsuarios((previos) => (cursor ? [...previos, ...response.data] : response.data));
+      setNext(response.next);
     } catch (error) {
       showSnackbar('Error al cargar usuarios', 'error');
     }
@@ -138,6 +141,9 @@ function Usuarios() {
           </TableBody>
         </Table>
       </TableContainer>
+      {next && (
+        <Button onClick={() => fetchUsuarios(next)} sx={{ mt: 2 }}>Cargar más</Button>
+      )}
 
       {/* Dialog para crear/editar */}
       <Dialog open={open} onClose={handleClose} maxWidth="sm" fullWidth>
@@ -12,9 +12,39 @@ const api = axios.create({
   },
 });
 
+// Los listados vienen paginados por cursor: cada llamada trae una página y la
+// vista pide la siguiente (`next`, la URL que devolvió el backend) solo cuando
+// la necesita, sin cargar la colección completa.
+// `truncado`: la búsqueda de libros tuvo más coincidencias que su tope
+const getPage = async (url, next) => {
+  const response = await api.get(next || url);
+  return {
+    data: response.data.results,
+    next: response.data.next,
+    truncado: Boolean(response.data.truncado),
+  };
+};
+
+// POST con Idempotency-Key: la misma clave en cada reintento (sin respuesta
+// del servidor o 502/503/504 de un proxy), así el backend no repite la operación
+const postIdempotente = async (url, data, intentos = 3) => {
+  const config = { headers: { 'Idempotency-Key': crypto.randomUUID() } };
+  for (let intento = 1; ; intento++) {
+    try {
+      return await api.post(url, data, config);
+    } catch (error) {
+      const status = error.response?.status;
+      const reintentable = !error.response || status === 502 || status === 503 || status === 504;
+      if (!reintentable || intento >= intentos) throw error;
+    }
+  }
+};
+
 // Servicios de Usuario
 export const usuarioService = {
-  getAll: () => api.get('/usuarios/'),
+  getAll: (next) => getPage('/usuarios/', next),
+  // Solo los campos del selector de préstamos
+  getOpciones: (next) => getPage('/usuarios/?fields=id,nombre,rut,tipo_usuario,bloqueado', next),
   getById: (id) => api.get(`/usuarios/${id}/`),
   create: (data) => api.post('/usuarios/', data),
   update: (id, data) => api.put(`/usuarios/${id}/`, data),
@@ -23,8 +53,9 @@ export const usuarioService = {
 
 // Servicios de Libro
 export const libroService = {
-  getAll: () => api.get('/libros/'),
-  search: (query) => api.get(`/libros/?search=${query}`),
+  getAll: (next) => getPage('/libros/', next),
+  getOpciones: (next) => getPage('/libros/?fields=isbn,titulo,stock_disponible', next),
+  search: (query, next) => getPage(`/libros/?search=${encodeURIComponent(query)}`, next),
   getById: (isbn) => api.get(`/libros/${isbn}/`),
   create: (data) => api.post('/libros/', data),
   update: (isbn, data) => api.put(`/libros/${isbn}/`, data),
@@ -33,20 +64,25 @@ export const libroService = {
 
 // Servicios de Préstamo
 export const prestamoService = {
-  getAll: () => api.get('/prestamos/'),
+  getAll: (next) => getPage('/prestamos/', next),
   getById: (id) => api.get(`/prestamos/${id}/`),
-  create: (data) => api.post('/prestamos/', data),
-  renovar: (id) => api.post(`/prestamos/${id}/renovar/`),
-  devolver: (id) => api.post(`/prestamos/${id}/devolver/`),
+  create: (data) => postIdempotente('/prestamos/', data),
+  renovar: (id) => postIdempotente(`/prestamos/${id}/renovar/`),
+  devolver: (id) => postIdempotente(`/prestamos/${id}/devolver/`),
   delete: (id) => api.delete(`/prestamos/${id}/`),
 };
 
 // Servicios de Multa
 export const multaService = {
-  getAll: () => api.get('/multas/'),
+  getAll: (next) => getPage('/multas/', next),
   getById: (id) => api.get(`/multas/${id}/`),
-  pagar: (id) => api.post(`/multas/${id}/pagar/`),
+  pagar: (id) => postIdempotente(`/multas/${id}/pagar/`),
   delete: (id) => api.delete(`/multas/${id}/`),
 };
 
+// Estadísticas del dashboard
+export const estadisticaService = {
+  get: (params) => api.get('/estadisticas/', { params }),
+};
+
 export default api;